@@ -0,0 +1,61 @@
+"""
+Benchmark the route resolution of `pillars.transports.http.Router`.
+
+The router of aiohttp and the pillars one are loaded with the same static and
+dynamic routes, then resolve the last registered routes of each kind.
+
+    $ python benchmarks/http_routes.py --routes 500
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp.web
+from aiohttp.test_utils import make_mocked_request
+import pillars
+
+
+async def handler(request) -> None:
+    pass
+
+
+def load(router: aiohttp.web.UrlDispatcher, routes: int) -> None:
+    for i in range(routes // 2):
+        router.add_route("GET", f"/static/{i}/items", handler)
+        router.add_route("GET", f"/dynamic/{i}/items/{{id}}", handler)
+    router.freeze()
+
+
+async def resolve(router: aiohttp.web.UrlDispatcher, path: str, number: int) -> float:
+    request = make_mocked_request("GET", path)
+    start = time.perf_counter()
+    for _ in range(number):
+        await router.resolve(request)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=500)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    last = args.routes // 2 - 1
+    loop = asyncio.get_event_loop()
+    for name, router in (
+        ("aiohttp", aiohttp.web.UrlDispatcher()),
+        ("pillars", pillars.transports.http.Router()),
+    ):
+        load(router, args.routes)
+        for kind, path in (
+            ("static", f"/static/{last}/items"),
+            ("dynamic", f"/dynamic/{last}/items/1"),
+        ):
+            duration = loop.run_until_complete(resolve(router, path, args.number))
+            print(
+                f"{name:>8} {kind:>8}: {duration / args.number * 1e6:8.2f} us/resolve"
+            )
+
+
+if __name__ == "__main__":
+    main()
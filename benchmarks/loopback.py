@@ -0,0 +1,119 @@
+"""
+Measure the per-message overhead of the transports over loopback sites.
+
+The syslog, ARI and FastAGI transports are driven end to end through
+`pillars.sites.loopback`, without kernel networking, with handlers doing no
+work.
+
+    $ python benchmarks/loopback.py --messages 20000
+"""
+import argparse
+import asyncio
+import collections
+import time
+
+import pillars
+
+
+async def syslog(messages: int, batch_size: int) -> float:
+    done = asyncio.Event()
+    received = 0
+
+    class Application(pillars.transports.syslog.Application):
+        async def _handler(self, data, addr) -> None:
+            nonlocal received
+            received += 1
+            if received == messages:
+                done.set()
+
+    runner = pillars.transports.syslog.AppRunner(Application())
+    await runner.setup()
+    site = pillars.sites.DatagramLoopbackSite(runner, batch_size=batch_size)
+    await site.start()
+    transport = site.connect()
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        transport.sendto(b"<134>1 2018-08-19T14:18:11.051Z host app - - - message")
+    await done.wait()
+    duration = time.perf_counter() - start
+
+    await runner.cleanup()
+    return duration
+
+
+async def ari(messages: int) -> float:
+    done = asyncio.Event()
+    received = 0
+
+    async def handler(request) -> None:
+        nonlocal received
+        received += 1
+        if received == messages:
+            done.set()
+
+    app = pillars.transports.ari.Application({})
+    app.state = collections.ChainMap({}, {})
+    app.router.add("channelstatechange", handler)
+    runner = pillars.transports.ari.AppRunner(app)
+    await runner.setup()
+    site = pillars.sites.WSLoopbackSite(runner)
+    await site.start()
+
+    start = time.perf_counter()
+    for i in range(messages):
+        site.send_json({"type": "ChannelStateChange", "channel": {"id": str(i)}})
+    await done.wait()
+    duration = time.perf_counter() - start
+
+    await runner.cleanup()
+    return duration
+
+
+async def fast_agi(messages: int) -> float:
+    async def handler(request) -> None:
+        pass
+
+    app = pillars.transports.fast_agi.Application(
+        middlewares=(pillars.transports.fast_agi.middleware,)
+    )
+    app.state = collections.ChainMap({}, {})
+    app.routes["bench"] = handler
+    runner = pillars.transports.fast_agi.AppRunner(app)
+    await runner.setup()
+    site = pillars.sites.LoopbackSite(runner)
+    await site.start()
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        reader, writer = await site.open_connection()
+        writer.write(b"agi_network_script: bench\nagi_channel: SIP/1\n\n")
+        await reader.read()
+    duration = time.perf_counter() - start
+
+    await runner.cleanup()
+    return duration
+
+
+def report(name: str, messages: int, duration: float) -> None:
+    print(
+        f"{name:>16}: {messages / duration:10.0f} msgs/s, "
+        f"{duration / messages * 1e6:8.2f} us/msg"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    for batch_size in (1, 64):
+        duration = loop.run_until_complete(syslog(args.messages, batch_size))
+        report(f"syslog batch {batch_size}", args.messages, duration)
+    report("ari", args.messages, loop.run_until_complete(ari(args.messages)))
+    report("fast_agi", args.messages, loop.run_until_complete(fast_agi(args.messages)))
+
+
+if __name__ == "__main__":
+    main()
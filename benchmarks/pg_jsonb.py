@@ -0,0 +1,71 @@
+"""
+Benchmark the jsonb decoders of `pillars.engines.pg`.
+
+The decoders are called with the raw binary values asyncpg hands them, no
+database is required.
+
+    $ python benchmarks/pg_jsonb.py --rows 10000
+"""
+import argparse
+import random
+import timeit
+import uuid
+
+import ujson
+import pillars
+
+
+def legacy_decoder(value: bytes) -> dict:
+    return ujson.loads(value[1:].decode("utf-8"))
+
+
+def event(index: int) -> dict:
+    channel = {
+        "id": f"1534688291.{index}",
+        "name": f"PJSIP/trunk-{index:08x}",
+        "state": random.choice(("Ring", "Ringing", "Up")),
+        "caller": {"name": "Alice", "number": "+3225550100"},
+        "connected": {"name": "Bob", "number": "+3225550199"},
+        "dialplan": {"context": "inbound", "exten": "s", "priority": 1},
+        "creationtime": "2018-08-19T14:18:11.051+0000",
+        "language": "en",
+    }
+    return {
+        "type": "ChannelStateChange",
+        "application": "pillars",
+        "timestamp": "2018-08-19T14:18:11.051+0000",
+        "channel": channel,
+        "bridge": {
+            "id": str(uuid.uuid4()),
+            "technology": "simple_bridge",
+            "channels": [channel["id"], f"1534688291.{index + 1}"],
+        },
+        "variables": {f"VAR_{i}": "x" * i for i in range(10)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = [pillars.engines.pg.jsonb_encoder(event(i)) for i in range(args.rows)]
+    size = sum(len(row) for row in rows) / len(rows)
+    print(f"{args.rows} rows, {size:.0f} bytes on average")
+
+    decoders = {"legacy (ujson)": legacy_decoder}
+    for name, backend in pillars.engines.pg.JSON_BACKENDS.items():
+        decoders[name] = pillars.engines.pg.make_jsonb_decoder(backend)
+
+    for name, decoder in decoders.items():
+        best = min(
+            timeit.repeat(
+                lambda: [decoder(row) for row in rows], number=1, repeat=args.repeat
+            )
+        )
+        print(f"{name:>16}: {best * 1000:8.2f} ms, {args.rows / best:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
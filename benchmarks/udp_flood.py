@@ -0,0 +1,83 @@
+"""
+Benchmark the datagram sites under a local UDP flood.
+
+A syslog application is served by a `pillars.sites.UDPSite`, once per batch
+size, while child processes flood it with datagrams. The throughput is the
+number of messages handled per second, the remainder was dropped by the kernel.
+
+    $ python benchmarks/udp_flood.py --messages 200000 --batch-size 0 64
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+
+import pillars
+
+MESSAGE = b"<134>1 2018-08-19T14:18:11.051Z host app 1234 ID47 - benchmark message"
+
+
+class Application(pillars.transports.syslog.Application):
+    def __init__(self) -> None:
+        super().__init__()
+        self.received = 0
+        self.last = 0.0
+
+    async def _handler(self, data, addr) -> None:
+        self.received += 1
+        self.last = time.monotonic()
+
+
+def flood(port: int, messages: int) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for _ in range(messages):
+        sock.sendto(MESSAGE, ("127.0.0.1", port))
+
+
+async def run(batch_size: int, messages: int, senders: int) -> None:
+    app = Application()
+    runner = pillars.transports.syslog.AppRunner(app)
+    await runner.setup()
+    site = pillars.sites.UDPSite(runner, "127.0.0.1", 0, batch_size=batch_size or None)
+    await site.start()
+    port = site._server.transport.get_extra_info("sockname")[1]
+
+    processes = [
+        multiprocessing.Process(target=flood, args=(port, messages // senders))
+        for _ in range(senders)
+    ]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+
+    while any(process.is_alive() for process in processes) or (
+        time.monotonic() - max(app.last, start) < 0.5
+    ):
+        await asyncio.sleep(0.1)
+
+    duration = max(app.last - start, 1e-6)
+    await runner.cleanup()
+
+    name = f"batch {batch_size}" if batch_size else "unbatched"
+    print(
+        f"{name:>12}: {app.received:8d} received, "
+        f"{app.received / duration:10.0f} msgs/s, "
+        f"{1 - app.received / messages:6.1%} dropped"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[0, 16, 64, 256])
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    for batch_size in args.batch_size:
+        loop.run_until_complete(run(batch_size, args.messages, args.senders))
+
+
+if __name__ == "__main__":
+    main()
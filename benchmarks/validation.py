@@ -0,0 +1,86 @@
+"""
+Benchmark the compiled validators of `pillars.validation` against cerberus.
+
+A typical write payload is validated against the same schema, once valid and
+once with errors.
+
+    $ python benchmarks/validation.py --number 20000
+"""
+import argparse
+import timeit
+
+import cerberus
+import pillars
+
+SCHEMA = {
+    "id": {"type": "string", "required": True, "regex": "[0-9a-f]{32}"},
+    "name": {"type": "string", "required": True, "empty": False, "maxlength": 64},
+    "state": {"type": "string", "allowed": ["Ring", "Ringing", "Up", "Down"]},
+    "priority": {"type": "integer", "min": 0, "max": 10, "coerce": int},
+    "caller": {
+        "type": "dict",
+        "schema": {
+            "name": {"type": "string", "nullable": True},
+            "number": {"type": "string", "regex": r"\+?[0-9]+"},
+        },
+    },
+    "tags": {"type": "list", "schema": {"type": "string"}, "default": []},
+    "enabled": {"type": "boolean", "default": True},
+}
+
+VALID = {
+    "id": "9c3bbf83a6c14d5f8f6fc0d4bb46e8c1",
+    "name": "PJSIP/trunk-00000001",
+    "state": "Up",
+    "priority": "1",
+    "caller": {"name": "Alice", "number": "+3225550100"},
+    "tags": ["inbound", "trunk"],
+}
+
+INVALID = {
+    "id": "9c3bbf83",
+    "name": "",
+    "state": "Busy",
+    "priority": 20,
+    "caller": {"name": None, "number": "unknown"},
+    "tags": ["inbound", 1],
+    "extra": True,
+}
+
+
+def cerberus_validate(validator: cerberus.Validator, document: dict) -> None:
+    if validator.validate(document):
+        validator.document
+    else:
+        validator.errors
+
+
+def pillars_validate(validator: pillars.validation.Validator, document: dict) -> None:
+    try:
+        validator.validate(document)
+    except pillars.exceptions.DataValidationError:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    validators = (
+        ("cerberus", cerberus.Validator(SCHEMA), cerberus_validate),
+        ("compiled", pillars.validation.Validator(SCHEMA), pillars_validate),
+    )
+    for document_name, document in (("valid", VALID), ("invalid", INVALID)):
+        for name, validator, validate in validators:
+            duration = timeit.timeit(
+                lambda: validate(validator, document), number=args.number
+            )
+            print(
+                f"{document_name:>8} {name:>9}: "
+                f"{duration / args.number * 1e6:8.2f} us/document"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 from . import (  # noQa: F401
     engines,
     exceptions,
+    metrics,
     middlewares,
     request,
     sites,
     transports,
     utils,
+    validation,
 )
 from .app import Application, SubApp  # noQa: F401
-from .request import Response  # noQa: F401
+from .request import Response, ServerSentEvent, StreamResponse  # noQa: F401
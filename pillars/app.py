@@ -32,6 +32,13 @@ class SubApp:
 
         return all(result)
 
+    def metrics(self) -> dict:
+        return {
+            site.name: site.metrics()  # type: ignore
+            for site in self.sites
+            if callable(getattr(site, "metrics", None))
+        }
+
 
 class Application(collections.MutableMapping):
     def __init__(
@@ -143,12 +150,33 @@ class Application(collections.MutableMapping):
         await asyncio.gather(*coros)
         await self.on_cleanup.send(self)
 
-    async def status(self) -> dict:
-        result = dict()
+    async def status(self, metrics: bool = False) -> dict:
+        result: dict = dict()
         for subapp in self._subapps.values():
             if hasattr(subapp, "status"):
                 result[subapp.name] = await subapp.status()
 
+        if metrics:
+            result["metrics"] = self.metrics()
+
+        return result
+
+    def metrics(self) -> dict:
+        """Metrics of the engines stored in the application state and of the sites"""
+        result = {
+            key: engine.metrics()
+            for key, engine in self._state.items()
+            if callable(getattr(engine, "metrics", None))
+        }
+
+        sites = dict()
+        for name, subapp in self._subapps.items():
+            metrics = subapp.metrics()
+            if metrics:
+                sites[name] = metrics
+        if sites:
+            result["sites"] = sites
+
         return result
 
     ###########
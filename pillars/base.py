@@ -1,10 +1,14 @@
 import asyncio
+import collections
+import logging
 import signal
 import socket
 from abc import ABC, abstractmethod
 
 from yarl import URL
 
+LOG = logging.getLogger(__name__)
+
 
 class BaseRunner(ABC):
     __slots__ = ("_handle_signals", "_kwargs", "_server", "_sites")
@@ -121,7 +125,265 @@ class BaseSite(ABC):
         self._runner._unreg_site(self)
 
 
-class TCPSite(BaseSite):
+class ConnectionLimiter:
+    """
+    Protocol factory limiting the connections of a stream site.
+
+    Accepting is paused once ``max_connections`` connections are open and
+    resumed when they drop under ``low_water``, the pending connections wait
+    in the listen backlog. Connections over the limits are aborted.
+
+    Pausing closes the server of the site while keeping its listening sockets
+    open, resuming serves them again. Only public event loop APIs are used,
+    so it works with any loop implementation.
+
+    Args:
+        factory: Protocol factory of the runner.
+        max_connections: Maximum number of concurrent connections.
+        low_water: Number of connections under which accepting resumes,
+            defaults to 90% of ``max_connections``.
+        max_per_peer: Maximum number of concurrent connections per peer host.
+    """
+
+    def __init__(
+        self, factory, *, max_connections=None, low_water=None, max_per_peer=None
+    ):
+        if low_water is None and max_connections is not None:
+            low_water = int(max_connections * 0.9)
+        self._factory = factory
+        self._max_connections = max_connections
+        self._low_water = low_water
+        self._max_per_peer = max_per_peer
+        self._server = None
+        self._paused = False
+        self._connections = 0
+        self._peers = collections.Counter()
+        self._stats = collections.Counter()
+
+    def __call__(self):
+        return _LimitedProtocol(self, self._factory())
+
+    def attach(self, server):
+        self._server = server
+
+    def metrics(self):
+        return {
+            "connections": self._connections,
+            "max_connections": self._max_connections,
+            "paused": self._paused,
+            **self._stats,
+        }
+
+    @property
+    def _full(self):
+        if self._max_connections is None:
+            return False
+        return self._connections >= self._max_connections
+
+    def _acquire(self, transport):
+        peer = _peer_host(transport)
+        if self._full:
+            self._stats["rejected"] += 1
+            return None
+        elif self._max_per_peer is not None and self._peers[peer] >= self._max_per_peer:
+            self._stats["rejected_per_peer"] += 1
+            return None
+
+        self._connections += 1
+        self._peers[peer] += 1
+        if self._full:
+            self._pause()
+        return peer
+
+    def _release(self, peer):
+        self._connections -= 1
+        self._peers[peer] -= 1
+        if self._peers[peer] <= 0:
+            del self._peers[peer]
+        if self._paused and self._connections <= self._low_water:
+            self._resume()
+
+    def _pause(self):
+        if self._paused or self._server is None or self._server.closed:
+            return
+
+        LOG.warning("Connection limit reached (%s), pausing accept", self._connections)
+        self._paused = True
+        self._stats["pauses"] += 1
+        self._server.pause()
+
+    def _resume(self):
+        self._paused = False
+        if self._server is not None and not self._server.closed:
+            LOG.info("Resuming accept (%s connections)", self._connections)
+            self._server.resume()
+
+
+class _LimitedProtocol(asyncio.Protocol):
+    __slots__ = ("_limiter", "_protocol", "_peer")
+
+    def __init__(self, limiter, protocol):
+        self._limiter = limiter
+        self._protocol = protocol
+        self._peer = None
+
+    def connection_made(self, transport):
+        self._peer = self._limiter._acquire(transport)
+        if self._peer is None:
+            transport.abort()
+        else:
+            self._protocol.connection_made(transport)
+
+    def connection_lost(self, exc):
+        if self._peer is not None:
+            self._limiter._release(self._peer)
+            self._protocol.connection_lost(exc)
+
+    def data_received(self, data):
+        self._protocol.data_received(data)
+
+    def eof_received(self):
+        return self._protocol.eof_received()
+
+    def pause_writing(self):
+        self._protocol.pause_writing()
+
+    def resume_writing(self):
+        self._protocol.resume_writing()
+
+    def __getattr__(self, name):
+        return getattr(self._protocol, name)
+
+
+class _PausableServer:
+    """
+    Server of a stream site able to stop accepting for a while.
+
+    ``asyncio.Server`` can not stop accepting without being closed, so the
+    listening sockets are duplicated and served again by a new server on
+    resume, the pending connections waiting in their backlog meanwhile.
+
+    Args:
+        server: Server returned by the event loop.
+        serve: Coroutine function serving a listening socket, returning the
+            new server.
+    """
+
+    __slots__ = ("_serve", "_listeners", "_servers", "_closing", "_resuming", "closed")
+
+    def __init__(self, server, serve):
+        self._serve = serve
+        self._listeners = [
+            socket.fromfd(sock.fileno(), sock.family, sock.type)
+            for sock in server.sockets
+        ]
+        self._servers = [server]
+        self._closing = []
+        self._resuming = None
+        self.closed = False
+
+    @property
+    def sockets(self):
+        return self._listeners
+
+    def pause(self):
+        if self._resuming is not None:
+            self._resuming.cancel()
+            self._resuming = None
+        for server in self._servers:
+            server.close()
+        self._closing.extend(self._servers)
+        self._servers = []
+
+    def resume(self):
+        if not self._servers and self._resuming is None:
+            self._resuming = asyncio.ensure_future(self._serve_listeners())
+
+    def close(self):
+        self.pause()
+        self.closed = True
+        for sock in self._listeners:
+            sock.close()
+
+    async def wait_closed(self):
+        closing, self._closing = self._closing, []
+        for server in closing:
+            await server.wait_closed()
+
+    async def _serve_listeners(self):
+        try:
+            for sock in self._listeners:
+                self._servers.append(await self._serve(sock.dup()))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.exception("Error resuming accept")
+        self._resuming = None
+
+
+def _peer_host(transport):
+    peer = transport.get_extra_info("peername")
+    if isinstance(peer, (tuple, list)):
+        return peer[0]
+    return peer or ""
+
+
+class _StreamSite(BaseSite):
+    __slots__ = ("_limiter",)
+
+    def __init__(
+        self,
+        runner,
+        *,
+        shutdown_timeout=60.0,
+        ssl_context=None,
+        backlog=128,
+        max_connections=None,
+        low_water=None,
+        max_per_peer=None
+    ):
+        super().__init__(
+            runner,
+            shutdown_timeout=shutdown_timeout,
+            ssl_context=ssl_context,
+            backlog=backlog,
+        )
+        if max_connections is None and max_per_peer is None:
+            self._limiter = None
+        else:
+            self._limiter = ConnectionLimiter(
+                runner.server,
+                max_connections=max_connections,
+                low_water=low_water,
+                max_per_peer=max_per_peer,
+            )
+
+    @property
+    def _protocol_factory(self):
+        return self._limiter or self._runner.server
+
+    def _serving(self, server):
+        if self._limiter:
+            server = _PausableServer(server, self._serve)
+            self._limiter.attach(server)
+        self._server = server
+
+    async def _serve(self, sock):
+        loop = asyncio.get_event_loop()
+        return await loop.create_server(
+            self._protocol_factory,
+            sock=sock,
+            ssl=self._ssl_context,
+            backlog=self._backlog,
+        )
+
+    def metrics(self):
+        if self._limiter:
+            return self._limiter.metrics()
+        return {}
+
+
+class TCPSite(_StreamSite):
     __slots__ = ("_host", "_port", "_reuse_address", "_reuse_port")
 
     def __init__(
@@ -134,13 +396,19 @@ class TCPSite(BaseSite):
         ssl_context=None,
         backlog=128,
         reuse_address=None,
-        reuse_port=None
+        reuse_port=None,
+        max_connections=None,
+        low_water=None,
+        max_per_peer=None
     ):
         super().__init__(
             runner,
             shutdown_timeout=shutdown_timeout,
             ssl_context=ssl_context,
             backlog=backlog,
+            max_connections=max_connections,
+            low_water=low_water,
+            max_per_peer=max_per_peer,
         )
         if host is None:
             host = "0.0.0.0"
@@ -159,8 +427,8 @@ class TCPSite(BaseSite):
     async def start(self):
         await super().start()
         loop = asyncio.get_event_loop()
-        self._server = await loop.create_server(
-            self._runner.server,
+        server = await loop.create_server(
+            self._protocol_factory,
             self._host,
             self._port,
             ssl=self._ssl_context,
@@ -168,19 +436,32 @@ class TCPSite(BaseSite):
             reuse_address=self._reuse_address,
             reuse_port=self._reuse_port,
         )
+        self._serving(server)
 
 
-class UnixSite(BaseSite):
+class UnixSite(_StreamSite):
     __slots__ = ("_path",)
 
     def __init__(
-        self, runner, path, *, shutdown_timeout=60.0, ssl_context=None, backlog=128
+        self,
+        runner,
+        path,
+        *,
+        shutdown_timeout=60.0,
+        ssl_context=None,
+        backlog=128,
+        max_connections=None,
+        low_water=None,
+        max_per_peer=None
     ):
         super().__init__(
             runner,
             shutdown_timeout=shutdown_timeout,
             ssl_context=ssl_context,
             backlog=backlog,
+            max_connections=max_connections,
+            low_water=low_water,
+            max_per_peer=max_per_peer,
         )
         self._path = path
 
@@ -192,25 +473,47 @@ class UnixSite(BaseSite):
     async def start(self):
         await super().start()
         loop = asyncio.get_event_loop()
-        self._server = await loop.create_unix_server(
-            self._runner.server,
+        server = await loop.create_unix_server(
+            self._protocol_factory,
             self._path,
             ssl=self._ssl_context,
             backlog=self._backlog,
         )
+        self._serving(server)
+
+    async def _serve(self, sock):
+        loop = asyncio.get_event_loop()
+        return await loop.create_unix_server(
+            self._protocol_factory,
+            sock=sock,
+            ssl=self._ssl_context,
+            backlog=self._backlog,
+        )
 
 
-class SockSite(BaseSite):
+class SockSite(_StreamSite):
     __slots__ = ("_sock", "_name")
 
     def __init__(
-        self, runner, sock, *, shutdown_timeout=60.0, ssl_context=None, backlog=128
+        self,
+        runner,
+        sock,
+        *,
+        shutdown_timeout=60.0,
+        ssl_context=None,
+        backlog=128,
+        max_connections=None,
+        low_water=None,
+        max_per_peer=None
     ):
         super().__init__(
             runner,
             shutdown_timeout=shutdown_timeout,
             ssl_context=ssl_context,
             backlog=backlog,
+            max_connections=max_connections,
+            low_water=low_water,
+            max_per_peer=max_per_peer,
         )
         self._sock = sock
         scheme = "https" if self._ssl_context else "http"
@@ -228,9 +531,10 @@ class SockSite(BaseSite):
     async def start(self):
         await super().start()
         loop = asyncio.get_event_loop()
-        self._server = await loop.create_server(
-            self._runner.server,
+        server = await loop.create_server(
+            self._protocol_factory,
             sock=self._sock,
             ssl=self._ssl_context,
             backlog=self._backlog,
         )
+        self._serving(server)
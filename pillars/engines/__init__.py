@@ -1 +1 @@
-from . import ari, pg, redis, systemd  # noQa: F401
+from . import ari, cache, pg, redis, supervisor, systemd  # noQa: F401
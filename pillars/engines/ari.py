@@ -1,12 +1,16 @@
+import asyncio
+import functools
 import logging
 import time
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import aiohttp
+import async_timeout
 import ujson
 
 from ..app import Application
+from ..request import remaining
 
 LOG = logging.getLogger(__name__)
 
@@ -28,13 +32,33 @@ class ChannelCounter:
 
 
 class AriClient:
-    def __init__(self, app: Application, url: str, auth: aiohttp.BasicAuth) -> None:
+    """
+    Client of the ARI REST API.
+
+    Args:
+        app: Main application.
+        url: Base URL of the API.
+        auth: Credentials of the API.
+        coalesce: Merge identical ``GET`` requests sent concurrently into a
+            single call, the callers share its response.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        url: str,
+        auth: aiohttp.BasicAuth,
+        *,
+        coalesce: bool = False,
+    ) -> None:
 
         self._name = app["name"]
         self._base_url = url
         self._auth = auth
+        self._coalesce = coalesce
         self._channel_counter = ChannelCounter()
         self._client: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = dict()
 
         app.on_startup.append(self._startup)
         app.on_cleanup.append(self._cleanup)
@@ -65,10 +89,16 @@ class AriClient:
         url: str,
         data: Optional[dict] = None,
         params: Optional[dict] = None,
+        timeout: Optional[float] = None,
     ) -> dict:
+        """
+        Send a request to the ARI REST API.
+
+        Within a request the timeout is bounded by the request deadline.
+        """
         LOG.log(4, "ARI request %s to %s with %s %s", method, url, params, data)
         url = self._base_url + url
-        response = await self._request(method, url, data, params)
+        response = await self._request(method, url, data, params, remaining(timeout))
         return response
 
     async def _request(
@@ -77,19 +107,60 @@ class AriClient:
         url: str,
         data: Optional[dict] = None,
         params: Optional[dict] = None,
+        timeout: Optional[float] = None,
     ) -> dict:
 
-        if not self._client:
-            raise RuntimeError("Engine not started")
+        if method.upper() == "GET" and self._coalesce and data is None:
+            response_data = await self._coalesced(url, params, timeout)
+        else:
+            response_data = await self._send(method, url, data, params, timeout)
 
-        response = await self._client.request(method, url, json=data, params=params)
-        response.raise_for_status()
-        response_data = await response.text()
         if response_data:
             return ujson.loads(response_data)
         else:
             return {}
 
+    async def _coalesced(
+        self, url: str, params: Optional[dict], timeout: Optional[float]
+    ) -> str:
+        # The body is shared, each caller decodes its own copy and only waits
+        # for its own timeout
+        key = (url, repr(sorted(params.items())) if params else "")
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(
+                self._send("GET", url, None, params, None)
+            )
+            task.add_done_callback(functools.partial(self._sent, key))
+        else:
+            LOG.log(4, "Coalescing ARI request to %s", url)
+
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _sent(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieved here in case every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        data: Optional[dict] = None,
+        params: Optional[dict] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+
+        if not self._client:
+            raise RuntimeError("Engine not started")
+
+        async with async_timeout.timeout(timeout):
+            response = await self._client.request(method, url, json=data, params=params)
+            response.raise_for_status()
+            return await response.text()
+
     ###########
     # HELPERS #
     ###########
@@ -0,0 +1,240 @@
+import asyncio
+import collections
+import functools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import aioredis
+import ujson
+
+from .. import utils
+from ..app import Application
+from .redis import Redis
+
+LOG = logging.getLogger(__name__)
+
+
+class Cache:
+    """
+    Two tier cache: a size bounded in-process LRU in front of Redis.
+
+    Concurrent loads of a key are merged into a single call of the loader.
+    Invalidations are broadcast to every process through Redis pub/sub, the
+    local tier is flushed whenever the subscription is lost.
+
+    Args:
+        app: Main application.
+        redis: Redis engine backing the cache.
+        maxsize: Maximum number of keys in the local tier.
+        ttl: Time to live of the keys in Redis, in seconds.
+        local_ttl: Time to live of the keys in the local tier, defaults to ``ttl``.
+        prefix: Prefix of the Redis keys.
+        channel: Pub/sub channel used for invalidations.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        redis: Redis,
+        *,
+        maxsize: int = 1024,
+        ttl: int = 300,
+        local_ttl: Optional[float] = None,
+        prefix: str = "pillars:cache:",
+        channel: str = "pillars:cache:invalidate",
+        reconnection_timeoff: int = 10,
+        reconnection_backoff: float = 0.5,
+    ) -> None:
+        self._redis = redis
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._local_ttl = ttl if local_ttl is None else local_ttl
+        self._prefix = prefix
+        self._channel = channel
+        self._reconnection_timeoff = reconnection_timeoff
+        self._reconnection_backoff = reconnection_backoff
+        self._loop = asyncio.get_event_loop()
+        self._local: "collections.OrderedDict[str, Tuple[float, Any]]" = (
+            collections.OrderedDict()
+        )
+        self._loading: Dict[str, asyncio.Task] = dict()
+        self._task: Optional[asyncio.Task] = None
+        self._connection: Optional[aioredis.RedisConnection] = None
+        self._stats: collections.Counter = collections.Counter()
+
+        app.on_startup.append(self._startup)
+        app.on_shutdown.append(self._shutdown)
+
+    async def get(
+        self,
+        key: str,
+        loader: Optional[Callable[[], Awaitable[Any]]] = None,
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """
+        Value of ``key``, loaded with ``loader`` on a miss of both tiers.
+
+        Returns ``None`` on a miss without loader.
+        """
+        entry = self._local.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._local.move_to_end(key)
+                self._stats["local_hits"] += 1
+                return entry[1]
+            del self._local[key]
+
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = self._loop.create_task(
+                self._load(key, loader, ttl or self._ttl)
+            )
+        return await asyncio.shield(task)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await self._redis.execute(
+            "SET", self._prefix + key, ujson.dumps(value), "EX", ttl or self._ttl
+        )
+        await self.invalidate(key, delete=False)
+        self._store(key, value)
+
+    async def invalidate(self, key: str, delete: bool = True) -> None:
+        """Drop ``key`` from both tiers in every process"""
+        self._evict(key)
+        self._stats["invalidations"] += 1
+        commands = [self._redis.execute("PUBLISH", self._channel, key)]
+        if delete:
+            commands.append(self._redis.execute("DEL", self._prefix + key))
+        await asyncio.gather(*commands)
+
+    def cached(
+        self, key: str, ttl: Optional[int] = None
+    ) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+        """
+        Cache the result of a coroutine function.
+
+        Args:
+            key: Format string of the key, formatted with the arguments of the
+                call. For example ``customer:{0}`` or ``customer:{customer_id}``.
+            ttl: Time to live of the keys in Redis, in seconds.
+        """
+
+        def decorator(
+            func: Callable[..., Awaitable[Any]]
+        ) -> Callable[..., Awaitable[Any]]:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await self.get(
+                    key.format(*args, **kwargs),
+                    functools.partial(func, *args, **kwargs),
+                    ttl=ttl,
+                )
+
+            return wrapper
+
+        return decorator
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self._local),
+            "subscribed": self._connection is not None,
+            **self._stats,
+        }
+
+    async def _load(
+        self, key: str, loader: Optional[Callable[[], Awaitable[Any]]], ttl: int
+    ) -> Any:
+        task = asyncio.current_task()
+        try:
+            try:
+                raw = await self._redis.execute("GET", self._prefix + key)
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                LOG.warning("Cache unable to reach Redis for %s: %r", key, e)
+                return await self._call(loader)
+
+            if raw is not None:
+                self._stats["redis_hits"] += 1
+                value = ujson.loads(raw)
+            elif loader is None:
+                self._stats["misses"] += 1
+                return None
+            else:
+                self._stats["misses"] += 1
+                value = await self._call(loader)
+                await self._redis.execute(
+                    "SET", self._prefix + key, ujson.dumps(value), "EX", ttl
+                )
+
+            # Skip the local tier if the key was invalidated during the load
+            if self._loading.get(key) is task:
+                self._store(key, value)
+            return value
+        finally:
+            if self._loading.get(key) is task:
+                del self._loading[key]
+
+    async def _call(self, loader: Optional[Callable[[], Awaitable[Any]]]) -> Any:
+        if loader is None:
+            return None
+        self._stats["loads"] += 1
+        return await loader()
+
+    def _store(self, key: str, value: Any) -> None:
+        self._local[key] = (time.monotonic() + self._local_ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self._maxsize:
+            self._local.popitem(last=False)
+
+    def _evict(self, key: str) -> None:
+        self._local.pop(key, None)
+        self._loading.pop(key, None)
+
+    def _flush(self) -> None:
+        self._local.clear()
+        self._loading.clear()
+
+    async def _listen(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                self._connection = await self._redis.create_connection()
+                channel = aioredis.Channel(self._channel, is_pattern=False)
+                await self._connection.execute_pubsub("SUBSCRIBE", channel)
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                delay = utils.backoff_delay(
+                    attempt, self._reconnection_backoff, self._reconnection_timeoff
+                )
+                LOG.error("Cache subscription error, retrying in %.2fs: %r", delay, e)
+                self._close_connection()
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            LOG.debug("Cache subscribed to %s", self._channel)
+            attempt = 0
+            # Invalidations may have been missed while unsubscribed
+            self._flush()
+            while await channel.wait_message():
+                key = await channel.get(encoding="utf-8")
+                LOG.log(4, "Cache invalidation: %s", key)
+                self._evict(key)
+
+            LOG.warning("Cache subscription to %s lost", self._channel)
+            self._close_connection()
+            self._flush()
+
+    def _close_connection(self) -> None:
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    async def _startup(self, app: Application) -> None:
+        LOG.debug("Starting cache engine")
+        self._task = self._loop.create_task(self._listen())
+
+    async def _shutdown(self, app: Application) -> None:
+        LOG.debug("Shutting down cache engine")
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._close_connection()
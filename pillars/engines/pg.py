@@ -1,13 +1,36 @@
 import asyncio
+import json
 import logging
-from contextlib import asynccontextmanager
-from typing import Optional
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import async_timeout
 import asyncpg
 import ujson
 
+from .. import exceptions
 from ..app import Application
+from ..metrics import PoolMetrics
+from ..request import BaseRequest, current, remaining, route
+from .supervisor import PoolState, PoolSupervisor
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
 
 LOG = logging.getLogger(__name__)
 
@@ -18,60 +41,145 @@ class PG:
         app: Application,
         *args,
         reconnection_timeoff: int = 10,
+        reconnection_backoff: float = 0.5,
         shutdown_timeout: int = 5,
-        **kwargs
+        json_backend: Union[None, str, "JSONBackend"] = None,
+        slow_query_threshold: Optional[float] = None,
+        slow_query_sample: float = 1.0,
+        **kwargs,
     ) -> None:
-        self._loop = asyncio.get_event_loop()
-        self._task: Optional[asyncio.Task] = None
-        self._result: asyncio.Future = asyncio.Future()
+        if isinstance(json_backend, str):
+            json_backend = JSON_BACKENDS[json_backend]
+
+        if slow_query_threshold is not None:
+            kwargs.setdefault("connection_class", Connection)
+            if not issubclass(kwargs["connection_class"], Connection):
+                LOG.warning(
+                    "Slow query log disabled, %s is not a subclass of %s",
+                    kwargs["connection_class"].__qualname__,
+                    Connection.__qualname__,
+                )
+
+        self._init = kwargs.pop("init", None)
+        self._metrics = PoolMetrics(
+            kwargs.get("max_size", 10),
+            slow_threshold=slow_query_threshold,
+            slow_sample=slow_query_sample,
+        )
         self._connection_info = (args, kwargs)
         self._shutdown_timeout = shutdown_timeout
-        self._reconnection_timeoff = reconnection_timeoff
+        self._json_backend = json_backend
+        self._loaders: Dict[str, Tuple[str, str]] = dict()
+        self._supervisor = PoolSupervisor(
+            "PostgreSQL",
+            self._create_pool,
+            discard=self._discard_pool,
+            backoff_base=reconnection_backoff,
+            backoff_max=reconnection_timeoff,
+        )
 
         app.on_startup.append(self._startup)
         app.on_shutdown.append(self._shutdown)
         app.on_cleanup.append(self._cleanup)
 
-    async def _connect(self) -> None:
-        try:
-            pool = await asyncpg.create_pool(
-                *self._connection_info[0], **self._connection_info[1]
-            )
-        except ConnectionError:
-            LOG.exception("PostgreSQL connection error")
-            await asyncio.sleep(self._reconnection_timeoff)
-            self._task = self._loop.create_task(self._connect())
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            LOG.exception("PostgreSQL connection error")
-            self._result.set_exception(e)
-        else:
-            LOG.info("PostgreSQL connection pool created")
-            self._result.set_result(pool)
+    @property
+    def state(self) -> PoolState:
+        return self._supervisor.state
+
+    async def _create_pool(self) -> asyncpg.pool.Pool:
+        return await asyncpg.create_pool(
+            *self._connection_info[0],
+            init=self._init_connection,
+            **self._connection_info[1],
+        )
+
+    async def _init_connection(self, con: asyncpg.Connection) -> None:
+        if isinstance(con, Connection):
+            con._metrics = self._metrics
+        if self._json_backend:
+            await register_json_codec(con, self._json_backend)
+        if self._init:
+            await self._init(con)
+
+    async def _discard_pool(self, pool: asyncpg.pool.Pool) -> None:
+        await asyncio.wait_for(pool.close(), timeout=self._shutdown_timeout)
 
     @asynccontextmanager
     async def connection(self, timeout: int = 5) -> asyncpg.Connection:
-        async with async_timeout.timeout(timeout):
-            pool = await asyncio.shield(self._result)
+        """
+        Acquire a connection from the pool.
+
+        The timeout only applies to the acquisition, the connection can be
+        held longer, like while a response is streamed. Within a request the
+        timeout is bounded by the request deadline and the remaining time is
+        set as ``statement_timeout`` on the connection.
+        """
+        label = route()
+        async with async_timeout.timeout(remaining(timeout)):
+            pool = await self._supervisor.pool()
+            start = time.monotonic()
+            self._metrics.waiting += 1
             try:
                 connection = await pool.acquire()
-            except ConnectionError:
+            except ConnectionError as e:
                 LOG.debug("Connection error while acquiring connection")
-                self._result = asyncio.Future()
-                self._task = self._loop.create_task(self._connect())
-                pool = await asyncio.shield(self._result)
-                connection = await pool.acquire()
-            try:
-                yield connection
+                self._supervisor.failed(pool, e)
+                raise exceptions.PoolUnavailable("PostgreSQL", self.state.value) from e
             finally:
-                await pool.release(connection)
+                self._metrics.waiting -= 1
+
+        acquired = time.monotonic()
+        self._metrics.acquired(label, acquired - start)
+        try:
+            deadline = remaining()
+            if deadline is not None:
+                # Reset by the pool on release
+                await connection.execute(
+                    f"SET statement_timeout = {max(int(deadline * 1000), 1)}"
+                )
+            yield connection
+        finally:
+            self._metrics.released(label, time.monotonic() - acquired)
+            await pool.release(connection)
+
+    def metrics(self) -> dict:
+        return {**self._supervisor.stats(), **self._metrics.snapshot()}
+
+    def add_loader(self, name: str, query: str, key: str = "id") -> None:
+        """
+        Register a batched lookup.
+
+        Args:
+            name: Name of the loader.
+            query: Query fetching the rows for an array of keys passed as
+                ``$1``, for example ``SELECT * FROM users WHERE id = ANY($1)``.
+            key: Column holding the key of each row.
+        """
+        self._loaders[name] = (query, key)
+
+    def loader(self, name: str, request: Optional[BaseRequest] = None) -> "Loader":
+        """
+        Loader registered as ``name`` for ``request``.
+
+        Lookups are cached for the lifetime of the request, by default the
+        request handled by the running task.
+        """
+        query, key = self._loaders[name]
+        request = request or current()
+        if request is None:
+            return Loader(self, query, key)
+
+        try:
+            return request[(self, name)]
+        except KeyError:
+            loader = request[(self, name)] = Loader(self, query, key)
+            return loader
 
     async def status(self, timeout: int = 2) -> bool:
         try:
             async with self.connection(timeout=timeout) as con:
                 await con.fetchval("SELECT 1")
-        except asyncio.TimeoutError:
+        except (asyncio.TimeoutError, exceptions.PoolUnavailable):
             return False
         except Exception:
             LOG.exception("PostgreSQL failed status")
@@ -82,47 +190,240 @@ class PG:
 
     async def _startup(self, app: Application) -> None:
         LOG.debug("Starting PostgreSQL engine")
-        self._task = self._loop.create_task(self._connect())
+        self._supervisor.start()
 
     async def _shutdown(self, app: Application) -> None:
         LOG.debug("Shutting down PostgreSQL engine")
-        if self._task and not self._task.done():
-            self._task.cancel()
-
-        if not self._result.done():
-            self._result.cancel()
+        self._supervisor.stop()
 
     async def _cleanup(self, app: Application) -> None:
         LOG.debug("Cleaning up PostgreSQL engine")
+        pool = self._supervisor.current
+        if pool is not None:
+            await asyncio.wait_for(pool.close(), timeout=self._shutdown_timeout)
+
+
+class Connection(asyncpg.Connection):
+    """
+    Connection reporting the duration of its queries to the slow query log.
+
+    Used by :class:`PG` when ``slow_query_threshold`` is set, a custom
+    ``connection_class`` must subclass it for its queries to be reported.
+    """
+
+    _metrics: Optional[PoolMetrics] = None
+
+    async def execute(self, query: str, *args, **kwargs) -> str:
+        start = time.monotonic()
         try:
-            pool = await self._result
-        except asyncio.CancelledError:
-            pass
+            return await super().execute(query, *args, **kwargs)
+        finally:
+            self._query_done(query, start)
+
+    async def executemany(self, command: str, args, **kwargs) -> None:
+        start = time.monotonic()
+        try:
+            return await super().executemany(command, args, **kwargs)
+        finally:
+            self._query_done(command, start)
+
+    async def fetch(self, query: str, *args, **kwargs) -> List[asyncpg.Record]:
+        start = time.monotonic()
+        try:
+            return await super().fetch(query, *args, **kwargs)
+        finally:
+            self._query_done(query, start)
+
+    async def fetchval(self, query: str, *args, **kwargs) -> Any:
+        start = time.monotonic()
+        try:
+            return await super().fetchval(query, *args, **kwargs)
+        finally:
+            self._query_done(query, start)
+
+    async def fetchrow(self, query: str, *args, **kwargs) -> Optional[asyncpg.Record]:
+        start = time.monotonic()
+        try:
+            return await super().fetchrow(query, *args, **kwargs)
+        finally:
+            self._query_done(query, start)
+
+    def _query_done(self, query: str, start: float) -> None:
+        if self._metrics:
+            self._metrics.query(route(), query, time.monotonic() - start)
+
+
+class Loader:
+    """
+    Batch lookups by key.
+
+    Keys requested during the same loop iteration are fetched with a single
+    query. Results are cached, a missing row resolves to ``None``.
+    """
+
+    def __init__(self, pg: PG, query: str, key: str) -> None:
+        self._pg = pg
+        self._query = query
+        self._key = key
+        self._loop = asyncio.get_event_loop()
+        self._cache: Dict[Any, asyncio.Future] = dict()
+        self._batch: Dict[Any, asyncio.Future] = dict()
+
+    async def load(self, key: Any) -> Optional[asyncpg.Record]:
+        future = self._cache.get(key)
+        if future is None:
+            future = self._cache[key] = self._loop.create_future()
+            if not self._batch:
+                self._loop.call_soon(self._dispatch)
+            self._batch[key] = future
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[asyncpg.Record]]:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def clear(self, key: Any = None) -> None:
+        """Drop ``key`` from the cache, or every key if ``None``"""
+        if key is None:
+            self._cache.clear()
         else:
-            await asyncio.wait_for(pool.close(), timeout=self._shutdown_timeout)
+            self._cache.pop(key, None)
+
+    def _dispatch(self) -> None:
+        batch, self._batch = self._batch, dict()
+        self._loop.create_task(self._fetch(batch))
+
+    async def _fetch(self, batch: Dict[Any, asyncio.Future]) -> None:
+        LOG.log(4, "Loading %s keys with: %s", len(batch), self._query)
+        try:
+            async with self._pg.connection() as con:
+                rows = await con.fetch(self._query, list(batch))
+        except Exception as e:
+            for key, future in batch.items():
+                if self._cache.get(key) is future:
+                    del self._cache[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {row[self._key]: row for row in rows}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+async def stream_rows(
+    connection: asyncpg.Connection, query: str, *args, prefetch: int = 100
+) -> AsyncIterator[asyncpg.Record]:
+    """
+    Iterate over the rows of ``query`` with a server side cursor.
+
+    At most ``prefetch`` rows are held in memory. The cursor is opened in a
+    transaction, unless the connection is already in one. Used with the
+    ``pg`` middleware and a :class:`pillars.StreamResponse`, the connection
+    of the request is kept until the response is sent.
+
+    Args:
+        connection: Connection of the cursor, usually ``request["pg_connection"]``.
+        query: Query of the cursor, with its ``args``.
+        prefetch: Number of rows fetched at once.
+    """
+    async with AsyncExitStack() as stack:
+        if not connection.is_in_transaction():
+            await stack.enter_async_context(connection.transaction())
+        async for row in connection.cursor(query, *args, prefetch=prefetch):
+            yield row
+
+
+@dataclass(frozen=True)
+class JSONBackend:
+    """
+    JSON library used by the json and jsonb codecs.
+
+    Args:
+        name: Name of the backend.
+        dumps: Serialize a value to UTF-8 encoded bytes.
+        loads: Deserialize UTF-8 encoded bytes.
+        buffers: ``loads`` accepts a ``memoryview`` and can decode without
+            copying the value.
+    """
 
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Any], Any]
+    buffers: bool = False
+
+
+JSON_BACKENDS: Dict[str, JSONBackend] = {
+    "ujson": JSONBackend(
+        name="ujson",
+        dumps=lambda value: ujson.dumps(value).encode("utf-8"),
+        loads=ujson.loads,
+    ),
+    "json": JSONBackend(
+        name="json",
+        dumps=lambda value: json.dumps(value, separators=(",", ":")).encode("utf-8"),
+        loads=json.loads,
+    ),
+}
+
+if orjson:
+    JSON_BACKENDS["orjson"] = JSONBackend(
+        name="orjson", dumps=orjson.dumps, loads=orjson.loads, buffers=True
+    )
+
+
+async def register_json_codec(
+    con: asyncpg.Connection, backend: Union[str, JSONBackend] = "ujson"
+) -> None:
+    if isinstance(backend, str):
+        backend = JSON_BACKENDS[backend]
 
-async def register_json_codec(con: asyncpg.Connection) -> None:
     await con.set_type_codec(
-        "json", encoder=ujson.dumps, decoder=ujson.loads, schema="pg_catalog"
+        "json",
+        encoder=backend.dumps,
+        decoder=backend.loads,
+        schema="pg_catalog",
+        format="binary",
     )
 
     await con.set_type_codec(
         "jsonb",
-        encoder=jsonb_encoder,
-        decoder=jsonb_decoder,
+        encoder=make_jsonb_encoder(backend),
+        decoder=make_jsonb_decoder(backend),
         schema="pg_catalog",
         format="binary",
     )
 
 
-def jsonb_encoder(value: str) -> bytes:
-    try:
-        return b"\x01" + ujson.dumps(value).encode("utf-8")
-    except Exception:
-        LOG.error("""Unable to encode to JSONB: %s""", value)
-        raise
+def make_jsonb_encoder(backend: JSONBackend) -> Callable[[Any], bytes]:
+    dumps: Callable[[Any], bytes] = backend.dumps  # type: ignore
+
+    def encoder(value: Any) -> bytes:
+        try:
+            return b"\x01" + dumps(value)
+        except Exception:
+            LOG.error("""Unable to encode to JSONB: %s""", value)
+            raise
+
+    return encoder
+
+
+def make_jsonb_decoder(backend: JSONBackend) -> Callable[[bytes], Any]:
+    loads: Callable[[Any], Any] = backend.loads
+
+    # The first byte is the jsonb format version
+    if backend.buffers:
+
+        def decoder(value: bytes) -> Any:
+            return loads(memoryview(value)[1:])
+
+    else:
+
+        def decoder(value: bytes) -> Any:
+            return loads(value[1:])
+
+    return decoder
 
 
-def jsonb_decoder(value: bytes) -> dict:
-    return ujson.loads(value[1:].decode("utf-8"))
+jsonb_encoder = make_jsonb_encoder(JSON_BACKENDS["ujson"])
+jsonb_decoder = make_jsonb_decoder(JSON_BACKENDS["ujson"])
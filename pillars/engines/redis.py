@@ -1,15 +1,26 @@
 import asyncio
+import collections
+import functools
+import hashlib
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Any, Deque, Dict, Optional, Sequence
 
 import aioredis
 import async_timeout
 
+from .. import exceptions
 from ..app import Application
+from ..metrics import Histogram, PoolMetrics
+from ..request import remaining, route
+from .supervisor import PoolState, PoolSupervisor
 
 LOG = logging.getLogger(__name__)
 
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+CONNECTION_ARGS = ("db", "password", "ssl", "encoding", "parser", "connection_cls")
+
 
 class Redis:
     def __init__(
@@ -17,59 +28,125 @@ class Redis:
         app: Application,
         *args,
         reconnection_timeoff: int = 10,
+        reconnection_backoff: float = 0.5,
         shutdown_timeout: int = 5,
+        pipeline_batch: int = 1024,
         **kwargs
     ) -> None:
-        self._loop = asyncio.get_event_loop()
-        self._task: Optional[asyncio.Task] = None
-        self._result: asyncio.Future = asyncio.Future()
         self._connection_info = (args, kwargs)
         self._shutdown_timeout = shutdown_timeout
-        self._reconnection_timeoff = reconnection_timeoff
+        self._metrics = PoolMetrics(kwargs.get("maxsize", 10))
+        self._supervisor = PoolSupervisor(
+            "Redis",
+            self._create_pool,
+            discard=self._discard_pool,
+            backoff_base=reconnection_backoff,
+            backoff_max=reconnection_timeoff,
+        )
+
+        self._pipeline = AutoPipeline(self._supervisor, max_batch=pipeline_batch)
+        self._scripts: Dict[str, Script] = dict()
 
         app.on_startup.append(self._startup)
         app.on_shutdown.append(self._shutdown)
         app.on_cleanup.append(self._cleanup)
 
-    async def _connect(self) -> None:
-        try:
-            pool = await aioredis.create_pool(
-                *self._connection_info[0], **self._connection_info[1]
-            )
-        except ConnectionError:
-            LOG.exception("Redis connection error")
-            await asyncio.sleep(self._reconnection_timeoff)
-            self._task = self._loop.create_task(self._connect())
-        except Exception as e:
-            LOG.exception("Redis connection error")
-            self._result.set_exception(e)
-        else:
-            LOG.info("Redis connection pool created")
-            self._result.set_result(pool)
+    @property
+    def state(self) -> PoolState:
+        return self._supervisor.state
+
+    async def _create_pool(self) -> aioredis.ConnectionsPool:
+        return await aioredis.create_pool(
+            *self._connection_info[0], **self._connection_info[1]
+        )
+
+    async def _discard_pool(self, pool: aioredis.ConnectionsPool) -> None:
+        pool.close()
+        await asyncio.wait_for(pool.wait_closed(), timeout=self._shutdown_timeout)
 
     @asynccontextmanager
     async def connection(self, timeout: int = 5) -> aioredis.RedisConnection:
-        async with async_timeout.timeout(timeout):
-            pool = await asyncio.shield(self._result)
+        """
+        Acquire a connection from the pool.
+
+        Within a request the timeout is bounded by the request deadline.
+        """
+        async with async_timeout.timeout(remaining(timeout)):
+            pool = await self._supervisor.pool()
+            label = route()
+            start = time.monotonic()
+            self._metrics.waiting += 1
             try:
                 connection = await pool.acquire()
-            except ConnectionError:
+            except ConnectionError as e:
                 LOG.debug("Connection error while acquiring connection")
-                self._result = asyncio.Future()
-                self._task = self._loop.create_task(self._connect())
-                pool = await asyncio.shield(self._result)
-                connection = await pool.acquire()
+                self._supervisor.failed(pool, e)
+                raise exceptions.PoolUnavailable("Redis", self.state.value) from e
+            finally:
+                self._metrics.waiting -= 1
+
+            acquired = time.monotonic()
+            self._metrics.acquired(label, acquired - start)
             try:
                 yield connection
             finally:
+                self._metrics.released(label, time.monotonic() - acquired)
                 pool.release(connection)
 
+    async def create_connection(self) -> aioredis.RedisConnection:
+        """
+        Open a connection outside of the pool, for pub/sub or blocking commands.
+
+        The caller is responsible for closing it.
+        """
+        args, kwargs = self._connection_info
+        options = {k: v for k, v in kwargs.items() if k in CONNECTION_ARGS}
+        if "create_connection_timeout" in kwargs:
+            options["timeout"] = kwargs["create_connection_timeout"]
+        return await aioredis.create_connection(*args, **options)
+
+    async def execute(self, command: str, *args, **kwargs) -> Any:
+        """
+        Execute a command through the auto pipeline.
+
+        Commands issued during the same loop iteration are written to a
+        connection held by the pipeline with a single write. Blocking
+        commands, transactions and pub/sub must use :meth:`connection`.
+        Within a request the wait is bounded by the request deadline.
+        """
+        return await asyncio.wait_for(
+            self._pipeline.execute(command, *args, **kwargs), remaining()
+        )
+
+    def register_script(self, name: str, source: str) -> "Script":
+        """
+        Register a Lua script under ``name``.
+
+        The script is loaded on its first call and executed with EVALSHA.
+        """
+        script = self._scripts[name] = Script(self, name, source)
+        return script
+
+    async def eval(
+        self, name: str, keys: Sequence[Any] = (), args: Sequence[Any] = ()
+    ) -> Any:
+        """Call the script registered under ``name``"""
+        return await self._scripts[name](keys, args)
+
+    def metrics(self) -> dict:
+        return {
+            **self._supervisor.stats(),
+            **self._metrics.snapshot(),
+            "pipeline": self._pipeline.metrics(),
+            "scripts": {k: v.metrics() for k, v in self._scripts.items()},
+        }
+
     async def status(self, timeout: int = 2) -> bool:
         try:
             async with self.connection(timeout=timeout) as con:
                 await con.execute("SET", "xxx_STATUS", 1)
                 await con.execute("DEL", "xxx_STATUS", 1)
-        except asyncio.TimeoutError:
+        except (asyncio.TimeoutError, exceptions.PoolUnavailable):
             return False
         except Exception:
             LOG.exception("Redis failed status")
@@ -80,25 +157,186 @@ class Redis:
 
     async def _startup(self, app: Application) -> None:
         LOG.debug("Starting Redis engine")
-        self._task = self._loop.create_task(self._connect())
-        self._result = asyncio.Future()
+        self._supervisor.start()
 
     async def _shutdown(self, app: Application) -> None:
         LOG.debug("Shutting down Redis engine")
-        if self._task and not self._task.done():
-            self._task.cancel()
-
-        if self._result.done():
-            pool = await self._result
+        self._supervisor.stop()
+        self._pipeline.close()
+        pool = self._supervisor.current
+        if pool is not None:
             pool.close()
-        else:
-            self._result.cancel()
 
     async def _cleanup(self, app: Application) -> None:
         LOG.debug("Cleaning up Redis engine")
+        pool = self._supervisor.current
+        if pool is not None:
+            await asyncio.wait_for(pool.wait_closed(), timeout=self._shutdown_timeout)
+
+
+class Script:
+    """
+    Lua script called with EVALSHA.
+
+    The SHA1 digest is computed locally. The script is sent with SCRIPT LOAD
+    before its first call and again whenever Redis replies NOSCRIPT, after a
+    restart or a SCRIPT FLUSH.
+
+    Args:
+        redis: Redis engine executing the script.
+        name: Name used in the metrics.
+        source: Lua source of the script.
+    """
+
+    def __init__(self, redis: Redis, name: str, source: str) -> None:
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        self._redis = redis
+        self._loading: Optional[asyncio.Task] = None
+        self._loaded = False
+        self._latency = Histogram()
+        self._stats: collections.Counter = collections.Counter()
+
+    async def __call__(self, keys: Sequence[Any] = (), args: Sequence[Any] = ()) -> Any:
+        start = time.monotonic()
         try:
-            pool = await self._result
-        except asyncio.CancelledError:
-            pass
+            if not self._loaded:
+                await self._load()
+            try:
+                return await self._evalsha(keys, args)
+            except aioredis.ReplyError as e:
+                if not str(e).startswith("NOSCRIPT"):
+                    raise
+                LOG.debug("Script %s missing from Redis, reloading", self.name)
+                self._loaded = False
+                await self._load()
+                return await self._evalsha(keys, args)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._latency.observe(time.monotonic() - start)
+
+    def metrics(self) -> dict:
+        return {"sha": self.sha, **self._stats, "latency": self._latency.snapshot()}
+
+    async def _evalsha(self, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+        return await self._redis.execute("EVALSHA", self.sha, len(keys), *keys, *args)
+
+    async def _load(self) -> None:
+        # Concurrent calls share a single SCRIPT LOAD
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.get_event_loop().create_task(self._send())
+        await asyncio.shield(self._loading)
+
+    async def _send(self) -> None:
+        await self._redis.execute("SCRIPT", "LOAD", self.source)
+        self._stats["loads"] += 1
+        self._loaded = True
+
+
+class AutoPipeline:
+    """
+    Coalesce commands issued during the same loop iteration.
+
+    Queued commands are written with a single write on a connection held by
+    the pipeline and each reply is routed back to its future.
+
+    Args:
+        supervisor: Supervisor of the pool providing the connection.
+        max_batch: Maximum number of commands per write.
+    """
+
+    def __init__(self, supervisor: PoolSupervisor, *, max_batch: int = 1024) -> None:
+        self._supervisor = supervisor
+        self._max_batch = max_batch
+        self._loop = asyncio.get_event_loop()
+        self._queue: Deque[tuple] = collections.deque()
+        self._scheduled = False
+        self._pool: Optional[aioredis.ConnectionsPool] = None
+        self._connection: Optional[aioredis.RedisConnection] = None
+        self._commands = 0
+        self._batch_size = Histogram(buckets=BATCH_BUCKETS)
+
+    def execute(self, command: str, *args, **kwargs) -> asyncio.Future:
+        future = self._loop.create_future()
+        self._queue.append((future, command, args, kwargs))
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self._flush)
+        return future
+
+    def close(self) -> None:
+        while self._queue:
+            self._queue.popleft()[0].cancel()
+        if self._connection and self._pool:
+            self._pool.release(self._connection)
+        self._connection = self._pool = None
+
+    def metrics(self) -> dict:
+        return {"commands": self._commands, "batch_size": self._batch_size.snapshot()}
+
+    def _flush(self) -> None:
+        if self._connection is None or self._connection.closed:
+            self._loop.create_task(self._connect())
+            return
+
+        self._scheduled = False
+        while self._queue:
+            batch = [
+                self._queue.popleft()
+                for _ in range(min(len(self._queue), self._max_batch))
+            ]
+            self._write(self._connection, batch)
+
+    def _write(self, connection: aioredis.RedisConnection, batch: list) -> None:
+        self._commands += len(batch)
+        self._batch_size.observe(len(batch))
+        with connection._buffered():
+            for future, command, args, kwargs in batch:
+                if future.done():
+                    continue
+                try:
+                    reply = connection.execute(command, *args, **kwargs)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    reply.add_done_callback(functools.partial(_chain, future))
+
+    async def _connect(self) -> None:
+        if self._connection and self._pool:
+            self._pool.release(self._connection)
+        self._connection = self._pool = None
+
+        try:
+            pool = await self._supervisor.pool()
+            try:
+                connection = await pool.acquire()
+            except ConnectionError as e:
+                self._supervisor.failed(pool, e)
+                raise exceptions.PoolUnavailable("Redis", self._supervisor.state.value)
+        except Exception as e:
+            LOG.debug("Auto pipeline connection error: %r", e)
+            self._scheduled = False
+            while self._queue:
+                future = self._queue.popleft()[0]
+                if not future.done():
+                    future.set_exception(e)
         else:
-            await asyncio.wait_for(pool.wait_closed(), timeout=self._shutdown_timeout)
+            self._pool, self._connection = pool, connection
+            self._flush()
+
+
+def _chain(future: asyncio.Future, reply: asyncio.Future) -> None:
+    if reply.cancelled():
+        future.cancel()
+        return
+
+    exception = reply.exception()
+    if future.done():
+        return
+    elif exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(reply.result())
@@ -0,0 +1,169 @@
+import asyncio
+import enum
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from .. import exceptions, utils
+
+LOG = logging.getLogger(__name__)
+
+
+@enum.unique
+class PoolState(enum.Enum):
+    CONNECTING = "connecting"
+    HEALTHY = "healthy"
+    DEGRADED = "degraded"
+    CLOSED = "closed"
+
+
+class PoolSupervisor:
+    """
+    Create and re-create a connection pool on behalf of an engine.
+
+    Only one (re)connection runs at a time. Failed attempts are retried with
+    exponential backoff and jitter. While the pool is degraded callers fail fast
+    with :class:`pillars.exceptions.PoolUnavailable` instead of waiting for
+    their timeout.
+
+    Args:
+        name: Engine name used in logs and errors.
+        create: Coroutine function creating a new pool.
+        discard: Coroutine function closing a pool replaced after a failure.
+        backoff_base: Delay in seconds after the first failed attempt.
+        backoff_max: Upper bound of the delay between two attempts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        create: Callable[[], Awaitable[Any]],
+        *,
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10,
+    ) -> None:
+        self._name = name
+        self._create = create
+        self._discard = discard
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._loop = asyncio.get_event_loop()
+        self._task: Optional[asyncio.Task] = None
+        self._attempted = asyncio.Event()
+        self._pool: Any = None
+        self._state = PoolState.CLOSED
+        self._error: Optional[Exception] = None
+        self._fatal: Optional[Exception] = None
+        self._failures = 0
+        self._reconnections = 0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def state(self) -> PoolState:
+        return self._state
+
+    @property
+    def current(self) -> Any:
+        """Current pool, if any"""
+        return self._pool
+
+    def stats(self) -> dict:
+        return {
+            "state": self._state.value,
+            "failures": self._failures,
+            "reconnections": self._reconnections,
+            "last_error": repr(self._error) if self._error else None,
+        }
+
+    def start(self) -> None:
+        self._fatal = None
+        self._reconnect(PoolState.CONNECTING)
+
+    def stop(self) -> None:
+        self._state = PoolState.CLOSED
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._attempted.set()
+
+    async def pool(self) -> Any:
+        """
+        Return the pool, waiting for the first connection attempt if needed.
+
+        Raises:
+            PoolUnavailable: The pool is degraded or closed.
+        """
+        if self._state is PoolState.CONNECTING:
+            await self._attempted.wait()
+
+        if self._state is PoolState.HEALTHY:
+            return self._pool
+        elif self._fatal:
+            raise self._fatal
+
+        raise exceptions.PoolUnavailable(self._name, self._state.value)
+
+    def failed(self, pool: Any, error: Exception) -> None:
+        """
+        Report a connection error on ``pool``.
+
+        The first report on the current pool starts a reconnection, later ones
+        are ignored.
+        """
+        if pool is not self._pool or self._state is not PoolState.HEALTHY:
+            return
+
+        LOG.warning("%s connection error, reconnecting: %s", self._name, error)
+        self._error = error
+        self._pool = None
+        self._reconnections += 1
+        if self._discard:
+            self._loop.create_task(self._discard_pool(pool))
+        self._reconnect(PoolState.DEGRADED)
+
+    def _reconnect(self, state: PoolState) -> None:
+        if self._task and not self._task.done():
+            return
+
+        self._state = state
+        self._attempted.clear()
+        self._task = self._loop.create_task(self._connect())
+
+    async def _connect(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                pool = await self._create()
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                delay = utils.backoff_delay(
+                    attempt, self._backoff_base, self._backoff_max
+                )
+                LOG.error(
+                    "%s connection error, retrying in %.2fs: %r", self._name, delay, e
+                )
+                attempt += 1
+                self._failures += 1
+                self._error = e
+                self._state = PoolState.DEGRADED
+                self._attempted.set()
+                await asyncio.sleep(delay)
+            except Exception as e:
+                LOG.exception("%s connection error", self._name)
+                self._error = self._fatal = e
+                self._state = PoolState.DEGRADED
+                self._attempted.set()
+                return
+            else:
+                LOG.info("%s connection pool created", self._name)
+                self._pool = pool
+                self._state = PoolState.HEALTHY
+                self._attempted.set()
+                return
+
+    async def _discard_pool(self, pool: Any) -> None:
+        try:
+            await self._discard(pool)  # type: ignore
+        except Exception:
+            LOG.exception("Error closing replaced %s pool", self._name)
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 LOG = logging.getLogger(__name__)
 
@@ -12,6 +13,34 @@ class DataValidationError(Exception):
         self.errors = errors
 
 
+class PayloadTooLarge(Exception):
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"Payload larger than {limit} bytes")
+        self.limit = limit
+
+
+class Overloaded(Exception):
+    """
+    Request rejected by the admission control.
+
+    Args:
+        reason: Cause of the rejection.
+        retry_after: Seconds before a new request could be admitted, if known.
+    """
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
 class NotFound(Exception):
     def __init__(self, item: dict) -> None:
         self.item = item
+
+
+class PoolUnavailable(ConnectionError):
+    def __init__(self, name: str, state: str) -> None:
+        super().__init__(f"{name} connection pool is {state}")
+        self.name = name
+        self.state = state
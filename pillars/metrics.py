@@ -0,0 +1,114 @@
+import bisect
+import collections
+import logging
+import random
+from typing import Deque, Dict, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    Distribution of durations in fixed buckets.
+
+    Args:
+        buckets: Sorted upper bounds of the buckets in seconds.
+    """
+
+    __slots__ = ("_bounds", "_counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        buckets = dict()
+        total = 0
+        for bound, count in zip(self._bounds, self._counts):
+            total += count
+            buckets[str(bound)] = total
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class PoolMetrics:
+    """
+    Usage of a connection pool.
+
+    Acquire wait and hold time are recorded per route, see
+    :func:`pillars.request.route`.
+
+    Args:
+        size: Maximum size of the pool.
+        slow_threshold: Duration in seconds above which a query is slow.
+        slow_sample: Fraction of the slow queries logged.
+        slow_log_size: Number of slow queries kept.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        slow_threshold: Optional[float] = None,
+        slow_sample: float = 1.0,
+        slow_log_size: int = 100,
+    ) -> None:
+        self.size = size
+        self.in_use = 0
+        self.waiting = 0
+        self.acquire_wait: Dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.hold_time: Dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.slow_threshold = slow_threshold
+        self.slow_sample = slow_sample
+        self.slow_queries: Deque[dict] = collections.deque(maxlen=slow_log_size)
+
+    @property
+    def utilisation(self) -> float:
+        return self.in_use / self.size if self.size else 0.0
+
+    def acquired(self, route: str, wait: float) -> None:
+        self.in_use += 1
+        self.acquire_wait[route].observe(wait)
+
+    def released(self, route: str, hold: float) -> None:
+        self.in_use -= 1
+        self.hold_time[route].observe(hold)
+
+    def query(self, route: str, statement: str, duration: float) -> None:
+        if self.slow_threshold is None or duration < self.slow_threshold:
+            return
+        if self.slow_sample < 1 and random.random() >= self.slow_sample:
+            return
+
+        LOG.warning("Slow query (%.3fs) for %s: %s", duration, route, statement)
+        self.slow_queries.append(
+            {"route": route, "statement": statement, "duration": duration}
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "utilisation": self.utilisation,
+            "acquire_wait": {k: v.snapshot() for k, v in self.acquire_wait.items()},
+            "hold_time": {k: v.snapshot() for k, v in self.hold_time.items()},
+            "slow_queries": list(self.slow_queries),
+        }
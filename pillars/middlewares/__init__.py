@@ -1,2 +1,2 @@
-from . import http  # noQa: F401
+from . import admission, http  # noQa: F401
 from .pg import pg  # noQa: F401
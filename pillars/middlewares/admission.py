@@ -0,0 +1,190 @@
+import asyncio
+import collections
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import aiohttp.web
+
+from ..app import Application
+from ..exceptions import Overloaded
+from ..request import BaseRequest
+
+LOG = logging.getLogger(__name__)
+
+
+def _route(request: BaseRequest) -> Hashable:
+    return request.route
+
+
+def _critical(request: BaseRequest) -> bool:
+    return "critical" in (request.config or ())
+
+
+class TokenBucket:
+    """
+    Rate limit of ``rate`` per second, allowing bursts of ``burst``.
+
+    Args:
+        rate: Tokens added per second.
+        burst: Maximum number of tokens.
+        now: Time of creation, the bucket starts full.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token, returns ``0`` or the seconds before one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Reject requests early instead of letting them all time out.
+
+    Rejected requests raise :class:`pillars.exceptions.Overloaded`. The HTTP
+    transport answers with a 503, the FastAGI transport hangs up and the ARI
+    transport drops the event. The middleware works with every transport, add
+    ``AdmissionController(app).middleware`` first to the middlewares of the
+    application. The FastAGI application needs the
+    :func:`pillars.transports.fast_agi.middleware` before it.
+
+    Args:
+        app: Main application, running the event loop lag monitor.
+        rate: Requests per second allowed per key, ``None`` for no limit.
+        burst: Requests allowed at once per key, defaults to ``rate``.
+        key: Key of the rate limit of a request, defaults to its route. For
+            example ``lambda request: request.initial.remote`` to limit each
+            HTTP client.
+        max_keys: Maximum number of rate limited keys, the least recently
+            used is dropped.
+        concurrency: Maximum number of requests handled at once per route.
+        max_pending: Maximum number of requests handled at once, shed first.
+        max_lag: Event loop lag in seconds above which requests are shed.
+        lag_interval: Seconds between two measures of the event loop lag.
+        critical: Requests that are never shed, only rate and concurrency
+            limited. Defaults to the routes with the ``critical`` config.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        *,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        key: Callable[[BaseRequest], Hashable] = _route,
+        max_keys: int = 10000,
+        concurrency: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        max_lag: Optional[float] = None,
+        lag_interval: float = 0.1,
+        critical: Callable[[BaseRequest], bool] = _critical,
+    ) -> None:
+        self._rate = rate
+        self._burst = rate if burst is None else burst
+        self._key = key
+        self._max_keys = max_keys
+        self._concurrency = concurrency
+        self._max_pending = max_pending
+        self._max_lag = max_lag
+        self._lag_interval = lag_interval
+        self._critical = critical
+        self._loop = asyncio.get_event_loop()
+        self._buckets: "collections.OrderedDict[Hashable, TokenBucket]" = (
+            collections.OrderedDict()
+        )
+        self._running: collections.Counter = collections.Counter()
+        self._pending = 0
+        self._lag = 0.0
+        self._expected = 0.0
+        self._probe_handle: Optional[asyncio.TimerHandle] = None
+        self._stats: collections.Counter = collections.Counter()
+
+        if max_lag is not None:
+            app.on_startup.append(self._startup)
+            app.on_shutdown.append(self._shutdown)
+
+    @property
+    def lag(self) -> float:
+        """Last measure of the event loop lag, in seconds"""
+        return self._lag
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self, request: BaseRequest, handler: Callable[[BaseRequest], Awaitable[Any]]
+    ) -> Any:
+        route = request.route
+        try:
+            self._admit(request, route)
+        except Overloaded as e:
+            self._stats[e.reason] += 1
+            LOG.debug("Rejected request %s: %s", route, e.reason)
+            raise
+
+        self._stats["admitted"] += 1
+        self._pending += 1
+        self._running[route] += 1
+        try:
+            return await handler(request)
+        finally:
+            self._pending -= 1
+            self._running[route] -= 1
+            if not self._running[route]:
+                del self._running[route]
+
+    def metrics(self) -> dict:
+        return {"pending": self._pending, "lag": self._lag, **self._stats}
+
+    def _admit(self, request: BaseRequest, route: str) -> None:
+        if not self._critical(request):
+            if self._max_lag is not None and self._lag > self._max_lag:
+                raise Overloaded("event loop lag", retry_after=self._lag)
+            if self._max_pending is not None and self._pending >= self._max_pending:
+                raise Overloaded("too many pending requests")
+
+        if self._concurrency is not None and self._running[route] >= self._concurrency:
+            raise Overloaded("too many concurrent requests")
+
+        if self._rate is not None:
+            wait = self._bucket(self._key(request)).take(self._loop.time())
+            if wait:
+                raise Overloaded("rate limit exceeded", retry_after=wait)
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(
+                self._rate, self._burst, self._loop.time()  # type: ignore
+            )
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _probe(self) -> None:
+        now = self._loop.time()
+        self._lag = max(now - self._expected, 0.0)
+        self._expected = now + self._lag_interval
+        self._probe_handle = self._loop.call_at(self._expected, self._probe)
+
+    async def _startup(self, app: Application) -> None:
+        LOG.debug("Starting event loop lag monitor")
+        self._expected = self._loop.time()
+        self._probe()
+
+    async def _shutdown(self, app: Application) -> None:
+        LOG.debug("Stopping event loop lag monitor")
+        if self._probe_handle is not None:
+            self._probe_handle.cancel()
+            self._probe_handle = None
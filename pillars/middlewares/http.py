@@ -1,13 +1,32 @@
+import asyncio
+import collections
+import functools
+import hashlib
 import logging
-from typing import Awaitable, Callable
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
 
 import aiohttp.web
+from aiohttp import hdrs
+from multidict import CIMultiDict
 
 from .. import exceptions
-from ..request import BaseRequest
+from ..request import BaseRequest, Response
+from ..transports.http import encode_response, overloaded_response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
 
 LOG = logging.getLogger(__name__)
 
+_UNCACHEABLE = {"no-store", "private"}
+_NOT_MODIFIED_HEADERS = (hdrs.ETAG, hdrs.CACHE_CONTROL, hdrs.VARY)
+
 
 @aiohttp.web.middleware
 async def exception_handler(
@@ -21,8 +40,477 @@ async def exception_handler(
         return aiohttp.web.json_response(status=400, data={"errors": e.errors})
     except exceptions.NotFound as e:
         return aiohttp.web.json_response(status=404, data={"item": e.item})
+    except exceptions.PayloadTooLarge as e:
+        return aiohttp.web.json_response(status=413, data={"errors": [str(e)]})
+    except exceptions.Overloaded as e:
+        return overloaded_response(e)
+    except asyncio.CancelledError:
+        raise
     except Exception:
         LOG.exception("Error handling request: %s", request.path)
         return aiohttp.web.json_response(status=500, data={"errors": ["Unknown error"]})
     else:
         return response
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    expires: float
+    etag: str
+    status: int
+    body: bytes
+    headers: CIMultiDict
+
+    def respond(self, if_none_match: Optional[str] = None) -> aiohttp.web.Response:
+        if if_none_match is not None and etag_matches(if_none_match, self.etag):
+            headers = CIMultiDict(
+                (name, value)
+                for name in _NOT_MODIFIED_HEADERS
+                for value in self.headers.getall(name, ())
+            )
+            return aiohttp.web.Response(status=304, headers=headers)
+        return aiohttp.web.Response(
+            status=self.status, body=self.body, headers=self.headers
+        )
+
+
+class ResponseCache:
+    """
+    In-memory cache of the encoded responses of the routes with the ``cache`` config.
+
+    Successful ``GET`` responses are cached by path, query string and the
+    ``vary`` request headers, and also answer ``HEAD`` requests. Responses
+    with a ``no-store`` or ``private`` ``Cache-Control`` are not cached. Cached
+    responses carry an ``ETag``, a matching ``If-None-Match`` is answered with
+    a 304 without running the handler.
+
+    Add ``ResponseCache().middleware`` to the middlewares of the application.
+
+    Args:
+        ttl: Time to live of the responses, in seconds.
+        maxsize: Maximum total size of the cached bodies, in bytes.
+        vary: Request headers the responses depend on.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 5,
+        maxsize: int = 32 * 1024 * 1024,
+        vary: Iterable[str] = (
+            hdrs.ACCEPT,
+            hdrs.ACCEPT_ENCODING,
+            hdrs.AUTHORIZATION,
+            hdrs.COOKIE,
+        ),
+    ) -> None:
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._vary = tuple(vary)
+        self._size = 0
+        self._entries: "collections.OrderedDict[tuple, CachedResponse]" = (
+            collections.OrderedDict()
+        )
+        self._stats: collections.Counter = collections.Counter()
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self,
+        request: BaseRequest,
+        handler: Callable[[BaseRequest], Awaitable[aiohttp.web.StreamResponse]],
+    ) -> aiohttp.web.StreamResponse:
+        if "cache" not in request.config or request.method not in (
+            hdrs.METH_GET,
+            hdrs.METH_HEAD,
+        ):
+            return await handler(request)
+
+        initial = request.initial
+        key = _request_key(initial, self._vary)
+        entry = self._get(key)
+        if entry is not None:
+            self._stats["hits"] += 1
+        else:
+            self._stats["misses"] += 1
+            response = await handler(request)
+            if isinstance(response, Response):
+                response = encode_response(response)
+            if request.method != hdrs.METH_GET:
+                return response
+
+            entry = self._store(key, response)
+            if entry is None:
+                return response
+
+        return entry.respond(initial.headers.get(hdrs.IF_NONE_MATCH))
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop the responses of ``path``, or every response if ``None``"""
+        for key in list(self._entries):
+            if path is None or key[0] == path:
+                self._evict(key)
+
+    def metrics(self) -> dict:
+        return {"size": len(self._entries), "bytes": self._size, **self._stats}
+
+    def _get(self, key: tuple) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(
+        self, key: tuple, response: aiohttp.web.StreamResponse
+    ) -> Optional[CachedResponse]:
+        shared = SharedResponse.share(response)
+        if shared is None or shared.status != 200 or len(shared.body) > self._maxsize:
+            return None
+        elif _UNCACHEABLE & _cache_directives(shared.headers):
+            return None
+
+        etag = shared.headers.setdefault(
+            hdrs.ETAG, f'"{hashlib.blake2b(shared.body, digest_size=16).hexdigest()}"'
+        )
+        entry = CachedResponse(
+            expires=time.monotonic() + self._ttl,
+            etag=etag,
+            status=shared.status,
+            body=shared.body,
+            headers=shared.headers,
+        )
+
+        self._evict(key)
+        self._entries[key] = entry
+        self._size += len(entry.body)
+        while self._size > self._maxsize:
+            self._evict(next(iter(self._entries)))
+        return entry
+
+    def _evict(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.body)
+
+
+class Coalescer:
+    """
+    Merge identical concurrent requests to the routes with the ``coalesce`` config.
+
+    While a ``GET`` request is handled, identical requests wait for its
+    response instead of running the handler. Requests are identical if their
+    path, query string and ``vary`` headers are. An error of the handler is
+    raised to every waiting request. If the response can not be shared, like
+    a streamed response, or the first request is cancelled, the waiting
+    requests run the handler.
+
+    Add ``Coalescer().middleware`` to the middlewares of the application,
+    after the ``ResponseCache`` one if any.
+
+    Args:
+        vary: Request headers the responses depend on.
+    """
+
+    def __init__(
+        self,
+        *,
+        vary: Iterable[str] = (
+            hdrs.ACCEPT,
+            hdrs.ACCEPT_ENCODING,
+            hdrs.AUTHORIZATION,
+            hdrs.COOKIE,
+        ),
+    ) -> None:
+        self._vary = tuple(vary)
+        self._inflight: Dict[tuple, asyncio.Future] = dict()
+        self._stats: collections.Counter = collections.Counter()
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self,
+        request: BaseRequest,
+        handler: Callable[[BaseRequest], Awaitable[aiohttp.web.StreamResponse]],
+    ) -> aiohttp.web.StreamResponse:
+        if "coalesce" not in request.config or request.method != hdrs.METH_GET:
+            return await handler(request)
+
+        key = _request_key(request.initial, self._vary)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            shared = await asyncio.shield(inflight)
+            if shared is None:
+                return await handler(request)
+            return shared.respond()
+
+        self._stats["handled"] += 1
+        inflight = self._inflight[key] = asyncio.get_event_loop().create_future()
+        try:
+            response = await handler(request)
+        except asyncio.CancelledError:
+            inflight.set_result(None)
+            raise
+        except Exception as e:
+            inflight.set_exception(e)
+            # Retrieved in case no request is waiting
+            inflight.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        if isinstance(response, Response):
+            response = encode_response(response)
+        inflight.set_result(SharedResponse.share(response))
+        return response
+
+    def metrics(self) -> dict:
+        return {"inflight": len(self._inflight), **self._stats}
+
+
+@dataclass(frozen=True)
+class SharedResponse:
+    """Encoded response, sent to several requests"""
+
+    status: int
+    body: bytes
+    headers: CIMultiDict
+
+    @classmethod
+    def share(cls, response: aiohttp.web.StreamResponse) -> Optional["SharedResponse"]:
+        body = _shareable_body(response)
+        if body is None:
+            return None
+        headers = CIMultiDict(response.headers)
+        headers.popall(hdrs.CONTENT_LENGTH, None)
+        return cls(status=response.status, body=body, headers=headers)
+
+    def respond(self) -> aiohttp.web.Response:
+        return aiohttp.web.Response(
+            status=self.status, body=self.body, headers=self.headers
+        )
+
+
+def _request_key(request: aiohttp.web.Request, vary: Tuple[str, ...]) -> tuple:
+    return (request.path, request.query_string) + tuple(
+        request.headers.get(header) for header in vary
+    )
+
+
+def _cache_directives(headers: CIMultiDict) -> set:
+    return {
+        directive.split("=", 1)[0].strip().lower()
+        for value in headers.getall(hdrs.CACHE_CONTROL, ())
+        for directive in value.split(",")
+    }
+
+
+def _shareable_body(response: aiohttp.web.StreamResponse) -> Optional[bytes]:
+    if not isinstance(response, aiohttp.web.Response):
+        return None
+    if response.cookies or hdrs.SET_COOKIE in response.headers:
+        return None
+    elif not isinstance(response.body, bytes):
+        return None
+    return response.body
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """``etag`` is matched by the ``If-None-Match`` header, with weak comparison"""
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _deflate(body: bytes, level: int) -> bytes:
+    return zlib.compress(body, level)
+
+
+# Content codings in order of preference
+COMPRESSORS: Dict[str, Callable[[bytes, int], bytes]] = {
+    "gzip": _gzip,
+    "deflate": _deflate,
+}
+
+if brotli:
+    COMPRESSORS = {
+        "br": lambda body, level: brotli.compress(body, quality=level),
+        **COMPRESSORS,
+    }
+
+COMPRESSIBLE_TYPES = frozenset(
+    ("application/json", "application/javascript", "application/xml")
+)
+
+
+class Compression:
+    """
+    Compress the responses with the content coding negotiated from ``Accept-Encoding``.
+
+    Bodies smaller than ``threshold`` are sent as is, bodies larger than
+    ``executor_threshold`` are compressed in the default executor. The
+    compressed bodies of responses with an ``ETag``, like the ones of
+    :class:`ResponseCache`, are kept per path and query string and reused.
+    Their ``ETag`` becomes weak.
+
+    Add ``Compression().middleware`` to the middlewares of the application,
+    before the ``ResponseCache`` one so the cache holds a single copy of the
+    responses, and remove ``Accept-Encoding`` from the ``vary`` of the cache.
+
+    Args:
+        threshold: Minimum size of the compressed bodies, in bytes.
+        level: Compression level, from 1 to 9.
+        executor_threshold: Minimum size of the bodies compressed in the
+            default executor, in bytes.
+        maxsize: Maximum total size of the kept compressed bodies, in bytes.
+        encodings: Content codings offered, in order of preference.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: int = 1024,
+        level: int = 6,
+        executor_threshold: int = 256 * 1024,
+        maxsize: int = 32 * 1024 * 1024,
+        encodings: Optional[Iterable[str]] = None,
+    ) -> None:
+        self._threshold = threshold
+        self._level = level
+        self._executor_threshold = executor_threshold
+        self._maxsize = maxsize
+        self._encodings = tuple(COMPRESSORS if encodings is None else encodings)
+        self._size = 0
+        self._compressed: "collections.OrderedDict[Tuple[str, str, str, str], bytes]" = (
+            collections.OrderedDict()
+        )
+        self._stats: collections.Counter = collections.Counter()
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self,
+        request: BaseRequest,
+        handler: Callable[[BaseRequest], Awaitable[aiohttp.web.StreamResponse]],
+    ) -> aiohttp.web.StreamResponse:
+        response = await handler(request)
+        if isinstance(response, Response):
+            response = encode_response(response)
+
+        body = _compressible_body(response, self._threshold)
+        if body is None:
+            return response
+
+        _add_vary(response.headers, hdrs.ACCEPT_ENCODING)
+        coding = negotiate_encoding(
+            request.initial.headers.get(hdrs.ACCEPT_ENCODING, ""), self._encodings
+        )
+        if coding is None:
+            return response
+
+        etag = response.headers.get(hdrs.ETAG)
+        # An ETag only identifies a body within its resource
+        key = None
+        if etag is not None:
+            initial = request.initial
+            key = (initial.path, initial.query_string, etag, coding)
+        response.body = await self._compress(body, coding, key)  # type: ignore
+        response.headers.popall(hdrs.CONTENT_LENGTH, None)
+        response.headers[hdrs.CONTENT_ENCODING] = coding
+        if etag is not None and not etag.startswith("W/"):
+            response.headers[hdrs.ETAG] = "W/" + etag
+        return response
+
+    def metrics(self) -> dict:
+        return {"size": len(self._compressed), "bytes": self._size, **self._stats}
+
+    async def _compress(
+        self, body: bytes, coding: str, key: Optional[Tuple[str, str, str, str]]
+    ) -> bytes:
+        if key is not None:
+            kept = self._compressed.get(key)
+            if kept is not None:
+                self._compressed.move_to_end(key)
+                self._stats["hits"] += 1
+                return kept
+
+        self._stats[coding] += 1
+        compress = functools.partial(COMPRESSORS[coding], body, self._level)
+        if len(body) >= self._executor_threshold:
+            compressed = await asyncio.get_event_loop().run_in_executor(None, compress)
+        else:
+            compressed = compress()
+
+        if key is not None and len(compressed) <= self._maxsize:
+            self._compressed[key] = compressed
+            self._size += len(compressed)
+            while self._size > self._maxsize:
+                self._size -= len(self._compressed.popitem(last=False)[1])
+        return compressed
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """
+    Preferred content coding of ``encodings`` accepted by the client.
+
+    Codings are chosen by quality value, then in the order of ``encodings``.
+    Returns ``None`` if the body should not be compressed.
+    """
+    qualities = dict()
+    for item in accept_encoding.lower().split(","):
+        coding, _, parameters = item.partition(";")
+        quality = 1.0
+        name, _, value = parameters.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = qualities.get(coding, default)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _compressible_body(
+    response: aiohttp.web.StreamResponse, threshold: int
+) -> Optional[bytes]:
+    if not isinstance(response, aiohttp.web.Response) or response.status != 200:
+        return None
+    body = response.body
+    if not isinstance(body, bytes) or len(body) < threshold:
+        return None
+    if hdrs.CONTENT_ENCODING in response.headers:
+        return None
+
+    content_type = response.content_type
+    if content_type.startswith("text/") or content_type.endswith("+json"):
+        return body
+    if content_type in COMPRESSIBLE_TYPES:
+        return body
+    return None
+
+
+def _add_vary(headers: CIMultiDict, header: str) -> None:
+    vary = headers.get(hdrs.VARY)
+    if vary is None:
+        headers[hdrs.VARY] = header
+    elif header.lower() not in vary.lower():
+        headers[hdrs.VARY] = f"{vary}, {header}"
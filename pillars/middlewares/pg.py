@@ -1,7 +1,7 @@
 import contextlib
 from typing import Any, Awaitable, Callable
 
-from ..request import BaseRequest
+from ..request import BaseRequest, StreamResponse
 
 
 async def pg(request: BaseRequest, handler: Callable[[BaseRequest], Awaitable[Any]]):
@@ -16,4 +16,8 @@ async def pg(request: BaseRequest, handler: Callable[[BaseRequest], Awaitable[An
             )
             await stack.enter_async_context(request["pg_connection"].transaction())
 
-    return await handler(request)
+        response = await handler(request)
+        if isinstance(response, StreamResponse):
+            # Keep the connection until the records are streamed
+            response.stack.push_async_exit(stack.pop_all())
+        return response
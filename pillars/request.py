@@ -1,18 +1,79 @@
+import asyncio
 import collections
+import contextlib
+import contextvars
 import json
 import logging
 import uuid
 from dataclasses import dataclass, field
-from typing import Any, Optional, Type
+from typing import Any, AsyncIterable, Dict, Optional, Sequence, Type
 
 LOG = logging.getLogger(__name__)
 
+_current: contextvars.ContextVar = contextvars.ContextVar("request", default=None)
+
+
+def current() -> Optional["BaseRequest"]:
+    """Request handled by the running task, if any"""
+    return _current.get()
+
+
+def remaining(timeout: Optional[float] = None) -> Optional[float]:
+    """
+    Time left before the deadline of the current request.
+
+    Args:
+        timeout: Upper bound of the result, also returned when there is no
+            deadline.
+    """
+    request = _current.get()
+    if request is None:
+        return timeout
+    return request.remaining(timeout)
+
+
+def route() -> str:
+    """Route of the current request, ``-`` outside of a request"""
+    request = _current.get()
+    if request is None:
+        return "-"
+    return request.route
+
 
 class BaseRequest:
-    def __init__(self, app_state: collections.ChainMap) -> None:
+    def __init__(
+        self, app_state: collections.ChainMap, timeout: Optional[float] = None
+    ) -> None:
         self.id = uuid.uuid4()
+        self.deadline: Optional[float] = None
         self._state = app_state.new_child()
 
+        if timeout is not None:
+            self.set_timeout(timeout)
+        _current.set(self)
+
+    def set_timeout(self, timeout: float) -> None:
+        """Set the deadline ``timeout`` seconds from now, unless it is already closer"""
+        deadline = asyncio.get_event_loop().time() + timeout
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def remaining(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Time left before the request deadline.
+
+        Args:
+            timeout: Upper bound of the result, also returned when there is no
+                deadline.
+        """
+        if self.deadline is None:
+            return timeout
+
+        left = max(self.deadline - asyncio.get_event_loop().time(), 0.0)
+        if timeout is None:
+            return left
+        return min(left, timeout)
+
     # MutableMapping API
     def __eq__(self, other):
         return self is other
@@ -51,9 +112,55 @@ class BaseRequest:
     def path(self) -> str:
         raise NotImplementedError()
 
+    @property
+    def route(self) -> str:
+        """Name of the route handling the request, used to label metrics"""
+        return self.path
+
 
 @dataclass
 class Response:
     status: int
     data: dict = field(default_factory=dict)
     json_encoder: Type[json.JSONEncoder] = field(default=json.JSONEncoder)
+
+
+@dataclass
+class StreamResponse:
+    """
+    Response encoding the records of an async iterator as they are produced.
+
+    Args:
+        status: Status of the response.
+        records: Records of the response.
+        format: ``ndjson``, ``json`` for a JSON array, ``csv`` or ``sse`` for
+            Server-Sent Events.
+        columns: Columns of the CSV records, written as the first line.
+            Defaults to the keys of the first record if it is a mapping.
+        headers: Additional headers of the response.
+        stack: Exited once the response is sent, middlewares push the cleanup
+            of the resources used by ``records`` on it.
+    """
+
+    status: int
+    records: AsyncIterable[Any]
+    format: str = "ndjson"
+    columns: Optional[Sequence[str]] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    json_encoder: Type[json.JSONEncoder] = field(default=json.JSONEncoder)
+    stack: contextlib.AsyncExitStack = field(default_factory=contextlib.AsyncExitStack)
+
+
+@dataclass
+class ServerSentEvent:
+    """
+    Event of a ``sse`` :class:`StreamResponse`.
+
+    Other records are sent as events with only data. The data is JSON
+    encoded unless it is a string.
+    """
+
+    data: Any
+    event: Optional[str] = None
+    id: Optional[str] = None
+    retry: Optional[int] = None
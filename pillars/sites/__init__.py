@@ -1,3 +1,4 @@
 from .datagram import DatagramSockSite, DatagramUnixSite, UDPSite  # noQa: F401
+from .loopback import DatagramLoopbackSite, LoopbackSite, WSLoopbackSite  # noQa: F401
 from .protocol import ProtocolType, SockSite, TCPSite, UnixSite  # noQa: F401
-from .websocket import WSClientSite  # noQa: F401
+from .websocket import WSClientSite, WSServerSite  # noQa: F401
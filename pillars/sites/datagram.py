@@ -1,9 +1,13 @@
 import asyncio
+import collections
 import logging
 import os
 import socket
 import stat
-from typing import Optional
+import struct
+import sys
+import time
+from typing import Any, Callable, List, Optional, Tuple
 
 from aiohttp.web_runner import (  # noQa: F401
     BaseRunner,
@@ -17,23 +21,299 @@ from .protocol import ProtocolType
 
 LOG = logging.getLogger(__name__)
 
+# Not exposed by the socket module, see socket(7)
+SO_RXQ_OVFL = getattr(
+    socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None
+)
+DROPS_LOG_INTERVAL = 10
+
 
 class DatagramServer:
     """
     Shim to present a unified server interface.
     """
 
-    def __init__(self, transport: asyncio.DatagramTransport) -> None:
-        self.transport = transport
+    def __init__(self, transports: List[asyncio.DatagramTransport]) -> None:
+        self.transports = transports
+
+    @property
+    def transport(self) -> asyncio.DatagramTransport:
+        return self.transports[0]
 
     def close(self) -> None:
-        self.transport.close()
+        for transport in self.transports:
+            transport.close()
 
     async def wait_closed(self) -> None:
         pass
 
 
-class UDPSite(BaseSite):
+class BatchDatagramTransport(asyncio.DatagramTransport):
+    """
+    Datagram transport draining its socket on each readiness event.
+
+    The datagrams read at once are delivered together to
+    ``protocol.datagrams_received`` as a list of ``(data, addr)`` pairs.
+    Protocols without it receive them one by one through
+    ``datagram_received``.
+
+    Args:
+        sock: Bound datagram socket.
+        protocol: Protocol receiving the datagrams.
+        batch_size: Maximum number of datagrams read per readiness event.
+        max_size: Maximum size of a datagram.
+        track_drops: Count the datagrams dropped by the kernel because the
+            receive buffer was full, Linux only.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        protocol: asyncio.DatagramProtocol,
+        *,
+        batch_size: int = 64,
+        max_size: int = 65536,
+        track_drops: bool = False,
+    ) -> None:
+        super().__init__(extra={"socket": sock, "sockname": sock.getsockname()})
+        sock.setblocking(False)
+        self._loop = asyncio.get_event_loop()
+        self._sock = sock
+        self._protocol = protocol
+        self._batch_size = batch_size
+        self._max_size = max_size
+        self._closing = False
+        self._paused = False
+        self._received = 0
+        self._drops = 0
+        self._drops_logged = (0.0, 0)
+
+        if track_drops:
+            if SO_RXQ_OVFL is None:
+                raise RuntimeError("Kernel drop accounting is not supported")
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self._ancillary_size = socket.CMSG_SPACE(4)
+            self._read_ready = self._read_ready_with_drops  # type: ignore
+
+        if hasattr(protocol, "datagrams_received"):
+            self._deliver: Callable[[List[Tuple[bytes, Any]]], None] = getattr(
+                protocol, "datagrams_received"
+            )
+        else:
+            self._deliver = self._deliver_one_by_one
+
+        self._loop.call_soon(protocol.connection_made, self)
+        self._loop.call_soon(self._add_reader)
+
+    @property
+    def drops(self) -> int:
+        return self._drops
+
+    def metrics(self) -> dict:
+        return {"received": self._received, "drops": self._drops}
+
+    def _add_reader(self) -> None:
+        if not self._closing and not self._paused:
+            self._loop.add_reader(self._sock.fileno(), self._read_ready)
+
+    def _read_ready(self) -> None:
+        batch: List[Tuple[bytes, Any]] = list()
+        recvfrom = self._sock.recvfrom
+        try:
+            while len(batch) < self._batch_size:
+                batch.append(recvfrom(self._max_size))
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self._protocol.error_received(e)
+
+        if batch:
+            self._received += len(batch)
+            self._deliver(batch)
+
+    def _read_ready_with_drops(self) -> None:
+        batch: List[Tuple[bytes, Any]] = list()
+        recvmsg = self._sock.recvmsg
+        drops = None
+        try:
+            while len(batch) < self._batch_size:
+                data, ancdata, flags, addr = recvmsg(
+                    self._max_size, self._ancillary_size
+                )
+                batch.append((data, addr))
+                for level, type_, value in ancdata:
+                    if level == socket.SOL_SOCKET and type_ == SO_RXQ_OVFL:
+                        drops = struct.unpack("=I", value[:4])[0]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self._protocol.error_received(e)
+
+        # The kernel reports the number of drops since the socket creation
+        if drops is not None and drops != self._drops:
+            self._drops = drops
+            self._log_drops()
+
+        if batch:
+            self._received += len(batch)
+            self._deliver(batch)
+
+    def _log_drops(self) -> None:
+        now = time.monotonic()
+        last, logged = self._drops_logged
+        if now - last >= DROPS_LOG_INTERVAL:
+            LOG.warning(
+                "%s datagrams dropped by the kernel on %s",
+                self._drops - logged,
+                self.get_extra_info("sockname"),
+            )
+            self._drops_logged = (now, self._drops)
+
+    def _deliver_one_by_one(self, batch: List[Tuple[bytes, Any]]) -> None:
+        for data, addr in batch:
+            self._protocol.datagram_received(data, addr)
+
+    def sendto(self, data: Any, addr: Any = None) -> None:
+        try:
+            if addr is None:
+                self._sock.send(data)
+            else:
+                self._sock.sendto(data, addr)
+        except OSError as e:
+            self._protocol.error_received(e)
+
+    def pause_reading(self) -> None:
+        if self._closing or self._paused:
+            return
+        self._paused = True
+        self._loop.remove_reader(self._sock.fileno())
+
+    def resume_reading(self) -> None:
+        if self._closing or not self._paused:
+            return
+        self._paused = False
+        self._add_reader()
+
+    def is_reading(self) -> bool:
+        return not self._paused and not self._closing
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def get_protocol(self) -> asyncio.BaseProtocol:
+        return self._protocol
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._sock.fileno())
+        self._loop.call_soon(self._call_connection_lost)
+
+    def abort(self) -> None:
+        self.close()
+
+    def _call_connection_lost(self) -> None:
+        try:
+            self._protocol.connection_lost(None)
+        finally:
+            self._sock.close()
+
+
+class _DatagramSite(BaseSite):
+    def __init__(
+        self,
+        runner: BaseRunner,
+        *,
+        shutdown_timeout: float = 60.0,
+        batch_size: Optional[int] = None,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        track_drops: bool = False,
+    ) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._batch_size = batch_size
+        self._rcvbuf = rcvbuf
+        self._sndbuf = sndbuf
+        self._track_drops = track_drops
+        self._protocol_type = ProtocolType.DATAGRAM
+
+    def metrics(self) -> dict:
+        if self._server is None:
+            return dict()
+
+        sockets = list()
+        totals: collections.Counter = collections.Counter()
+        for transport in self._server.transports:  # type: ignore
+            sock = transport.get_extra_info("socket")
+            if transport.is_closing() or sock is None:
+                continue
+            metrics = {
+                "rcvbuf": sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                "sndbuf": sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+            }
+            if isinstance(transport, BatchDatagramTransport):
+                metrics.update(transport.metrics())
+                totals.update(transport.metrics())
+            sockets.append(metrics)
+
+        return {**totals, "sockets": sockets}
+
+    async def status(self) -> bool:
+        return self._server is not None and not any(
+            transport.is_closing()
+            for transport in self._server.transports  # type: ignore
+        )
+
+    def _configure(self, sock: socket.socket) -> None:
+        if self._rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._rcvbuf)
+        if self._sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._sndbuf)
+
+    async def _serve(self, sockets: List[socket.socket]) -> None:
+        transports = list()
+        for sock in sockets:
+            self._configure(sock)
+            transport: asyncio.BaseTransport
+            if self._batch_size or self._track_drops:
+                transport = BatchDatagramTransport(
+                    sock,
+                    self._runner.server(),  # type: ignore
+                    batch_size=self._batch_size or 1,
+                    track_drops=self._track_drops,
+                )
+            else:
+                loop = asyncio.get_event_loop()
+                transport, protocol = await loop.create_datagram_endpoint(
+                    self._runner.server, sock=sock  # type: ignore
+                )
+            transports.append(transport)
+        self._server = DatagramServer(transports)  # type: ignore
+
+
+class UDPSite(_DatagramSite):
+    """
+    Datagram site bound to a UDP address.
+
+    Args:
+        runner: Runner of the application.
+        host: Bound address.
+        port: Bound port.
+        batch_size: Read up to ``batch_size`` datagrams per readiness event
+            and deliver them together, see :class:`BatchDatagramTransport`.
+        rcvbuf: Size of the receive buffer (SO_RCVBUF), the kernel doubles it
+            and caps it to ``net.core.rmem_max``.
+        sndbuf: Size of the send buffer (SO_SNDBUF).
+        sockets: Number of sockets bound to the address with SO_REUSEPORT,
+            the kernel spreads the datagrams between them by source address.
+        track_drops: Count the datagrams dropped by the kernel (SO_RXQ_OVFL),
+            reported in :meth:`metrics`. Linux only.
+    """
+
     def __init__(
         self,
         runner: BaseRunner,
@@ -42,9 +322,21 @@ class UDPSite(BaseSite):
         *,
         shutdown_timeout: float = 60.0,
         reuse_address: Optional[bool] = None,
-        reuse_port=Optional[bool],
+        reuse_port: Optional[bool] = None,
+        batch_size: Optional[int] = None,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        sockets: int = 1,
+        track_drops: bool = False,
     ) -> None:
-        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        super().__init__(
+            runner,
+            shutdown_timeout=shutdown_timeout,
+            batch_size=batch_size,
+            rcvbuf=rcvbuf,
+            sndbuf=sndbuf,
+            track_drops=track_drops,
+        )
 
         if host is None:
             host = "0.0.0.0"
@@ -53,8 +345,8 @@ class UDPSite(BaseSite):
             port = 8443 if self._ssl_context else 8080
         self._port = port
         self._reuse_address = reuse_address
-        self._reuse_port = reuse_port
-        self._protocol_type = ProtocolType.DATAGRAM
+        self._reuse_port = reuse_port or sockets > 1
+        self._sockets = sockets
 
     @property
     def name(self) -> str:
@@ -65,22 +357,50 @@ class UDPSite(BaseSite):
         loop = asyncio.get_event_loop()
 
         if self._runner.server:
-            transport, protocol = await loop.create_datagram_endpoint(
-                self._runner.server,
-                local_addr=(self._host, self._port),
-                reuse_address=self._reuse_address,
-                reuse_port=self._reuse_port,
-            )  # type: ignore
-            self._server = DatagramServer(transport)  # type: ignore
+            family, type_, proto, _, address = (
+                await loop.getaddrinfo(self._host, self._port, type=socket.SOCK_DGRAM)
+            )[0]
+
+            sockets: List[socket.socket] = list()
+            try:
+                for _ in range(self._sockets):
+                    sock = socket.socket(family, type_, proto)
+                    sockets.append(sock)
+                    if self._reuse_address:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    if self._reuse_port:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                    sock.bind(address)
+                    # Bind the next sockets to the port picked for the first one
+                    address = sock.getsockname()
+            except OSError:
+                for sock in sockets:
+                    sock.close()
+                raise
+            await self._serve(sockets)
 
 
-class DatagramUnixSite(BaseSite):
+class DatagramUnixSite(_DatagramSite):
     def __init__(
-        self, runner: BaseRunner, path: str, *, shutdown_timeout: float = 60.0
+        self,
+        runner: BaseRunner,
+        path: str,
+        *,
+        shutdown_timeout: float = 60.0,
+        batch_size: Optional[int] = None,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        track_drops: bool = False,
     ) -> None:
-        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        super().__init__(
+            runner,
+            shutdown_timeout=shutdown_timeout,
+            batch_size=batch_size,
+            rcvbuf=rcvbuf,
+            sndbuf=sndbuf,
+            track_drops=track_drops,
+        )
         self._path = path
-        self._protocol_type = ProtocolType.DATAGRAM
 
     @property
     def name(self) -> str:
@@ -90,11 +410,13 @@ class DatagramUnixSite(BaseSite):
         await super().start()
         await self._clean_stale_unix_socket(self._path)
 
-        loop = asyncio.get_event_loop()
-        transport, protocol = await loop.create_datagram_endpoint(  # type: ignore
-            self._runner.server, family=socket.AF_UNIX, local_addr=self._path
-        )
-        self._server = DatagramServer(transport)  # type: ignore
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self._path)
+        except OSError:
+            sock.close()
+            raise
+        await self._serve([sock])
 
     @staticmethod
     async def _clean_stale_unix_socket(path: str) -> None:
@@ -111,11 +433,26 @@ class DatagramUnixSite(BaseSite):
                 )
 
 
-class DatagramSockSite(BaseSite):
+class DatagramSockSite(_DatagramSite):
     def __init__(
-        self, runner: BaseRunner, sock: socket.socket, *, shutdown_timeout: float = 60.0
+        self,
+        runner: BaseRunner,
+        sock: socket.socket,
+        *,
+        shutdown_timeout: float = 60.0,
+        batch_size: Optional[int] = None,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        track_drops: bool = False,
     ) -> None:
-        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        super().__init__(
+            runner,
+            shutdown_timeout=shutdown_timeout,
+            batch_size=batch_size,
+            rcvbuf=rcvbuf,
+            sndbuf=sndbuf,
+            track_drops=track_drops,
+        )
         self._sock = sock
 
         if hasattr(socket, "AF_UNIX") and sock.family == socket.AF_UNIX:
@@ -125,7 +462,6 @@ class DatagramSockSite(BaseSite):
             name = f"UDP://{host}:{port}"
 
         self._name = name
-        self._protocol_type = ProtocolType.DATAGRAM
 
     @property
     def name(self) -> str:
@@ -133,10 +469,5 @@ class DatagramSockSite(BaseSite):
 
     async def start(self) -> None:
         await super().start()
-        loop = asyncio.get_event_loop()
-
         if self._runner.server:
-            transport, protocol = await loop.create_datagram_endpoint(
-                self._runner.server, sock=self._sock
-            )  # type: ignore
-            self._server = DatagramServer(transport)  # type: ignore
+            await self._serve([self._sock])
@@ -0,0 +1,369 @@
+import asyncio
+import collections
+import itertools
+import logging
+from typing import Any, Callable, Deque, List, Optional, Tuple, Union
+
+import aiohttp
+import aiohttp.http_websocket
+import ujson
+
+from ..base import BaseRunner, BaseSite
+from .protocol import ProtocolType
+from .websocket import WSProtocol, WSTransport
+
+LOG = logging.getLogger(__name__)
+
+_peers = itertools.count(1)
+
+
+class LoopbackServer:
+    """
+    Shim to present a unified server interface.
+    """
+
+    def __init__(self) -> None:
+        self.transports: List[asyncio.BaseTransport] = list()
+
+    def close(self) -> None:
+        for transport in list(self.transports):
+            transport.close()
+
+    async def wait_closed(self) -> None:
+        # Let the scheduled connection_lost callbacks run
+        await asyncio.sleep(0)
+
+
+class LoopbackTransport(asyncio.Transport):
+    """
+    One end of an in-memory stream connection.
+
+    Writes are delivered to the protocol of the other end on the next loop
+    iteration, in order.
+    """
+
+    def __init__(
+        self,
+        protocol: asyncio.Protocol,
+        *,
+        peername: Any,
+        server: Optional[LoopbackServer] = None,
+    ) -> None:
+        super().__init__(extra={"peername": peername, "sockname": "loopback"})
+        self._loop = asyncio.get_event_loop()
+        self._protocol = protocol
+        self._server = server
+        self._peer: Optional["LoopbackTransport"] = None
+        self._closing = False
+        self._paused = False
+        self._pending: Deque[Optional[bytes]] = collections.deque()
+
+    def get_protocol(self) -> asyncio.BaseProtocol:
+        return self._protocol
+
+    def set_protocol(self, protocol: asyncio.BaseProtocol) -> None:
+        self._protocol = protocol  # type: ignore
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def is_reading(self) -> bool:
+        return not self._paused
+
+    def pause_reading(self) -> None:
+        self._paused = True
+
+    def resume_reading(self) -> None:
+        self._paused = False
+        while self._pending and not self._paused:
+            self._feed(self._pending.popleft())
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        if self._closing or self._peer is None:
+            return
+        self._loop.call_soon(self._peer._receive, bytes(data))
+
+    def write_eof(self) -> None:
+        if self._peer is not None:
+            self._loop.call_soon(self._peer._receive, None)
+
+    def can_write_eof(self) -> bool:
+        return True
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.call_soon(self._protocol.connection_lost, None)
+        if self._peer is not None:
+            self._loop.call_soon(self._peer.close)
+        if self._server is not None:
+            self._server.transports.remove(self)
+
+    def abort(self) -> None:
+        self.close()
+
+    def _receive(self, data: Optional[bytes]) -> None:
+        if self._closing:
+            return
+        elif self._paused:
+            self._pending.append(data)
+        else:
+            self._feed(data)
+
+    def _feed(self, data: Optional[bytes]) -> None:
+        if data is None:
+            if not self._protocol.eof_received():
+                self.close()
+        else:
+            self._protocol.data_received(data)
+
+
+class LoopbackSite(BaseSite):
+    """
+    Stream site connected in memory, without sockets.
+
+    Clients connect with :meth:`connect` or :meth:`open_connection`.
+    """
+
+    def __init__(self, runner: BaseRunner, *, shutdown_timeout: float = 60.0) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._protocol_type = ProtocolType.STREAM
+
+    @property
+    def name(self) -> str:
+        return f"loopback://{id(self):x}"
+
+    async def start(self) -> None:
+        await super().start()
+        self._server = LoopbackServer()
+
+    async def connect(
+        self, protocol_factory: Callable[[], asyncio.Protocol]
+    ) -> Tuple[LoopbackTransport, asyncio.Protocol]:
+        """Open a connection, like :meth:`asyncio.AbstractEventLoop.create_connection`"""
+        if self._server is None:
+            raise RuntimeError("Site is not started")
+
+        peer = next(_peers)
+        protocol = protocol_factory()
+        server_protocol = self._runner.server()
+        client = LoopbackTransport(protocol, peername=("loopback", 0))
+        server = LoopbackTransport(
+            server_protocol, peername=("loopback", peer), server=self._server
+        )
+        client._peer, server._peer = server, client
+
+        self._server.transports.append(server)
+        server_protocol.connection_made(server)
+        protocol.connection_made(client)
+        return client, protocol
+
+    async def open_connection(
+        self,
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open a connection, like :func:`asyncio.open_connection`"""
+        loop = asyncio.get_event_loop()
+        reader = asyncio.StreamReader()
+        transport, protocol = await self.connect(
+            lambda: asyncio.StreamReaderProtocol(reader)
+        )
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return reader, writer
+
+
+class LoopbackDatagramTransport(asyncio.DatagramTransport):
+    """
+    Client end of an in-memory datagram endpoint.
+
+    Datagrams sent during a loop iteration are delivered on the next one, in
+    batches of ``batch_size`` to protocols implementing ``datagrams_received``.
+    """
+
+    def __init__(
+        self, protocol: asyncio.DatagramProtocol, *, peername: Any, batch_size: int
+    ) -> None:
+        super().__init__(extra={"peername": peername, "sockname": "loopback"})
+        self._loop = asyncio.get_event_loop()
+        self._protocol = protocol
+        self._batch_size = batch_size
+        self._closing = False
+        self._queue: List[Tuple[bytes, Any]] = list()
+
+    def sendto(self, data: Any, addr: Any = None) -> None:
+        if self._closing:
+            return
+        if not self._queue:
+            self._loop.call_soon(self._flush)
+        self._queue.append((bytes(data), self.get_extra_info("peername")))
+
+    def _flush(self) -> None:
+        queue, self._queue = self._queue, list()
+        batch_received = getattr(self._protocol, "datagrams_received", None)
+        if batch_received is not None and self._batch_size > 1:
+            for i in range(0, len(queue), self._batch_size):
+                batch_received(queue[i : i + self._batch_size])  # noQa: E203
+        else:
+            for data, addr in queue:
+                self._protocol.datagram_received(data, addr)
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        self._closing = True
+
+    def abort(self) -> None:
+        self.close()
+
+
+class DatagramLoopbackSite(BaseSite):
+    """
+    Datagram site connected in memory, without sockets.
+
+    Clients get a transport to send datagrams with :meth:`connect`.
+
+    Args:
+        runner: Runner of the application.
+        batch_size: Number of datagrams delivered together to protocols
+            implementing ``datagrams_received``.
+    """
+
+    def __init__(
+        self, runner: BaseRunner, *, shutdown_timeout: float = 60.0, batch_size: int = 1
+    ) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._batch_size = batch_size
+        self._protocol: Optional[asyncio.DatagramProtocol] = None
+        self._transport: Optional[_ServerDatagramTransport] = None
+        self._protocol_type = ProtocolType.DATAGRAM
+
+    @property
+    def name(self) -> str:
+        return f"loopback+udp://{id(self):x}"
+
+    async def start(self) -> None:
+        await super().start()
+        self._protocol = self._runner.server()
+        self._transport = _ServerDatagramTransport(self._protocol)  # type: ignore
+        self._server = LoopbackServer()
+        self._server.transports.append(self._transport)
+        self._protocol.connection_made(self._transport)  # type: ignore
+
+    def connect(self) -> LoopbackDatagramTransport:
+        if self._protocol is None:
+            raise RuntimeError("Site is not started")
+        return LoopbackDatagramTransport(
+            self._protocol,
+            peername=("loopback", next(_peers)),
+            batch_size=self._batch_size,
+        )
+
+
+class _ServerDatagramTransport(asyncio.DatagramTransport):
+    def __init__(self, protocol: asyncio.DatagramProtocol) -> None:
+        super().__init__(extra={"sockname": "loopback"})
+        self._loop = asyncio.get_event_loop()
+        self._protocol = protocol
+        self._closing = False
+
+    def sendto(self, data: Any, addr: Any = None) -> None:
+        LOG.log(2, "Loopback datagram to %s dropped", addr)
+
+    def pause_reading(self) -> None:
+        pass
+
+    def resume_reading(self) -> None:
+        pass
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self) -> None:
+        if not self._closing:
+            self._closing = True
+            self._loop.call_soon(self._protocol.connection_lost, None)
+
+
+class LoopbackWSTransport(WSTransport):
+    def __init__(self, protocol: WSProtocol) -> None:
+        super().__init__()
+        self._loop = asyncio.get_event_loop()
+        self._protocol = protocol
+        self._pending: Deque[Tuple[aiohttp.WSMsgType, Any]] = collections.deque()
+
+    def resume_reading(self) -> None:
+        super().resume_reading()
+        while self._pending and self.is_reading():
+            self._protocol.message_received(*self._pending.popleft(), "")
+
+    def _receive(self, message_type: aiohttp.WSMsgType, data: Any) -> None:
+        if self._closing:
+            return
+        elif not self.is_reading():
+            self._pending.append((message_type, data))
+        else:
+            self._protocol.message_received(message_type, data, "")
+
+    def close(self) -> None:
+        if not self._closing:
+            self._closing = True
+            self._loop.call_soon(self._protocol.connection_lost, None)
+
+    async def status(self) -> bool:
+        return not self._closing
+
+
+class WSLoopbackSite(BaseSite):
+    """
+    Websocket site connected in memory, in place of :class:`WSClientSite`.
+
+    Messages are pushed to the protocol with :meth:`send_str`,
+    :meth:`send_bytes` or :meth:`send_json`.
+    """
+
+    def __init__(self, runner: BaseRunner, *, shutdown_timeout: float = 60.0) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._protocol: Optional[WSProtocol] = None
+        self._transport: Optional[LoopbackWSTransport] = None
+        self._loop = asyncio.get_event_loop()
+        self._protocol_type = ProtocolType.WS
+
+    @property
+    def name(self) -> str:
+        return f"loopback+ws://{id(self):x}"
+
+    async def start(self) -> None:
+        await super().start()
+        self._protocol = self._runner.server()
+        self._transport = LoopbackWSTransport(self._protocol)  # type: ignore
+        self._server = LoopbackServer()
+        self._server.transports.append(self._transport)
+        self._protocol.connection_made(self._transport)  # type: ignore
+
+    async def status(self) -> bool:
+        if self._transport:
+            return await self._transport.status()
+        return False
+
+    def send_str(self, data: str) -> None:
+        self._send(aiohttp.http_websocket.WSMsgType.TEXT, data)
+
+    def send_bytes(self, data: bytes) -> None:
+        self._send(aiohttp.http_websocket.WSMsgType.BINARY, data)
+
+    def send_json(self, data: Any) -> None:
+        self.send_str(ujson.dumps(data))
+
+    def _send(
+        self, message_type: aiohttp.http_websocket.WSMsgType, data: Union[str, bytes]
+    ) -> None:
+        if self._transport is None or self._transport.is_closing():
+            raise RuntimeError("Site is not started")
+        self._loop.call_soon(self._transport._receive, message_type, data)
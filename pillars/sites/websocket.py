@@ -1,38 +1,59 @@
 import asyncio
+import collections
+import enum
 import logging
-from typing import Awaitable, Callable, Optional, Union
+import struct
+import time
+from typing import Awaitable, Callable, Optional, Set, Union
 
 import aiohttp
 import aiohttp.http_websocket
+import aiohttp.web
 
+from .. import utils
 from ..base import BaseRunner, BaseSite
 from .protocol import ProtocolType
 
 LOG = logging.getLogger(__name__)
 
 
-class WSTransport(asyncio.BaseTransport):
+class WSTransport(asyncio.ReadTransport):
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
         self._closing = False
         self._closed: Optional[asyncio.Task] = None
+        self._reading = asyncio.Event()
+        self._reading.set()
+
+    def pause_reading(self) -> None:
+        """Stop pulling frames, the socket is paused once the buffer of aiohttp is full"""
+        self._reading.clear()
+
+    def resume_reading(self) -> None:
+        self._reading.set()
+
+    def is_reading(self) -> bool:
+        return self._reading.is_set()
 
     def close(self) -> None:
         self._closing = True
-        if self._ws:
+        if self._ws is not None:
             self._closed = asyncio.create_task(self._close())
 
     async def _close(self):
-        await self._ws.close()
-        self._ws = None
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            await ws.close()
+            # Wake up a paused reader to notice the closed connection
+            self._reading.set()
 
     async def closed(self):
         if self._closed:
             await self._closed
 
     async def status(self) -> bool:
-        if self._ws:
+        if self._ws is not None:
             try:
                 await self._ws.ping()
             except Exception:
@@ -71,6 +92,15 @@ class WSServer:
 
 
 class WSProtocol(asyncio.BaseProtocol):
+    """
+    Protocol of the websocket sites.
+
+    Text frames are delivered as ``str`` and binary frames as ``bytes``, both
+    as received from aiohttp without copy.
+    A protocol falling behind calls ``transport.pause_reading()``, no frame is
+    delivered until it calls ``transport.resume_reading()``.
+    """
+
     def message_received(
         self,
         message_type: aiohttp.http_websocket.WSMsgType,
@@ -80,7 +110,60 @@ class WSProtocol(asyncio.BaseProtocol):
         raise NotImplementedError()
 
 
+_CLOSED = (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED)
+
+
+async def _read(
+    ws: Union[aiohttp.ClientWebSocketResponse, aiohttp.web.WebSocketResponse],
+    transport: WSTransport,
+    protocol: WSProtocol,
+) -> None:
+    """Deliver the frames of ``ws`` to ``protocol`` until the connection is closed"""
+    reading = transport._reading
+    trace = LOG.isEnabledFor(2)
+    while True:
+        message = await ws.receive()
+        if message.type in _CLOSED:
+            return
+        elif trace:
+            LOG.log(2, "Data received: %s", message)
+
+        if not reading.is_set():
+            # Hold the frame, the following ones stay in the socket buffers
+            await reading.wait()
+
+        protocol.message_received(message.type, message.data, message.extra)
+
+
+@enum.unique
+class WSClientState(enum.Enum):
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    BACKOFF = "backoff"
+    FAILED = "failed"
+    CLOSED = "closed"
+
+
 class WSClientSite(BaseSite):
+    """
+    Websocket client connection, re-established when lost.
+
+    A single task connects, reads and waits between attempts with exponential
+    backoff and jitter. The first attempt after losing an established
+    connection waits at most ``backoff_base`` so that many processes do not
+    reconnect at the same time.
+
+    Args:
+        runner: Runner of the application.
+        url: URL of the websocket server.
+        session: Client session, closed with the site only if created by it.
+        on_connection: Coroutine function called after each successful connection.
+        backoff_base: Maximum delay of the first attempt, in seconds.
+        backoff_max: Upper bound of the delay between two attempts.
+        max_retries: Number of consecutive failed attempts after which the
+            site gives up, ``None`` to retry forever.
+    """
+
     def __init__(
         self,
         runner: BaseRunner,
@@ -89,61 +172,130 @@ class WSClientSite(BaseSite):
         shutdown_timeout: float = 60.0,
         session: aiohttp.ClientSession = None,
         on_connection: Optional[Callable[[], Awaitable[None]]] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_retries: Optional[int] = None,
     ) -> None:
         super().__init__(runner, shutdown_timeout=shutdown_timeout)
         self._url = url
         self._name = f"WS://{url}"
         self._server = None
-        self._session = session or aiohttp.ClientSession()
+        self._session = session
+        self._own_session = session is None
         self._protocol: Optional[WSProtocol] = None
         self._transport: Optional[WSTransport] = None
+        self._task: Optional[asyncio.Task] = None
         self._closing = False
         self._protocol_type = ProtocolType.WS
         self._on_connection = on_connection
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._max_retries = max_retries
+        self._state = WSClientState.CLOSED
+        self._connected_at: Optional[float] = None
+        self._last_error: Optional[BaseException] = None
+        self._stats: collections.Counter = collections.Counter()
 
     @property
     def name(self) -> str:
         return self._name
 
+    @property
+    def state(self) -> WSClientState:
+        return self._state
+
     async def start(self) -> None:
         await super().start()
-        self._protocol: asyncio.Protocol = self._runner.server()
-        self._transport: WSTransport = WSTransport()
-        asyncio.create_task(self._ws_connection())  # type: ignore
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        self._protocol = self._runner.server()
+        self._transport = WSTransport()
+        self._task = asyncio.create_task(self._run())
         self._server = WSServer(transport=self._transport)
 
     async def stop(self) -> None:
         self._closing = True
+        if self._task and self._state is not WSClientState.CONNECTED:
+            self._task.cancel()
         await super().stop()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._state = WSClientState.CLOSED
+        if self._own_session and self._session:
+            await self._session.close()
+
+    def metrics(self) -> dict:
+        uptime = None
+        if self._connected_at is not None:
+            uptime = time.monotonic() - self._connected_at
+        return {
+            "state": self._state.value,
+            "uptime": uptime,
+            "last_error": repr(self._last_error) if self._last_error else None,
+            **self._stats,
+        }
 
-    async def _ws_connection(self) -> None:
+    async def _run(self) -> None:
         if not self._transport or not self._protocol:
             raise TypeError("Missing transport and protocol")
 
+        attempt = 0
+        while not self._closing:
+            self._state = WSClientState.CONNECTING
+            self._stats["attempts"] += 1
+            try:
+                ws = await self._session.ws_connect(self._url)  # type: ignore
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                LOG.debug("Failed to connect to %s: %r", self._url, e)
+                self._last_error = e
+                self._stats["failures"] += 1
+                attempt += 1
+            else:
+                self._stats["connections"] += 1
+                await self._connected(ws)
+                # Retry soon after losing an established connection
+                attempt = 0
+
+            if self._closing:
+                break
+            elif self._max_retries is not None and attempt > self._max_retries:
+                LOG.error(
+                    "Giving up connecting to %s after %s attempts", self._url, attempt
+                )
+                self._state = WSClientState.FAILED
+                return
+
+            self._state = WSClientState.BACKOFF
+            await asyncio.sleep(
+                utils.backoff_delay(
+                    max(attempt - 1, 0), self._backoff_base, self._backoff_max
+                )
+            )
+
+    async def _connected(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        self._state = WSClientState.CONNECTED
+        self._connected_at = time.monotonic()
+        self._transport._ws = ws  # type: ignore
+        self._protocol.connection_made(self._transport)  # type: ignore
+        asyncio.create_task(self._call_on_connection())
+
+        error: Optional[Exception] = None
         try:
-            async with self._session.ws_connect(self._url) as ws:
-                self._transport._ws = ws
-                self._protocol.connection_made(self._transport)
-                asyncio.create_task(self._connected())
-                async for message in ws:
-                    LOG.log(2, "Data received: %s", message)
-                    self._protocol.message_received(
-                        message.type, message.data, message.extra
-                    )
-                    # WSMsgType.CLOSE should call connection_lost
-
-            # TODO: mypy #5537 09/2018
-            self._protocol.connection_lost(None)  # type: ignore
-        except aiohttp.client_exceptions.ClientError as e:
-            LOG.debug("Failed to connect to %: %s", self._url, e)
-            await asyncio.sleep(0.1)
+            await _read(ws, self._transport, self._protocol)  # type: ignore
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            self._protocol.connection_lost(e)
+            LOG.exception("Error on websocket connection to %s", self._url)
+            error = self._last_error = e
+        finally:
+            self._connected_at = None
+            self._transport._ws = None  # type: ignore
+            await ws.close()
 
-        if self._closing:
-            await self._session.close()
-        else:
-            asyncio.create_task(self._ws_connection())  # type: ignore
+        self._protocol.connection_lost(error)  # type: ignore
+        if not self._closing:
+            LOG.warning("Websocket connection to %s lost", self._url)
+            self._stats["disconnections"] += 1
 
     async def status(self) -> bool:
         if self._transport:
@@ -151,9 +303,208 @@ class WSClientSite(BaseSite):
         else:
             return False
 
-    async def _connected(self) -> None:
+    async def _call_on_connection(self) -> None:
         try:
             if self._on_connection:
                 await self._on_connection()
         except Exception:
             LOG.exception(f"Error calling 'on_connection' for: {self}")
+
+
+def encode_frame(data: Union[str, bytes]) -> bytes:
+    """
+    Frame a message as sent by a server: final, unmasked and uncompressed.
+
+    The frame can be written as is to any number of connections.
+    """
+    if isinstance(data, str):
+        payload, opcode = data.encode("utf-8"), aiohttp.WSMsgType.TEXT
+    else:
+        payload, opcode = bytes(data), aiohttp.WSMsgType.BINARY
+
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < (1 << 16):
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class WSServerTransport(WSTransport):
+    """
+    Inbound websocket connection.
+
+    Frames are written directly to the connection. The write buffer of the
+    connection acts as its send queue, bounded by ``max_queue`` bytes.
+
+    Args:
+        ws: Prepared websocket response.
+        transport: Transport of the underlying connection.
+        max_queue: Maximum number of bytes waiting to be sent.
+        slow_policy: ``drop`` to drop the frames of a full queue,
+            ``disconnect`` to close the connection.
+        stats: Counters of the site.
+    """
+
+    def __init__(
+        self,
+        ws: aiohttp.web.WebSocketResponse,
+        transport: asyncio.Transport,
+        *,
+        max_queue: int,
+        slow_policy: str,
+        stats: collections.Counter,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._ws = ws  # type: ignore
+        self._transport = transport
+        self._max_queue = max_queue
+        self._slow_policy = slow_policy
+        self._stats = stats
+
+    def write_frame(self, frame: bytes) -> bool:
+        """
+        Queue a frame built with :func:`encode_frame`.
+
+        Returns False if the frame was not queued.
+        """
+        if self._closing or self._transport.is_closing():
+            return False
+        elif self._transport.get_write_buffer_size() > self._max_queue:
+            if self._slow_policy == "disconnect":
+                LOG.warning("Disconnecting slow websocket client")
+                self._stats["disconnected"] += 1
+                self._transport.abort()
+                self._closing = True
+            else:
+                self._stats["dropped"] += 1
+            return False
+
+        self._transport.write(frame)
+        self._stats["frames"] += 1
+        return True
+
+    def send(self, data: Union[str, bytes]) -> bool:
+        return self.write_frame(encode_frame(data))
+
+
+class WSServerSite(BaseSite):
+    """
+    Websocket server accepting inbound connections.
+
+    Each connection gets its own protocol from the runner, messages are
+    delivered with ``message_received``.
+
+    Args:
+        runner: Runner of the application.
+        host: Bound address.
+        port: Bound port.
+        path: Path accepting websocket upgrades.
+        heartbeat: Interval between pings, in seconds.
+        max_queue: Maximum number of bytes waiting to be sent to a client.
+        slow_policy: What to do with a client whose queue is full, ``drop``
+            the frame or ``disconnect`` the client.
+    """
+
+    def __init__(
+        self,
+        runner: BaseRunner,
+        host: str = None,
+        port: int = None,
+        *,
+        path: str = "/",
+        shutdown_timeout: float = 60.0,
+        heartbeat: Optional[float] = None,
+        max_queue: int = 1024 * 1024,
+        slow_policy: str = "drop",
+        reuse_address: Optional[bool] = None,
+        reuse_port: Optional[bool] = None,
+    ) -> None:
+        if slow_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_policy}")
+
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._host = host or "0.0.0.0"
+        self._port = 8080 if port is None else port
+        self._path = path
+        self._heartbeat = heartbeat
+        self._max_queue = max_queue
+        self._slow_policy = slow_policy
+        self._reuse_address = reuse_address
+        self._reuse_port = reuse_port
+        self._transports: Set[WSServerTransport] = set()
+        self._stats: collections.Counter = collections.Counter()
+        self._protocol_type = ProtocolType.WS
+
+    @property
+    def name(self) -> str:
+        return f"WS://{self._host}:{self._port}{self._path}"
+
+    async def start(self) -> None:
+        await super().start()
+        loop = asyncio.get_event_loop()
+        self._http = aiohttp.web.Server(self._handle)
+        self._server = await loop.create_server(
+            self._http,
+            self._host,
+            self._port,
+            reuse_address=self._reuse_address,
+            reuse_port=self._reuse_port,
+        )
+
+    async def stop(self) -> None:
+        for transport in list(self._transports):
+            transport.close()
+        await asyncio.gather(
+            *(transport.closed() for transport in self._transports),
+            return_exceptions=True,
+        )
+        await super().stop()
+        await self._http.shutdown(self._shutdown_timeout)
+
+    def metrics(self) -> dict:
+        return {"connections": len(self._transports), **self._stats}
+
+    async def status(self) -> bool:
+        return self._server is not None and self._server.is_serving()
+
+    async def _handle(
+        self, request: aiohttp.web.BaseRequest
+    ) -> aiohttp.web.StreamResponse:
+        if request.path != self._path:
+            return aiohttp.web.Response(status=404)
+
+        ws = aiohttp.web.WebSocketResponse(heartbeat=self._heartbeat, compress=False)
+        if not ws.can_prepare(request).ok:
+            return aiohttp.web.Response(status=426)
+        await ws.prepare(request)
+
+        protocol = self._runner.server()
+        peername = request.transport.get_extra_info("peername")  # type: ignore
+        transport = WSServerTransport(
+            ws,
+            request.transport,  # type: ignore
+            max_queue=self._max_queue,
+            slow_policy=self._slow_policy,
+            stats=self._stats,
+            extra={"peername": peername},
+        )
+        self._transports.add(transport)
+        self._stats["accepted"] += 1
+        error = None
+        try:
+            protocol.connection_made(transport)
+            await _read(ws, transport, protocol)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOG.exception("Error on websocket connection")
+            error = e
+        finally:
+            self._transports.discard(transport)
+            transport._closing = True
+            protocol.connection_lost(error)
+        return ws
@@ -1 +1,10 @@
-from . import ari, fast_agi, http, sip, syslog  # noQa: F401
+from . import (  # noQa: F401
+    ari,
+    fast_agi,
+    http,
+    redis_pubsub,
+    redis_streams,
+    sip,
+    syslog,
+    websocket,
+)
@@ -2,7 +2,7 @@ import asyncio
 import collections
 import functools
 import logging
-from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple, Union
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Set, Tuple, Union
 
 import aiohttp.http_websocket
 import async_timeout
@@ -10,22 +10,43 @@ import ujson
 
 from ..app import Application as MainApplication
 from ..base import BaseRunner
+from ..exceptions import Overloaded
 from ..request import BaseRequest
 from ..sites.websocket import WSProtocol
+from ..validation import Validator
 
 LOG = logging.getLogger(__name__)
 
 
 class AppRunner(BaseRunner):
-    def __init__(self, app: "Application") -> None:
+    """
+    Args:
+        app: ARI application.
+        high_water: Number of events handled concurrently above which reading
+            from the websocket is paused.
+        low_water: Number of events handled concurrently under which reading
+            is resumed, 3/4 of ``high_water`` by default.
+    """
+
+    def __init__(
+        self,
+        app: "Application",
+        *,
+        high_water: int = 1000,
+        low_water: Optional[int] = None,
+    ) -> None:
         super().__init__()
         self._app = app
+        self._high_water = high_water
+        self._low_water = low_water
 
     async def shutdown(self) -> None:
         await self._app.shutdown()
 
     async def _make_server(self) -> "AriServer":
-        return AriServer(self._app._handler)
+        return AriServer(
+            self._app._handler, high_water=self._high_water, low_water=self._low_water
+        )
 
     async def _cleanup_server(self) -> None:
         await self._app.cleanup()
@@ -44,7 +65,10 @@ class Event:
 
 class Application(collections.MutableMapping):
     def __init__(
-        self, app: MainApplication, middlewares: Optional[Iterable] = None
+        self,
+        app: MainApplication,
+        middlewares: Optional[Iterable] = None,
+        timeout: Optional[float] = None,
     ) -> None:
 
         if middlewares:
@@ -56,6 +80,7 @@ class Application(collections.MutableMapping):
         self.router = Router()
         self._state = collections.ChainMap({}, app)
         self._middlewares = middlewares
+        self.timeout = timeout
 
     async def shutdown(self) -> None:
         pass
@@ -105,12 +130,24 @@ class Application(collections.MutableMapping):
 
 
 class AriServer:
-    def __init__(self, handler: Callable[[dict], Awaitable[None]]) -> None:
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        *,
+        high_water: int = 1000,
+        low_water: Optional[int] = None,
+    ) -> None:
         self._handler = handler
+        self._high_water = high_water
+        self._low_water = low_water
         self._connections: List["AriProtocol"] = list()
 
     def __call__(self) -> "AriProtocol":
-        proto = AriProtocol(handler=self._handler)
+        proto = AriProtocol(
+            handler=self._handler,
+            high_water=self._high_water,
+            low_water=self._low_water,
+        )
         self._connections.append(proto)
         return proto
 
@@ -120,9 +157,29 @@ class AriServer:
 
 
 class AriProtocol(WSProtocol):
-    def __init__(self, handler: Callable[[dict], Awaitable[None]]) -> None:
+    """
+    Dispatch the ARI events of a websocket connection.
+
+    Reading from the connection is paused when ``high_water`` events are being
+    handled and resumed once they drop to ``low_water``.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        *,
+        high_water: int = 1000,
+        low_water: Optional[int] = None,
+    ) -> None:
         self._handler = handler
-        self._tasks: List[asyncio.Task] = list()
+        self._tasks: Set[asyncio.Task] = set()
+        self._transport: Optional[asyncio.ReadTransport] = None
+        self._high_water = high_water
+        self._low_water = high_water * 3 // 4 if low_water is None else low_water
+        self._paused = False
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore
 
     def message_received(
         self,
@@ -130,22 +187,34 @@ class AriProtocol(WSProtocol):
         data: Union[str, bytes, aiohttp.http_websocket.WSCloseCode],
         extra: str,
     ):
-        LOG.log(2, "Message received: %s %s", message_type, data)
-        if isinstance(data, (str, bytes)):
-            # TODO mypy #1533
-            payload = ujson.loads(data)  # type: ignore
-            task = asyncio.create_task(self._handler(payload))
-            self._tasks.append(task)
-            task.add_done_callback(self._task_completed)
-        else:
+        if not isinstance(data, (str, bytes)):
             LOG.debug("Unhandled websocket message: %s", message_type)
+            return
+
+        # TODO mypy #1533
+        payload = ujson.loads(data)  # type: ignore
+        task = asyncio.create_task(self._handler(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_completed)
+
+        if len(self._tasks) >= self._high_water and not self._paused:
+            self._pause()
 
     def connection_lost(self, error: Optional[Exception]) -> None:
         if error:
             LOG.error(error)
 
+    def _pause(self) -> None:
+        if self._transport is not None:
+            LOG.debug("Pausing ARI events, %s being handled", len(self._tasks))
+            self._paused = True
+            self._transport.pause_reading()
+
     def _task_completed(self, task):
-        self._tasks.remove(task)
+        self._tasks.discard(task)
+        if self._paused and len(self._tasks) <= self._low_water:
+            self._paused = False
+            self._transport.resume_reading()
 
     async def shutdown(self):
         await asyncio.gather(*(task for task in self._tasks))
@@ -153,10 +222,14 @@ class AriProtocol(WSProtocol):
 
 class AriRequest(BaseRequest):
     def __init__(self, event: Event) -> None:
-        super().__init__(event.app.state)
+        super().__init__(event.app.state, timeout=event.app.timeout)
         self._event = event
 
-    async def data(self) -> dict:
+    async def data(self, validate: bool = None) -> dict:
+        if validate:
+            validator = self._event.app.router.validator(self._event.type)
+            if validator is not None:
+                return validator.validate(self._event.data)
         return self._event.data
 
     @property
@@ -178,19 +251,49 @@ class AriRequest(BaseRequest):
 
 async def middleware(event: Event, handler: Callable[[BaseRequest], Awaitable[None]]):
     request = AriRequest(event)
-    await handler(request)
+    timeout = async_timeout.timeout(request.remaining())
+    try:
+        async with timeout:
+            await handler(request)
+    except asyncio.TimeoutError:
+        if not timeout.expired:
+            raise
+        LOG.warning("Deadline exceeded handling event: %s", event.type)
+    except Overloaded as e:
+        LOG.warning("Dropped event %s: %s", event.type, e.reason)
 
 
 class Router:
     def __init__(self) -> None:
         self._routes: dict = dict()
+        self._validators: dict = dict()
 
     def add(
-        self, event: str, handler: Callable[..., Awaitable[None]], config: Any = None
+        self,
+        event: str,
+        handler: Callable[..., Awaitable[None]],
+        config: Any = None,
+        data_schema: Optional[dict] = None,
     ):
+        """
+        Args:
+            event: Type of the events, ``*`` for all the unrouted events.
+            handler: Handler of the events.
+            config: Configuration of the route.
+            data_schema: Schema of the events, fields missing from the schema
+                are accepted.
+        """
         self._routes[event.lower()] = (handler, config)
+        if data_schema:
+            self._validators[event.lower()] = Validator(data_schema, allow_unknown=True)
 
     def resolve(
         self, event: str
     ) -> Union[Tuple[None, None], Tuple[Callable[..., Awaitable[None]], Any]]:
         return self._routes.get(event.lower(), self._routes.get("*", (None, None)))
+
+    def validator(self, event: str) -> Optional[Validator]:
+        event = event.lower()
+        if event in self._routes:
+            return self._validators.get(event)
+        return self._validators.get("*")
@@ -4,10 +4,13 @@ import functools
 import logging
 from typing import Awaitable, Callable, Iterable, Optional
 
+import async_timeout
 import panoramisk
 
 from ..base import BaseRunner
+from ..exceptions import Overloaded
 from ..request import BaseRequest
+from ..validation import Validator
 
 LOG = logging.getLogger(__name__)
 
@@ -16,12 +19,27 @@ async def middleware(
     request: "Request", handler: Callable[["FastAGIRequest"], Awaitable[None]]
 ) -> None:
     common_request = FastAGIRequest(request)
-    await handler(common_request)
+    timeout = async_timeout.timeout(common_request.remaining())
+    try:
+        async with timeout:
+            try:
+                await handler(common_request)
+            except Overloaded as e:
+                LOG.warning("Hanging up request %s: %s", common_request.path, e.reason)
+                await request.send_command("HANGUP")
+    except asyncio.TimeoutError:
+        if not timeout.expired:
+            raise
+        LOG.warning("Deadline exceeded handling request: %s", common_request.path)
 
 
 class Application(collections.MutableMapping):
-    def __init__(self, middlewares: Optional[Iterable] = None) -> None:
+    def __init__(
+        self, middlewares: Optional[Iterable] = None, timeout: Optional[float] = None
+    ) -> None:
         self.routes: dict = dict()
+        self.validators: dict = dict()
+        self.timeout = timeout
         self._state: dict = dict()
 
         if middlewares:
@@ -37,6 +55,23 @@ class Application(collections.MutableMapping):
     async def cleanup(self) -> None:
         pass
 
+    def add_route(
+        self,
+        script: str,
+        handler: Callable[..., Awaitable[None]],
+        data_schema: Optional[dict] = None,
+    ) -> None:
+        """
+        Args:
+            script: ``agi_network_script`` of the requests.
+            handler: Handler of the requests.
+            data_schema: Schema of the AGI variables, variables missing from
+                the schema are accepted.
+        """
+        self.routes[script] = handler
+        if data_schema:
+            self.validators[script] = Validator(data_schema, allow_unknown=True)
+
     async def _handler(self, request: "Request") -> None:
         request.app = self
         agi_network_script = request.get("agi_network_script")
@@ -138,10 +173,14 @@ class Request(collections.MutableMapping):
 
 class FastAGIRequest(BaseRequest):
     def __init__(self, request):
-        super().__init__(request.app.state)
+        super().__init__(request.app.state, timeout=request.app.timeout)
         self._request = request
 
-    async def data(self) -> dict:
+    async def data(self, validate: bool = None) -> dict:
+        if validate:
+            validator = self._request.app.validators.get(self.path)
+            if validator is not None:
+                return validator.validate(self._request._state)
         return self._request._state
 
     @property
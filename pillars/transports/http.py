@@ -1,18 +1,67 @@
+import asyncio
+import codecs
+import csv
 import functools
+import io
 import json
 import logging
-from typing import Awaitable, Callable, Optional
+import math
+import re
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 
 import aiohttp.web
-import cerberus
+import async_timeout
 import ujson
+from aiohttp import hdrs
 from aiohttp.abc import AbstractMatchInfo
+from aiohttp.web_urldispatcher import (
+    AbstractResource,
+    AbstractRoute,
+    DynamicResource,
+    PlainResource,
+    UrlMappingMatchInfo,
+)
 
-from ..exceptions import DataValidationError
-from ..request import BaseRequest, Response
+from ..exceptions import DataValidationError, Overloaded, PayloadTooLarge
+from ..request import BaseRequest, Response, ServerSentEvent, StreamResponse
+from ..validation import Validator
 
 LOG = logging.getLogger(__name__)
 
+TIMEOUT_HEADER = "X-Request-Timeout"
+UNMATCHED_ROUTE = "unmatched"
+
+NDJSON_CONTENT_TYPES = frozenset(
+    ("application/x-ndjson", "application/ndjson", "application/jsonl")
+)
+
+STREAM_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "csv": "text/csv",
+    "sse": "text/event-stream",
+}
+
+# Encoded records are buffered up to this size before being written
+STREAM_BUFFER_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SCALAR_END = re.compile(r'[ \t\n\r,:\[\]{}"]')
+_STRING_SCAN = re.compile(r'["\\]')
+_CONTAINER_SCAN = re.compile(r'["\[\]{}]')
+
 
 @aiohttp.web.middleware
 async def middleware(
@@ -20,52 +69,290 @@ async def middleware(
     handler: Callable[["HttpRequest"], Awaitable[aiohttp.web.Response]],
 ):
     common_request = HttpRequest(request)
-    response = await handler(common_request)
-    if isinstance(response, Response):
+    timeout = async_timeout.timeout(common_request.remaining())
+    try:
+        async with timeout:
+            response = await handler(common_request)
+    except asyncio.TimeoutError:
+        if not timeout.expired:
+            raise
+        LOG.warning("Deadline exceeded handling request: %s", request.path)
         return aiohttp.web.json_response(
-            status=response.status,
-            data=response.data,
-            dumps=functools.partial(json.dumps, cls=response.json_encoder),
+            status=504, data={"errors": ["Deadline exceeded"]}
         )
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    if isinstance(response, Response):
+        return encode_response(response)
+    elif isinstance(response, StreamResponse):
+        return await _stream(request, response)
     else:
         return response
 
 
+def overloaded_response(error: Overloaded) -> aiohttp.web.Response:
+    """503 response of a request rejected by the admission control"""
+    retry_after = max(math.ceil(error.retry_after or 1), 1)
+    return aiohttp.web.json_response(
+        status=503,
+        data={"errors": [error.reason]},
+        headers={hdrs.RETRY_AFTER: str(retry_after)},
+    )
+
+
+def encode_response(response: Response) -> aiohttp.web.Response:
+    """Encode ``response`` to JSON"""
+    return aiohttp.web.json_response(
+        status=response.status,
+        data=response.data,
+        dumps=functools.partial(json.dumps, cls=response.json_encoder),
+    )
+
+
+async def _stream(
+    request: aiohttp.web.Request, response: StreamResponse
+) -> aiohttp.web.StreamResponse:
+    """
+    Send the records of ``response`` as they are produced.
+
+    The request deadline does not apply once the response is started. An
+    error while streaming closes the connection, the client sees a truncated
+    body.
+    """
+    stream = aiohttp.web.StreamResponse(
+        status=response.status, headers=response.headers
+    )
+    stream.content_type = STREAM_CONTENT_TYPES[response.format]
+    stream.charset = "utf-8"
+    if response.format == "sse":
+        stream.headers[hdrs.CACHE_CONTROL] = "no-cache"
+        stream.enable_chunked_encoding()
+        buffer_size = 0
+    else:
+        buffer_size = STREAM_BUFFER_SIZE
+
+    chunks = _ENCODERS[response.format](response)
+    async with response.stack:
+        await stream.prepare(request)
+        try:
+            await _write(stream, chunks, buffer_size)
+        except Exception:
+            LOG.exception("Error streaming response: %s", request.path)
+            if request.transport is not None:
+                request.transport.close()
+            return stream
+        finally:
+            await _aclose(response.records)
+
+    await stream.write_eof()
+    return stream
+
+
+async def _write(
+    stream: aiohttp.web.StreamResponse, chunks: AsyncIterator[str], buffer_size: int
+) -> None:
+    buffer: List[str] = list()
+    size = 0
+    async for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            await stream.write("".join(buffer).encode("utf-8"))
+            buffer.clear()
+            size = 0
+
+    if buffer:
+        await stream.write("".join(buffer).encode("utf-8"))
+
+
+async def _aclose(records: Any) -> None:
+    aclose = getattr(records, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+def _jsonable(record: Any) -> Any:
+    # Mappings like ``asyncpg.Record`` are encoded as objects
+    if not isinstance(record, dict) and hasattr(record, "items"):
+        return dict(record.items())
+    return record
+
+
+async def _encode_ndjson(response: StreamResponse) -> AsyncIterator[str]:
+    encode = response.json_encoder().encode
+    async for record in response.records:
+        yield encode(_jsonable(record)) + "\n"
+
+
+async def _encode_json(response: StreamResponse) -> AsyncIterator[str]:
+    encode = response.json_encoder().encode
+    separator = "["
+    async for record in response.records:
+        yield separator + encode(_jsonable(record))
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+async def _encode_csv(response: StreamResponse) -> AsyncIterator[str]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    columns = response.columns
+    if columns is not None:
+        writer.writerow(columns)
+
+    async for record in response.records:
+        if columns is None and hasattr(record, "keys"):
+            columns = list(record.keys())
+            writer.writerow(columns)
+
+        if hasattr(record, "keys"):
+            writer.writerow([record[column] for column in columns])  # type: ignore
+        else:
+            writer.writerow(record)
+
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+
+async def _encode_sse(response: StreamResponse) -> AsyncIterator[str]:
+    encode = response.json_encoder().encode
+    async for record in response.records:
+        if not isinstance(record, ServerSentEvent):
+            record = ServerSentEvent(data=record)
+
+        lines = list()
+        if record.event is not None:
+            lines.append(f"event: {record.event}")
+        if record.id is not None:
+            lines.append(f"id: {record.id}")
+        if record.retry is not None:
+            lines.append(f"retry: {record.retry}")
+
+        data = record.data
+        if not isinstance(data, str):
+            data = encode(_jsonable(data))
+        lines.extend(f"data: {line}" for line in data.split("\n"))
+        yield "\n".join(lines) + "\n\n"
+
+
+_ENCODERS: Dict[str, Callable[[StreamResponse], AsyncIterator[str]]] = {
+    "ndjson": _encode_ndjson,
+    "json": _encode_json,
+    "csv": _encode_csv,
+    "sse": _encode_sse,
+}
+
+
 class HttpRequest(BaseRequest):
     def __init__(self, request: aiohttp.web.Request) -> None:
-        super().__init__(request.app.state)  # type: ignore
+        timeout = self._timeout(request)
+        super().__init__(request.app.state, timeout=timeout)  # type: ignore
         self._request = request
         self._data: Optional[dict] = None
-        self["validator"] = self._request["validator"]
+        self._info: RouteInfo = request.get("route_info", DEFAULT_ROUTE_INFO)
+        self["validator"] = self._info.validator
 
     async def data(self, validate: bool = None) -> dict:
         if self._data is None:
             if "json" in self.config:
-                self._data = await self._request.json(loads=ujson.loads)
+                self._data = ujson.loads(await self._text())
             elif self._request.method == "GET":
                 self._data = dict(self._request.query)
             else:
-                self._data = {"text": await self._request.text()}
+                self._data = {"text": await self._text()}
                 return self._data
 
             # TODO mypy (self._data can not be None)
             self._data.update(self._request.match_info)  # type: ignore
 
             if validate:
-                if self["validator"].validate(self._data):
-                    self._data = self["validator"].document
-                else:
-                    raise DataValidationError(self["validator"].errors)
+                self._data = self["validator"].validate(self._data)
 
         return self._data or dict()
 
+    async def stream(self, validate: bool = None) -> AsyncIterator[Any]:
+        """
+        Iterate over the records of the body, as they are received.
+
+        Bodies of the ``application/x-ndjson`` type hold a JSON record per
+        line, other bodies hold a JSON array of records. With ``validate``
+        each record is validated against the schema of the route.
+
+        Raises:
+            DataValidationError: The body is not valid JSON or a record is
+                invalid, its errors are keyed by the index of the record.
+            PayloadTooLarge: The body is larger than the maximum of the route,
+                or the ``client_max_size`` of the application without one.
+        """
+        limit = self._info.max_body_size
+        if limit is None:
+            # Reading the content directly bypasses the limit of aiohttp
+            limit = self._request.app._client_max_size or None
+        chunks = self._chunks(limit)
+        if self._request.content_type in NDJSON_CONTENT_TYPES:
+            records = _ndjson_records(chunks)
+        else:
+            records = _json_array_records(chunks)
+
+        validator = self._info.validator if validate else None
+        index = 0
+        async for record in records:
+            if validator is not None:
+                if not isinstance(record, dict):
+                    raise DataValidationError({index: ["must be of dict type"]})
+                try:
+                    record = validator.validate(record)
+                except DataValidationError as e:
+                    raise DataValidationError({index: [e.errors]})
+            yield record
+            index += 1
+
+    async def _text(self) -> str:
+        if self._info.max_body_size is None:
+            return await self._request.text()
+
+        body = b"".join(
+            [chunk async for chunk in self._chunks(self._info.max_body_size)]
+        )
+        return body.decode(self._request.charset or "utf-8")
+
+    async def _chunks(self, limit: Optional[int]) -> AsyncIterator[bytes]:
+        length = self._request.content_length
+        if limit is not None and length is not None and length > limit:
+            raise PayloadTooLarge(limit)
+
+        size = 0
+        async for chunk in self._request.content.iter_any():
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise PayloadTooLarge(limit)
+            yield chunk
+
+    @staticmethod
+    def _timeout(request: aiohttp.web.Request) -> Optional[float]:
+        timeout = request.get("route_info", DEFAULT_ROUTE_INFO).timeout
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header is not None:
+            try:
+                header_timeout = float(header)
+            except ValueError:
+                header_timeout = math.nan
+
+            if not math.isfinite(header_timeout) or header_timeout <= 0:
+                LOG.debug("Invalid %s header: %s", TIMEOUT_HEADER, header)
+            elif timeout is None or header_timeout < timeout:
+                timeout = header_timeout
+        return timeout
+
     @property
     def initial(self) -> aiohttp.web.Request:
         return self._request
 
     @property
     def config(self) -> dict:
-        return self._request["config"]
+        return self._info.config  # type: ignore
 
     @property
     def method(self) -> str:
@@ -75,6 +362,14 @@ class HttpRequest(BaseRequest):
     def path(self) -> str:
         return self._request.path
 
+    @property
+    def route(self) -> str:
+        resource = self._request.match_info.route.resource
+        if resource is None:
+            # Bounded label, whatever path was requested
+            return UNMATCHED_ROUTE
+        return resource.canonical
+
 
 class Application(aiohttp.web.Application):
     def __init__(self, **kwargs) -> None:
@@ -90,32 +385,304 @@ class Application(aiohttp.web.Application):
         super().__init__(**kwargs)
 
 
+@dataclass(frozen=True)
+class RouteInfo:
+    """Metadata of a route, attached to it when resolved"""
+
+    config: FrozenSet[str] = frozenset()
+    validator: Optional[Validator] = None
+    timeout: Optional[float] = None
+    middlewares: Tuple[Callable, ...] = ()
+    max_body_size: Optional[int] = None
+
+
+DEFAULT_ROUTE_INFO = RouteInfo()
+
+
 class Router(aiohttp.web.UrlDispatcher):
+    """
+    Router with metadata per route.
+
+    Once frozen, static paths are resolved with a dictionary lookup, unless an
+    earlier resource also matches them. Other paths are matched in order of
+    registration.
+    """
+
     def __init__(self) -> None:
         super().__init__()
-        self.config: dict = dict()
-        self.validators: dict = dict()
+        self._info: Dict[AbstractRoute, RouteInfo] = dict()
+        self._static: Optional[Dict[str, List[Tuple[AbstractRoute, RouteInfo]]]] = None
 
     def add_route(
         self,
-        *args,
-        config: Optional[dict] = None,
+        method: str,
+        path: str,
+        handler: Callable[..., Awaitable[Any]],
+        *,
+        config: Optional[Iterable[str]] = None,
         data_schema: Optional[dict] = None,
-        **kwargs
-    ):
-        route = super().add_route(*args, **kwargs)
-
-        if data_schema:
-            self.validators[route] = cerberus.Validator(data_schema)
+        timeout: Optional[float] = None,
+        middlewares: Optional[Iterable[Callable]] = None,
+        max_body_size: Optional[int] = None,
+        **kwargs,
+    ) -> AbstractRoute:
+        """
+        Args:
+            method: HTTP method of the route, ``*`` for any.
+            path: Path of the route.
+            handler: Handler of the requests.
+            config: Configuration of the route, e.g. ``["json", "pg"]``.
+            data_schema: Schema of the request data.
+            timeout: Deadline of the requests, in seconds.
+            middlewares: Middlewares of this route only, called with the
+                :class:`HttpRequest` after the middlewares of the application.
+            max_body_size: Maximum size of the request bodies in bytes, in
+                place of the ``client_max_size`` of the application. It is
+                enforced while the body is read.
+        """
+        info = RouteInfo(
+            config=frozenset(config or ()),
+            validator=Validator(data_schema) if data_schema else None,
+            timeout=timeout,
+            middlewares=tuple(middlewares or ()),
+            max_body_size=max_body_size,
+        )
+        if info.middlewares:
+            handler = _chain(handler, info.middlewares)
 
-        if config:
-            self.config[route] = set(config)
-        else:
-            self.config[route] = set()
+        route = super().add_route(method, path, handler, **kwargs)
+        self._info[route] = info
         return route
 
+    def info(self, route: AbstractRoute) -> RouteInfo:
+        return self._info.get(route, DEFAULT_ROUTE_INFO)
+
+    def freeze(self) -> None:
+        super().freeze()
+        self._static = dict()
+        dynamic: List[AbstractResource] = list()
+        for resource in self._resources:
+            if not isinstance(resource, PlainResource):
+                dynamic.append(resource)
+                continue
+
+            path = resource.get_info()["path"]
+            if path in self._static or any(
+                not isinstance(other, DynamicResource) or other._match(path) is not None
+                for other in dynamic
+            ):
+                # Matched by an earlier resource, resolved in order
+                continue
+            self._static[path] = [(route, self.info(route)) for route in resource]
+
     async def resolve(self, request: aiohttp.web.Request) -> AbstractMatchInfo:
+        if self._static is not None:
+            routes = self._static.get(request.rel_url.raw_path)
+            if routes is not None:
+                method = request.method
+                for route, info in routes:
+                    if route.method == method or route.method == hdrs.METH_ANY:
+                        request["route_info"] = info
+                        return UrlMappingMatchInfo({}, route)
+
         match_info = await super().resolve(request)
-        request["config"] = self.config.get(match_info.handler, ())
-        request["validator"] = self.validators.get(match_info.handler)
+        request["route_info"] = self.info(match_info.route)  # type: ignore
         return match_info
+
+
+def _chain(
+    handler: Callable[..., Awaitable[Any]], middlewares: Tuple[Callable, ...]
+) -> Callable[..., Awaitable[Any]]:
+    chain = handler
+    for middleware in reversed(middlewares):
+        chain = functools.partial(middleware, handler=chain)
+
+    @functools.wraps(handler)
+    async def route_handler(request: BaseRequest) -> Any:
+        return await chain(request)
+
+    return route_handler
+
+
+async def _ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    # Pieces of the line being received, joined once the line is complete
+    pending: List[bytes] = list()
+    async for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if len(lines) == 1:
+            pending.append(chunk)
+            continue
+
+        pending.append(lines[0])
+        lines[0] = b"".join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            if line.strip():
+                yield _loads(line)
+
+    line = b"".join(pending)
+    if line.strip():
+        yield _loads(line)
+
+
+def _loads(line: bytes) -> Any:
+    try:
+        return ujson.loads(line)
+    except ValueError as e:
+        raise DataValidationError({"body": [f"Invalid JSON record: {e}"]})
+
+
+async def _json_array_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    parser = _JSONArrayParser()
+    text = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        for record in parser.feed(text.decode(chunk)):
+            yield record
+
+    for record in parser.feed(text.decode(b"", final=True), eof=True):
+        yield record
+
+
+class _JSONArrayParser:
+    """
+    Incremental decoder of the elements of a JSON array.
+
+    Elements are decoded directly from the text when complete. Otherwise
+    their extent is scanned as the text is received, each character once,
+    and they are decoded once complete.
+    """
+
+    # Punctuation expected in each state, and the following state
+    TRANSITIONS = {
+        ("start", "["): "first",
+        ("first", "]"): "end",
+        ("separator", ","): "value",
+        ("separator", "]"): "end",
+    }
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._state = "start"
+        # Text of the element being received
+        self._pieces: List[str] = list()
+        self._scalar = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str, eof: bool = False) -> List[Any]:
+        records = list()
+        position = 0
+        if self._pieces:
+            end = self._scan(text, 0)
+            if end is None:
+                self._pieces.append(text)
+                position = len(text)
+            else:
+                self._pieces.append(text[:end])
+                records.append(self._decode("".join(self._pieces)))
+                self._pieces.clear()
+                position = end
+
+        while position < len(text):
+            position = self._next(text, position, records)
+
+        if eof and (self._pieces or self._state != "end"):
+            raise DataValidationError({"body": ["Incomplete JSON array"]})
+        return records
+
+    def _next(self, text: str, position: int, records: List[Any]) -> int:
+        position = _skip_whitespace(text, position)
+        if position == len(text):
+            return position
+
+        state = self.TRANSITIONS.get((self._state, text[position]))
+        if state is not None:
+            self._state = state
+            return position + 1
+        elif self._state not in ("first", "value"):
+            raise DataValidationError(
+                {"body": [f"Invalid JSON array at {text[position]!r}"]}
+            )
+
+        self._start(text[position])
+        if not self._scalar:
+            # Objects, arrays and strings are delimited, decoded if complete
+            try:
+                record, end = self._decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                pass
+            else:
+                records.append(record)
+                self._state = "separator"
+                return end
+
+        scanned = self._scan(text, position)
+        if scanned is None:
+            self._pieces.append(text[position:])
+            return len(text)
+
+        records.append(self._decode(text[position:scanned]))
+        return scanned
+
+    def _start(self, character: str) -> None:
+        self._scalar = character not in '{["'
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def _scan(self, text: str, position: int) -> Optional[int]:
+        """End of the element in ``text``, ``None`` if it continues after"""
+        if self._scalar:
+            match = _SCALAR_END.search(text, position)
+            return None if match is None else match.start()
+
+        if self._escaped:
+            if position == len(text):
+                return None
+            self._escaped = False
+            position += 1
+
+        while True:
+            pattern = _STRING_SCAN if self._in_string else _CONTAINER_SCAN
+            match = pattern.search(text, position)
+            if match is None:
+                return None
+
+            character, position = match.group(), match.end()
+            if character == "\\":
+                # Skip the escaped character, maybe in the next text
+                position += 1
+                if position > len(text):
+                    self._escaped = True
+                    return None
+            elif self._close(character):
+                return position
+
+    def _close(self, character: str) -> bool:
+        """Track the nesting of the element, ``True`` once it is closed"""
+        if character == '"':
+            self._in_string = not self._in_string
+            if self._in_string:
+                return False
+        elif character in "[{":
+            self._depth += 1
+            return False
+        else:
+            self._depth -= 1
+        return self._depth == 0
+
+    def _decode(self, element: str) -> Any:
+        try:
+            record, end = self._decoder.raw_decode(element)
+        except json.JSONDecodeError as e:
+            raise DataValidationError({"body": [f"Invalid JSON: {e}"]})
+        if end != len(element):
+            raise DataValidationError({"body": [f"Invalid JSON: {element!r}"]})
+
+        self._state = "separator"
+        return record
+
+
+def _skip_whitespace(buffer: str, position: int) -> int:
+    return _WHITESPACE.match(buffer, position).end()  # type: ignore
@@ -0,0 +1,365 @@
+import asyncio
+import collections
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Set
+
+import aioredis
+import ujson
+
+from .. import utils
+from ..base import BaseRunner, BaseSite
+from ..engines.redis import Redis
+from ..request import BaseRequest
+
+LOG = logging.getLogger(__name__)
+
+
+class Message:
+    def __init__(self, app, config, channel, pattern, payload):
+        self.app = app
+        self.config = config
+        self.channel = channel
+        self.pattern = pattern
+        self.payload = payload
+
+
+class Application(collections.MutableMapping):
+    def __init__(
+        self, middlewares: Optional[Iterable] = None, timeout: Optional[float] = None
+    ) -> None:
+
+        if middlewares:
+            middlewares = list(middlewares)
+            middlewares.insert(0, middleware)
+        else:
+            middlewares = (middleware,)
+
+        self.router = Router()
+        self.timeout = timeout
+        self._state: dict = dict()
+        self._middlewares = middlewares
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def cleanup(self) -> None:
+        pass
+
+    async def _handler(
+        self, channel: str, pattern: Optional[str], payload: bytes
+    ) -> None:
+        route, config = self.router.resolve(channel, pattern)
+        if route is None:
+            LOG.debug("No route for channel: %s", channel)
+            return
+
+        message = Message(
+            app=self, config=config, channel=channel, pattern=pattern, payload=payload
+        )
+        for middleware in reversed(self._middlewares):
+            route = functools.partial(middleware, handler=route)
+        await route(message)
+
+    # MutableMapping API
+    def __eq__(self, other):
+        return self is other
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def __setitem__(self, key, value):
+        self._state[key] = value
+
+    def __delitem__(self, key):
+        del self._state[key]
+
+    def __len__(self):
+        return len(self._state)
+
+    def __iter__(self):
+        return iter(self._state)
+
+
+class PubSubRequest(BaseRequest):
+    def __init__(self, message: Message) -> None:
+        super().__init__(message.app.state, timeout=message.app.timeout)
+        self._message = message
+
+    async def data(self) -> Any:
+        return ujson.loads(self._message.payload)
+
+    @property
+    def body(self) -> bytes:
+        return self._message.payload
+
+    @property
+    def initial(self) -> Message:
+        return self._message
+
+    @property
+    def config(self) -> Any:
+        return self._message.config
+
+    @property
+    def method(self) -> None:
+        return None
+
+    @property
+    def path(self) -> str:
+        return self._message.channel
+
+
+async def middleware(
+    message: Message, handler: Callable[[BaseRequest], Awaitable[None]]
+):
+    request = PubSubRequest(message)
+    await handler(request)
+
+
+class Router:
+    def __init__(self) -> None:
+        self._channels: dict = dict()
+        self._patterns: dict = dict()
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self._channels)
+
+    @property
+    def patterns(self) -> List[str]:
+        return list(self._patterns)
+
+    def add(
+        self,
+        channel: str,
+        handler: Callable[..., Awaitable[None]],
+        config: Any = None,
+        pattern: bool = False,
+    ) -> None:
+        """
+        Route the messages of ``channel`` to ``handler``.
+
+        Args:
+            channel: Channel name, or glob-style pattern if ``pattern`` is set.
+            handler: Coroutine function called with the request.
+            config: Route configuration, see :attr:`PubSubRequest.config`.
+            pattern: Subscribe with PSUBSCRIBE.
+        """
+        if pattern:
+            self._patterns[channel] = (handler, config)
+        else:
+            self._channels[channel] = (handler, config)
+
+    def resolve(self, channel: str, pattern: Optional[str] = None) -> tuple:
+        if pattern is not None:
+            return self._patterns.get(pattern, (None, None))
+        return self._channels.get(channel, (None, None))
+
+
+class AppRunner(BaseRunner):
+    def __init__(self, app: Application) -> None:
+        super().__init__()
+        self._app = app
+
+    async def shutdown(self) -> None:
+        await self._app.shutdown()
+
+    async def _make_server(self) -> "PubSubServer":
+        return PubSubServer(self._app._handler, self._app.router)
+
+    async def _cleanup_server(self) -> None:
+        await self._app.cleanup()
+
+
+class PubSubServer:
+    def __init__(
+        self,
+        handler: Callable[[str, Optional[str], bytes], Awaitable[None]],
+        router: Router,
+    ) -> None:
+        self.handler = handler
+        self.router = router
+
+    async def shutdown(self, timeout: int) -> None:
+        pass
+
+
+class Subscriber:
+    """
+    Subscribe to the routed channels and dispatch their messages.
+
+    Presents the unified server interface to the site.
+    """
+
+    def __init__(
+        self,
+        server: PubSubServer,
+        redis: Redis,
+        *,
+        concurrency: int,
+        reconnection_timeoff: float,
+        reconnection_backoff: float,
+        shutdown_timeout: float,
+    ) -> None:
+        self._server = server
+        self._redis = redis
+        self._concurrency = concurrency
+        self._reconnection_timeoff = reconnection_timeoff
+        self._reconnection_backoff = reconnection_backoff
+        self._shutdown_timeout = shutdown_timeout
+        self._loop = asyncio.get_event_loop()
+        self._tasks: Set[asyncio.Task] = set()
+        self._slot = asyncio.Event()
+        self._connection: Optional[aioredis.RedisConnection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats: collections.Counter = collections.Counter()
+
+    def start(self) -> None:
+        self._task = self._loop.create_task(self._listen())
+
+    def close(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._close_connection()
+
+    async def wait_closed(self) -> None:
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=self._shutdown_timeout)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribed": self._connection is not None,
+            "in_flight": len(self._tasks),
+            **self._stats,
+        }
+
+    async def _listen(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                receiver = await self._subscribe()
+            except (OSError, aioredis.RedisError, asyncio.TimeoutError) as e:
+                delay = utils.backoff_delay(
+                    attempt, self._reconnection_backoff, self._reconnection_timeoff
+                )
+                LOG.error("Redis subscription error, retrying in %.2fs: %r", delay, e)
+                self._close_connection()
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            attempt = 0
+            while await receiver.wait_message():
+                while len(self._tasks) >= self._concurrency:
+                    self._slot.clear()
+                    await self._slot.wait()
+
+                message = await receiver.get()
+                if message is None:
+                    break
+                sender, data = message
+                if sender.is_pattern:
+                    channel, payload = data
+                    self._dispatch(_decode(channel), _decode(sender.name), payload)
+                else:
+                    self._dispatch(_decode(sender.name), None, data)
+
+            LOG.warning("Redis subscription lost, resubscribing")
+            self._stats["reconnections"] += 1
+            self._close_connection()
+
+    async def _subscribe(self) -> aioredis.pubsub.Receiver:
+        self._connection = await self._redis.create_connection()
+        receiver = aioredis.pubsub.Receiver()
+        channels = [receiver.channel(name) for name in self._server.router.channels]
+        patterns = [receiver.pattern(name) for name in self._server.router.patterns]
+        if channels:
+            await self._connection.execute_pubsub("SUBSCRIBE", *channels)
+        if patterns:
+            await self._connection.execute_pubsub("PSUBSCRIBE", *patterns)
+        LOG.debug(
+            "Subscribed to %s channels and %s patterns", len(channels), len(patterns)
+        )
+        return receiver
+
+    def _dispatch(self, channel: str, pattern: Optional[str], payload: bytes) -> None:
+        self._stats["received"] += 1
+        task = self._loop.create_task(self._handle(channel, pattern, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_completed)
+
+    async def _handle(
+        self, channel: str, pattern: Optional[str], payload: bytes
+    ) -> None:
+        try:
+            await self._server.handler(channel, pattern, payload)
+        except Exception:
+            LOG.exception("Exception while handling message of %s", channel)
+            self._stats["failed"] += 1
+
+    def _task_completed(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slot.set()
+
+    def _close_connection(self) -> None:
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+class PubSubSite(BaseSite):
+    """
+    Receive Redis pub/sub messages on a dedicated connection.
+
+    Messages published while the connection is lost are not received.
+
+    Args:
+        runner: Runner of a :class:`Application`.
+        redis: Redis engine.
+        concurrency: Maximum number of messages handled at once.
+    """
+
+    def __init__(
+        self,
+        runner: BaseRunner,
+        redis: Redis,
+        *,
+        concurrency: int = 100,
+        reconnection_timeoff: float = 10,
+        reconnection_backoff: float = 0.5,
+        shutdown_timeout: float = 60.0,
+    ) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._redis = redis
+        self._concurrency = concurrency
+        self._reconnection_timeoff = reconnection_timeoff
+        self._reconnection_backoff = reconnection_backoff
+
+    @property
+    def name(self) -> str:
+        return "redis-pubsub://"
+
+    async def start(self) -> None:
+        await super().start()
+        subscriber = Subscriber(
+            self._runner.server,
+            self._redis,
+            concurrency=self._concurrency,
+            reconnection_timeoff=self._reconnection_timeoff,
+            reconnection_backoff=self._reconnection_backoff,
+            shutdown_timeout=self._shutdown_timeout,
+        )
+        subscriber.start()
+        self._server = subscriber
+
+    def metrics(self) -> dict:
+        if self._server:
+            return self._server.metrics()
+        return dict()
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
@@ -0,0 +1,502 @@
+import asyncio
+import collections
+import functools
+import logging
+import socket
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis
+import async_timeout
+
+from .. import utils
+from ..base import BaseRunner, BaseSite
+from ..engines.redis import Redis
+from ..request import BaseRequest
+
+LOG = logging.getLogger(__name__)
+
+
+class Entry:
+    def __init__(self, app, config, stream, id, fields):
+        self.app = app
+        self.config = config
+        self.stream = stream
+        self.id = id
+        self.fields = fields
+
+
+class Application(collections.MutableMapping):
+    def __init__(
+        self, middlewares: Optional[Iterable] = None, timeout: Optional[float] = None
+    ) -> None:
+
+        if middlewares:
+            middlewares = list(middlewares)
+            middlewares.insert(0, middleware)
+        else:
+            middlewares = (middleware,)
+
+        self.router = Router()
+        self.timeout = timeout
+        self._state: dict = dict()
+        self._middlewares = middlewares
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def cleanup(self) -> None:
+        pass
+
+    async def _handler(self, stream: str, id: str, fields: dict) -> None:
+        route, config = self.router.resolve(stream)
+        if route is None:
+            LOG.debug("No route for stream: %s", stream)
+            return
+
+        entry = Entry(app=self, config=config, stream=stream, id=id, fields=fields)
+        for middleware in reversed(self._middlewares):
+            route = functools.partial(middleware, handler=route)
+        await route(entry)
+
+    # MutableMapping API
+    def __eq__(self, other):
+        return self is other
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def __setitem__(self, key, value):
+        self._state[key] = value
+
+    def __delitem__(self, key):
+        del self._state[key]
+
+    def __len__(self):
+        return len(self._state)
+
+    def __iter__(self):
+        return iter(self._state)
+
+
+class StreamRequest(BaseRequest):
+    def __init__(self, entry: Entry) -> None:
+        super().__init__(entry.app.state, timeout=entry.app.timeout)
+        self._entry = entry
+
+    async def data(self) -> dict:
+        return self._entry.fields
+
+    @property
+    def initial(self) -> Entry:
+        return self._entry
+
+    @property
+    def config(self) -> Any:
+        return self._entry.config
+
+    @property
+    def method(self) -> None:
+        return None
+
+    @property
+    def path(self) -> str:
+        return self._entry.stream
+
+
+async def middleware(entry: Entry, handler: Callable[[BaseRequest], Awaitable[None]]):
+    request = StreamRequest(entry)
+    timeout = async_timeout.timeout(request.remaining())
+    try:
+        async with timeout:
+            await handler(request)
+    except asyncio.TimeoutError:
+        if not timeout.expired:
+            raise
+        LOG.warning("Deadline exceeded handling entry %s of %s", entry.id, entry.stream)
+        # Not acknowledged, the entry stays pending until claimed again
+        raise
+
+
+class Router:
+    def __init__(self) -> None:
+        self._routes: dict = dict()
+
+    @property
+    def streams(self) -> List[str]:
+        return list(self._routes)
+
+    def add(
+        self, stream: str, handler: Callable[..., Awaitable[None]], config: Any = None
+    ) -> None:
+        self._routes[stream] = (handler, config)
+
+    def resolve(self, stream: str) -> tuple:
+        return self._routes.get(stream, (None, None))
+
+
+class AppRunner(BaseRunner):
+    def __init__(self, app: Application) -> None:
+        super().__init__()
+        self._app = app
+
+    async def shutdown(self) -> None:
+        await self._app.shutdown()
+
+    async def _make_server(self) -> "StreamServer":
+        return StreamServer(self._app._handler, self._app.router)
+
+    async def _cleanup_server(self) -> None:
+        await self._app.cleanup()
+
+
+class StreamServer:
+    def __init__(
+        self, handler: Callable[[str, str, dict], Awaitable[None]], router: Router
+    ) -> None:
+        self.handler = handler
+        self.router = router
+
+    async def shutdown(self, timeout: int) -> None:
+        pass
+
+
+class StreamConsumer:
+    """
+    Consume the streams of a group and dispatch their entries.
+
+    Presents the unified server interface to the site.
+    """
+
+    def __init__(
+        self,
+        server: StreamServer,
+        redis: Redis,
+        *,
+        group: str,
+        consumer: str,
+        count: int,
+        block: int,
+        concurrency: int,
+        ack_batch: int,
+        ack_interval: float,
+        claim_interval: float,
+        claim_idle: int,
+        max_deliveries: Optional[int],
+        reconnection_timeoff: float,
+        reconnection_backoff: float,
+        shutdown_timeout: float,
+    ) -> None:
+        self._server = server
+        self._redis = redis
+        self._group = group
+        self._consumer = consumer
+        self._count = count
+        self._block = block
+        self._concurrency = concurrency
+        self._ack_batch = ack_batch
+        self._ack_interval = ack_interval
+        self._claim_interval = claim_interval
+        self._claim_idle = claim_idle
+        self._max_deliveries = max_deliveries
+        self._reconnection_timeoff = reconnection_timeoff
+        self._reconnection_backoff = reconnection_backoff
+        self._shutdown_timeout = shutdown_timeout
+        self._loop = asyncio.get_event_loop()
+        self._streams = server.router.streams
+        self._tasks: Set[asyncio.Task] = set()
+        self._handling: Set[Tuple[str, str]] = set()
+        self._acking: Set[Tuple[str, str]] = set()
+        self._slot = asyncio.Event()
+        self._acks: Dict[str, List[str]] = collections.defaultdict(list)
+        self._ack_handle: Optional[asyncio.TimerHandle] = None
+        self._connection: Optional[aioredis.RedisConnection] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._claimer: Optional[asyncio.Task] = None
+        self._stats: collections.Counter = collections.Counter()
+
+    def start(self) -> None:
+        self._reader = self._loop.create_task(self._read())
+        if self._claim_interval:
+            self._claimer = self._loop.create_task(self._claim())
+
+    def close(self) -> None:
+        for task in (self._reader, self._claimer):
+            if task and not task.done():
+                task.cancel()
+        if self._connection:
+            self._connection.close()
+
+    async def wait_closed(self) -> None:
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=self._shutdown_timeout)
+        await self._flush_acks()
+
+    def metrics(self) -> dict:
+        return {"in_flight": len(self._tasks), **self._stats}
+
+    async def _read(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                self._connection = await self._redis.create_connection()
+                await self._create_groups()
+                attempt = 0
+                await self._read_entries(self._connection)
+            except (OSError, aioredis.RedisError, asyncio.TimeoutError) as e:
+                delay = utils.backoff_delay(
+                    attempt, self._reconnection_backoff, self._reconnection_timeoff
+                )
+                LOG.error(
+                    "Redis stream consumer error, retrying in %.2fs: %r", delay, e
+                )
+                attempt += 1
+                if self._connection:
+                    self._connection.close()
+                    self._connection = None
+                await asyncio.sleep(delay)
+
+    async def _create_groups(self) -> None:
+        for stream in self._streams:
+            try:
+                await self._connection.execute(  # type: ignore
+                    "XGROUP", "CREATE", stream, self._group, "$", "MKSTREAM"
+                )
+            except aioredis.ReplyError as e:
+                if not str(e).startswith("BUSYGROUP"):
+                    raise
+
+    async def _read_entries(self, connection: aioredis.RedisConnection) -> None:
+        # Start with the entries delivered to this consumer but not acknowledged
+        ids = {stream: "0" for stream in self._streams}
+        while True:
+            await self._wait_slot()
+            count = min(self._count, self._concurrency - len(self._tasks))
+            reply = await connection.execute(
+                "XREADGROUP",
+                "GROUP",
+                self._group,
+                self._consumer,
+                "COUNT",
+                count,
+                "BLOCK",
+                self._block,
+                "STREAMS",
+                *ids.keys(),
+                *ids.values(),
+            )
+            for stream, entries in reply or ():
+                stream = _decode(stream)
+                if ids[stream] != ">" and not entries:
+                    ids[stream] = ">"
+                for id, fields in entries:
+                    id = _decode(id)
+                    if ids[stream] != ">":
+                        ids[stream] = id
+                        if self._busy(stream, id):
+                            continue
+                    self._dispatch(stream, id, fields)
+
+    async def _claim(self) -> None:
+        while True:
+            await asyncio.sleep(self._claim_interval)
+            for stream in self._streams:
+                try:
+                    await self._claim_stream(stream)
+                except (OSError, aioredis.RedisError, asyncio.TimeoutError) as e:
+                    LOG.warning("Failed to claim pending entries of %s: %r", stream, e)
+
+    async def _claim_stream(self, stream: str) -> None:
+        pending = await self._redis.execute(
+            "XPENDING", stream, self._group, "-", "+", self._count
+        )
+        ids = list()
+        for id, consumer, idle, deliveries in pending:
+            # Entries of this consumer are retried too, unless being handled
+            if idle < self._claim_idle or self._busy(stream, _decode(id)):
+                continue
+            elif self._max_deliveries and deliveries >= self._max_deliveries:
+                LOG.error(
+                    "Dropping entry %s of %s after %s deliveries",
+                    id,
+                    stream,
+                    deliveries,
+                )
+                self._stats["dropped"] += 1
+                self._ack(stream, _decode(id))
+            else:
+                ids.append(id)
+
+        if not ids:
+            return
+
+        entries = await self._redis.execute(
+            "XCLAIM", stream, self._group, self._consumer, self._claim_idle, *ids
+        )
+        claimed = [(_decode(id), fields) for id, fields in entries]
+        # Reserved while waiting for a slot, so that no read dispatches them too
+        self._handling.update((stream, id) for id, _ in claimed)
+        for index, (id, fields) in enumerate(claimed):
+            if fields is not None:
+                try:
+                    await self._wait_slot()
+                except asyncio.CancelledError:
+                    self._handling.difference_update(
+                        (stream, id) for id, _ in claimed[index:]
+                    )
+                    raise
+                self._stats["claimed"] += 1
+            self._dispatch(stream, id, fields)
+
+    async def _wait_slot(self) -> None:
+        while len(self._tasks) >= self._concurrency:
+            self._slot.clear()
+            await self._slot.wait()
+
+    def _busy(self, stream: str, id: str) -> bool:
+        """Whether the entry is being handled or its acknowledgement not sent yet"""
+        return (stream, id) in self._handling or (stream, id) in self._acking
+
+    def _dispatch(self, stream: str, id: str, fields: Optional[list]) -> None:
+        if fields is None:
+            # Pending entry trimmed from the stream, nothing left to handle
+            LOG.warning("Dropping deleted entry %s of %s", id, stream)
+            self._stats["deleted"] += 1
+            self._handling.discard((stream, id))
+            self._ack(stream, id)
+            return
+
+        self._handling.add((stream, id))
+        data = {_decode(k): _decode(v) for k, v in zip(fields[::2], fields[1::2])}
+        task = self._loop.create_task(self._handle(stream, id, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_completed)
+
+    async def _handle(self, stream: str, id: str, fields: dict) -> None:
+        try:
+            await self._server.handler(stream, id, fields)
+        except Exception:
+            LOG.exception("Exception while handling entry %s of %s", id, stream)
+            self._stats["failed"] += 1
+        else:
+            self._stats["handled"] += 1
+            self._ack(stream, id)
+        finally:
+            self._handling.discard((stream, id))
+
+    def _task_completed(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slot.set()
+
+    def _ack(self, stream: str, id: str) -> None:
+        self._acks[stream].append(id)
+        self._acking.add((stream, id))
+        if sum(len(ids) for ids in self._acks.values()) >= self._ack_batch:
+            self._loop.create_task(self._flush_acks())
+        elif self._ack_handle is None:
+            self._ack_handle = self._loop.call_later(
+                self._ack_interval, lambda: self._loop.create_task(self._flush_acks())
+            )
+
+    async def _flush_acks(self) -> None:
+        if self._ack_handle:
+            self._ack_handle.cancel()
+            self._ack_handle = None
+
+        acks, self._acks = self._acks, collections.defaultdict(list)
+        for stream, ids in acks.items():
+            try:
+                await self._redis.execute("XACK", stream, self._group, *ids)
+            except Exception as e:
+                # Left pending, the entries will be delivered again
+                LOG.error(
+                    "Failed to acknowledge %s entries of %s: %r", len(ids), stream, e
+                )
+            finally:
+                self._acking.difference_update((stream, id) for id in ids)
+
+
+class StreamSite(BaseSite):
+    """
+    Consume Redis streams with a consumer group.
+
+    Args:
+        runner: Runner of a :class:`Application`.
+        redis: Redis engine.
+        group: Name of the consumer group, created if missing.
+        consumer: Name of the consumer, defaults to the hostname.
+        count: Maximum number of entries read at once.
+        block: Maximum time blocking on a read, in milliseconds.
+        concurrency: Maximum number of entries handled at once.
+        ack_batch: Number of acknowledgements sent together.
+        ack_interval: Maximum delay of an acknowledgement, in seconds.
+        claim_interval: Interval between two reclaims of the entries pending
+            on other consumers, in seconds. ``0`` disables the reclaim.
+        claim_idle: Idle time after which a pending entry is reclaimed, in
+            milliseconds.
+        max_deliveries: Number of deliveries after which a pending entry is
+            acknowledged and dropped.
+    """
+
+    def __init__(
+        self,
+        runner: BaseRunner,
+        redis: Redis,
+        *,
+        group: str,
+        consumer: Optional[str] = None,
+        count: int = 100,
+        block: int = 5000,
+        concurrency: int = 100,
+        ack_batch: int = 100,
+        ack_interval: float = 0.1,
+        claim_interval: float = 30,
+        claim_idle: int = 60000,
+        max_deliveries: Optional[int] = None,
+        reconnection_timeoff: float = 10,
+        reconnection_backoff: float = 0.5,
+        shutdown_timeout: float = 60.0,
+    ) -> None:
+        super().__init__(runner, shutdown_timeout=shutdown_timeout)
+        self._redis = redis
+        self._group = group
+        self._consumer = consumer or socket.gethostname()
+        self._options = dict(
+            count=count,
+            block=block,
+            concurrency=concurrency,
+            ack_batch=ack_batch,
+            ack_interval=ack_interval,
+            claim_interval=claim_interval,
+            claim_idle=claim_idle,
+            max_deliveries=max_deliveries,
+            reconnection_timeoff=reconnection_timeoff,
+            reconnection_backoff=reconnection_backoff,
+        )
+
+    @property
+    def name(self) -> str:
+        return f"redis-streams://{self._group}/{self._consumer}"
+
+    async def start(self) -> None:
+        await super().start()
+        consumer = StreamConsumer(
+            self._runner.server,
+            self._redis,
+            group=self._group,
+            consumer=self._consumer,
+            shutdown_timeout=self._shutdown_timeout,
+            **self._options,  # type: ignore
+        )
+        consumer.start()
+        self._server = consumer
+
+    def metrics(self) -> dict:
+        if self._server:
+            return self._server.metrics()
+        return dict()
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
@@ -1,7 +1,7 @@
 import asyncio
 import collections
 import logging
-from typing import Awaitable, Callable, Optional, Tuple, Union
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
 
 from ..base import BaseRunner
 
@@ -18,6 +18,13 @@ class Application(collections.MutableMapping):
     async def _handler(self, data: Union[str, bytes], addr: Tuple[str, int]) -> None:
         LOG.debug(data, addr)
 
+    async def _batch_handler(self, batch: List[Tuple[bytes, Tuple[str, int]]]) -> None:
+        for data, addr in batch:
+            try:
+                await self._handler(data, addr)
+            except Exception:
+                LOG.exception("Exception while handling syslog message from %s", addr)
+
     def __init__(self) -> None:
         self._state: dict = dict()
 
@@ -42,15 +49,27 @@ class Application(collections.MutableMapping):
 
 
 class AppRunner(BaseRunner):
-    def __init__(self, app: Application) -> None:
+    """
+    Args:
+        app: Syslog application.
+        max_batches: Maximum number of batches of datagrams handled at once,
+            reading is paused above it.
+    """
+
+    def __init__(self, app: Application, *, max_batches: int = 16) -> None:
         super().__init__()
         self._app = app
+        self._max_batches = max_batches
 
     async def shutdown(self) -> None:
         await self._app.shutdown()
 
     async def _make_server(self) -> "SyslogServer":
-        return SyslogServer(self._app._handler)
+        return SyslogServer(
+            self._app._handler,
+            batch_handler=self._app._batch_handler,
+            max_batches=self._max_batches,
+        )
 
     async def _cleanup_server(self) -> None:
         await self._app.cleanup()
@@ -58,12 +77,22 @@ class AppRunner(BaseRunner):
 
 class SyslogServer:
     def __init__(
-        self, handler: Callable[[Union[str, bytes], Tuple[str, int]], Awaitable[None]]
+        self,
+        handler: Callable[[Union[str, bytes], Tuple[str, int]], Awaitable[None]],
+        *,
+        batch_handler: Optional[Callable[[list], Awaitable[None]]] = None,
+        max_batches: int = 16,
     ) -> None:
         self._handler = handler
+        self._batch_handler = batch_handler
+        self._max_batches = max_batches
 
     def __call__(self) -> "SyslogProtocol":
-        return SyslogProtocol(handler=self._handler)
+        return SyslogProtocol(
+            handler=self._handler,
+            batch_handler=self._batch_handler,
+            max_batches=self._max_batches,
+        )
 
     async def shutdown(self, timeout) -> None:
         pass
@@ -71,9 +100,17 @@ class SyslogServer:
 
 class SyslogProtocol(asyncio.Protocol, asyncio.DatagramProtocol):
     def __init__(
-        self, handler: Callable[[Union[str, bytes], Tuple[str, int]], Awaitable[None]]
+        self,
+        handler: Callable[[Union[str, bytes], Tuple[str, int]], Awaitable[None]],
+        *,
+        batch_handler: Optional[Callable[[list], Awaitable[None]]] = None,
+        max_batches: int = 16,
     ) -> None:
         self._handler = handler
+        self._batch_handler = batch_handler
+        self._max_batches = max_batches
+        self._batches = 0
+        self._paused = False
         self.transport: Optional[asyncio.BaseTransport] = None
 
     def connection_made(self, transport: asyncio.BaseTransport) -> None:
@@ -89,3 +126,24 @@ class SyslogProtocol(asyncio.Protocol, asyncio.DatagramProtocol):
 
     def datagram_received(self, data: Union[str, bytes], addr: Tuple[str, int]) -> None:
         asyncio.ensure_future(self._handler(data, addr))
+
+    def datagrams_received(self, batch: List[Tuple[bytes, Tuple[str, int]]]) -> None:
+        """Handle a batch of datagrams in a single task"""
+        if self._batch_handler is None:
+            for data, addr in batch:
+                self.datagram_received(data, addr)
+            return
+
+        self._batches += 1
+        task = asyncio.ensure_future(self._batch_handler(batch))
+        task.add_done_callback(self._batch_done)
+        if self._batches >= self._max_batches and not self._paused:
+            self._paused = True
+            self.transport.pause_reading()  # type: ignore
+
+    def _batch_done(self, task: asyncio.Future) -> None:
+        self._batches -= 1
+        if self._paused and self._batches < self._max_batches:
+            self._paused = False
+            if not self.transport.is_closing():  # type: ignore
+                self.transport.resume_reading()  # type: ignore
@@ -0,0 +1,268 @@
+import asyncio
+import collections
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Union
+
+import aiohttp
+import aiohttp.http_websocket
+import async_timeout
+import ujson
+
+from ..base import BaseRunner
+from ..request import BaseRequest
+from ..sites.websocket import WSProtocol, WSServerTransport, encode_frame
+
+LOG = logging.getLogger(__name__)
+
+
+class Message:
+    def __init__(self, app, config, data, connection):
+        self.app = app
+        self.config = config
+        self.data = data
+        self.connection = connection
+
+    @property
+    def type(self):
+        return self.data.get("type", "").lower()
+
+
+class Application(collections.MutableMapping):
+    """
+    Websocket application with topics.
+
+    JSON messages from the clients are routed by their ``type``. The
+    ``subscribe`` and ``unsubscribe`` messages manage the topics of the
+    client, ``{"type": "subscribe", "topic": "calls"}``.
+    """
+
+    def __init__(
+        self, middlewares: Optional[Iterable] = None, timeout: Optional[float] = None
+    ) -> None:
+
+        if middlewares:
+            middlewares = list(middlewares)
+            middlewares.insert(0, middleware)
+        else:
+            middlewares = (middleware,)
+
+        self.router = Router()
+        self.timeout = timeout
+        self._state: dict = dict()
+        self._middlewares = middlewares
+        self._topics: Dict[str, Set[WSServerTransport]] = collections.defaultdict(set)
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def cleanup(self) -> None:
+        pass
+
+    def publish(self, topic: str, data: Any) -> int:
+        """
+        Send ``data`` to the clients subscribed to ``topic``.
+
+        The message is encoded and framed once for all the clients.
+        Returns the number of clients it was queued for.
+        """
+        clients = self._topics.get(topic)
+        if not clients:
+            return 0
+
+        if not isinstance(data, (str, bytes)):
+            data = ujson.dumps(data)
+        frame = encode_frame(data)
+        return sum(client.write_frame(frame) for client in list(clients))
+
+    def subscribe(self, connection: WSServerTransport, topic: str) -> None:
+        self._topics[topic].add(connection)
+
+    def unsubscribe(self, connection: WSServerTransport, topic: str) -> None:
+        clients = self._topics.get(topic)
+        if clients is not None:
+            clients.discard(connection)
+            if not clients:
+                del self._topics[topic]
+
+    def subscribers(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def _disconnected(self, connection: WSServerTransport) -> None:
+        for topic in list(self._topics):
+            self.unsubscribe(connection, topic)
+
+    async def _handler(self, data: dict, connection: WSServerTransport) -> None:
+        message_type = data.get("type")
+        if message_type == "subscribe":
+            self.subscribe(connection, data["topic"])
+            return
+        elif message_type == "unsubscribe":
+            self.unsubscribe(connection, data["topic"])
+            return
+
+        route, config = self.router.resolve(str(message_type).lower())
+        if route is None:
+            LOG.debug("No route for websocket message: %s", message_type)
+            return
+
+        message = Message(app=self, config=config, data=data, connection=connection)
+        for middleware in reversed(self._middlewares):
+            route = functools.partial(middleware, handler=route)
+        await route(message)
+
+    # MutableMapping API
+    def __eq__(self, other):
+        return self is other
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def __setitem__(self, key, value):
+        self._state[key] = value
+
+    def __delitem__(self, key):
+        del self._state[key]
+
+    def __len__(self):
+        return len(self._state)
+
+    def __iter__(self):
+        return iter(self._state)
+
+
+class WebsocketRequest(BaseRequest):
+    def __init__(self, message: Message) -> None:
+        super().__init__(message.app.state, timeout=message.app.timeout)
+        self._message = message
+
+    async def data(self) -> dict:
+        return self._message.data
+
+    def send(self, data: Any) -> bool:
+        """Send ``data`` to the client of the request only"""
+        if not isinstance(data, (str, bytes)):
+            data = ujson.dumps(data)
+        return self._message.connection.send(data)
+
+    @property
+    def connection(self) -> WSServerTransport:
+        return self._message.connection
+
+    @property
+    def initial(self) -> Message:
+        return self._message
+
+    @property
+    def config(self) -> Any:
+        return self._message.config
+
+    @property
+    def method(self) -> None:
+        return None
+
+    @property
+    def path(self) -> str:
+        return self._message.type
+
+
+async def middleware(
+    message: Message, handler: Callable[[BaseRequest], Awaitable[None]]
+):
+    request = WebsocketRequest(message)
+    timeout = async_timeout.timeout(request.remaining())
+    try:
+        async with timeout:
+            await handler(request)
+    except asyncio.TimeoutError:
+        if not timeout.expired:
+            raise
+        LOG.warning("Deadline exceeded handling message: %s", message.type)
+
+
+class Router:
+    def __init__(self) -> None:
+        self._routes: dict = dict()
+
+    def add(
+        self,
+        message_type: str,
+        handler: Callable[..., Awaitable[None]],
+        config: Any = None,
+    ) -> None:
+        self._routes[message_type.lower()] = (handler, config)
+
+    def resolve(self, message_type: str) -> tuple:
+        return self._routes.get(message_type, (None, None))
+
+
+class AppRunner(BaseRunner):
+    def __init__(self, app: Application) -> None:
+        super().__init__()
+        self._app = app
+
+    async def shutdown(self) -> None:
+        await self._app.shutdown()
+
+    async def _make_server(self) -> "WebsocketServer":
+        return WebsocketServer(self._app)
+
+    async def _cleanup_server(self) -> None:
+        await self._app.cleanup()
+
+
+class WebsocketServer:
+    def __init__(self, app: Application) -> None:
+        self._app = app
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __call__(self) -> "WebsocketProtocol":
+        return WebsocketProtocol(self._app, self._tasks)
+
+    async def shutdown(self, timeout: int) -> None:
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+
+class WebsocketProtocol(WSProtocol):
+    def __init__(self, app: Application, tasks: Set[asyncio.Task]) -> None:
+        self._app = app
+        self._tasks = tasks
+        self._transport: Optional[WSServerTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self._transport is not None:
+            self._app._disconnected(self._transport)
+
+    def message_received(
+        self,
+        message_type: aiohttp.http_websocket.WSMsgType,
+        data: Union[str, bytes, aiohttp.http_websocket.WSCloseCode],
+        extra: str,
+    ):
+        if not isinstance(data, (str, bytes)):
+            LOG.debug("Unhandled websocket message: %s", message_type)
+            return
+
+        try:
+            payload = ujson.loads(data)  # type: ignore
+        except ValueError:
+            LOG.warning("Invalid websocket message: %r", data)
+            return
+
+        if not isinstance(payload, dict):
+            LOG.warning("Invalid websocket message: %r", data)
+            return
+
+        task = asyncio.create_task(self._handle(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, payload: dict) -> None:
+        try:
+            await self._app._handler(payload, self._transport)  # type: ignore
+        except Exception:
+            LOG.exception("Exception while handling websocket message")
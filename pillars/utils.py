@@ -1,5 +1,6 @@
 import json
 import logging
+import random
 import uuid
 
 
@@ -13,3 +14,15 @@ class JSONUUIDEncoder(json.JSONEncoder):
         if isinstance(o, uuid.UUID):
             return o.hex
         return super().default(self, o)
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of consecutive failures (starting at 0).
+        base: Delay of the first attempt in seconds.
+        maximum: Upper bound of the delay in seconds.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
@@ -0,0 +1,518 @@
+"""
+Data validation with schemas compiled once, when the route is registered.
+
+Schemas use the cerberus_ syntax and are checked by cerberus when compiled.
+Documents are validated by specialised functions with the semantics and the
+error messages of :class:`cerberus.Validator`. Schemas using rules without a
+compiled implementation are validated by cerberus.
+
+Compiled rules: ``allow_unknown`` (boolean), ``allowed``, ``coerce``
+(callables), ``default``, ``empty``, ``max``, ``maxlength``, ``meta``,
+``min``, ``minlength``, ``nullable``, ``readonly``, ``regex``, ``required``,
+``schema`` (with a ``dict`` or ``list`` type) and ``type``.
+
+.. _cerberus: http://docs.python-cerberus.org
+"""
+import copy
+import logging
+import re
+from collections.abc import Iterable, Mapping, Sequence, Sized
+from datetime import date, datetime
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cerberus
+
+from .exceptions import DataValidationError
+
+LOG = logging.getLogger(__name__)
+
+TYPES: Dict[str, Tuple[tuple, tuple]] = {
+    "binary": ((bytes, bytearray), ()),
+    "boolean": ((bool,), ()),
+    "date": ((date,), ()),
+    "datetime": ((datetime,), ()),
+    "dict": ((Mapping,), ()),
+    "float": ((float, int), ()),
+    "integer": ((int,), ()),
+    "list": ((Sequence,), (str,)),
+    "number": ((int, float), (bool,)),
+    "set": ((set,), ()),
+    "string": ((str,), ()),
+}
+
+RULES = frozenset(
+    (
+        "allow_unknown",
+        "allowed",
+        "coerce",
+        "default",
+        "empty",
+        "max",
+        "maxlength",
+        "meta",
+        "min",
+        "minlength",
+        "nullable",
+        "readonly",
+        "regex",
+        "required",
+        "schema",
+        "type",
+    )
+)
+
+# Rules skipped for empty values, when the ``empty`` rule is set
+_SIZED_RULES = ("allowed", "maxlength", "minlength", "regex")
+
+Check = Callable[[Any], Optional[str]]
+
+
+class Validator:
+    """
+    Validate and normalize documents against a schema.
+
+    Args:
+        schema: Cerberus schema of the documents.
+        allow_unknown: Accept the fields missing from the schema.
+    """
+
+    def __init__(self, schema: dict, *, allow_unknown: bool = False) -> None:
+        self.schema = schema
+        self._cerberus = cerberus.Validator(schema, allow_unknown=allow_unknown)
+        self._compiled: Optional[_Mapping]
+        try:
+            self._compiled = _Mapping(schema, allow_unknown)
+        except _Unsupported as e:
+            LOG.debug("Schema validated by cerberus, %s", e)
+            self._compiled = None
+
+    @property
+    def compiled(self) -> bool:
+        return self._compiled is not None
+
+    def validate(self, document: Mapping) -> dict:
+        """
+        Return the normalized copy of ``document``.
+
+        Raises:
+            DataValidationError: ``document`` is invalid.
+        """
+        if self._compiled is None or not isinstance(document, Mapping):
+            if self._cerberus.validate(document):
+                return self._cerberus.document
+            raise DataValidationError(self._cerberus.errors)
+
+        errors = _Errors()
+        normalized = self._compiled.normalize(document, errors)
+        self._compiled.validate(normalized, errors)
+        if errors:
+            raise DataValidationError(errors.tree())
+        return normalized
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Errors(dict):
+    """Errors of a document, by field, formatted like cerberus once complete"""
+
+    def __init__(self, nested: bool = False) -> None:
+        super().__init__()
+        self.nested = nested
+        self.children: Dict[Any, _Errors] = dict()
+
+    def __bool__(self) -> bool:
+        return bool(len(self)) or any(self.children.values())
+
+    def add(self, field: Any, rule: str, message: str, normalization=False) -> None:
+        # cerberus sorts the errors of a field by rule, errors of nested
+        # documents found by the normalization come last
+        key = (normalization and self.nested, rule)
+        self.setdefault(field, []).append((key, message))
+
+    def child(self, field: Any) -> "_Errors":
+        errors = self.children.get(field)
+        if errors is None:
+            errors = self.children[field] = _Errors(nested=True)
+        return errors
+
+    def tree(self) -> dict:
+        tree: Dict[Any, list] = dict()
+        for field, messages in self.items():
+            messages.sort(key=itemgetter(0))
+            tree[field] = [message for _, message in messages]
+        for field, errors in self.children.items():
+            subtree = errors.tree()
+            if subtree:
+                tree.setdefault(field, []).append(subtree)
+        return tree
+
+
+class _Mapping:
+    def __init__(self, schema: dict, allow_unknown: bool, nested: bool = False) -> None:
+        if not isinstance(schema, Mapping):
+            raise _Unsupported(f"schema reference: {schema}")
+
+        self.allow_unknown = allow_unknown
+        self.fields = {
+            field: _Field(rules, allow_unknown, nested)
+            for field, rules in schema.items()
+        }
+        self.required = tuple(
+            field for field, rules in self.fields.items() if rules.required
+        )
+        self.readonly = tuple(
+            field for field, rules in self.fields.items() if rules.readonly
+        )
+        self.defaults = tuple(
+            (field, rules.default, rules.nullable)
+            for field, rules in self.fields.items()
+            if rules.has_default
+        )
+        self.normalizers = tuple(
+            (field, rules.normalize)
+            for field, rules in self.fields.items()
+            if rules.normalize is not None
+        )
+        self.normalizing = bool(self.readonly or self.defaults or self.normalizers)
+
+    def normalize(self, document: Mapping, errors: _Errors) -> Any:
+        document = copy.copy(document)
+        if not self.normalizing:
+            return document
+
+        for field in self.readonly:
+            if field in document:
+                errors.add(field, "readonly", "field is read-only", True)
+
+        for field, default, nullable in self.defaults:
+            if field not in document or (document[field] is None and not nullable):
+                document[field] = default  # type: ignore
+
+        for field, normalize in self.normalizers:
+            if field in document:
+                document[field] = normalize(  # type: ignore
+                    field, document[field], errors
+                )
+        return document
+
+    def validate(self, document: Mapping, errors: _Errors) -> None:
+        fields = self.fields
+        for field, value in document.items():
+            rules = fields.get(field)
+            if rules is not None:
+                rules.check(field, value, errors)
+            elif not self.allow_unknown:
+                errors.add(field, "", "unknown field")
+
+        for field in self.required:
+            if field not in document:
+                errors.add(field, "required", "required field")
+
+
+class _Field:
+    """Rules of a field, compiled into ``check`` and ``normalize`` functions"""
+
+    def __init__(self, rules: dict, allow_unknown: bool, nested: bool) -> None:
+        if not isinstance(rules, Mapping):
+            raise _Unsupported(f"rules set reference: {rules}")
+
+        unsupported = set(rules) - RULES
+        if unsupported:
+            raise _Unsupported(f"rules {sorted(unsupported)}")
+        elif "readonly" in rules and "default" in rules:
+            raise _Unsupported("readonly field with a default value")
+
+        self.required = rules.get("required", False) is True
+        self.nullable = rules.get("nullable", False)
+        self.readonly = bool(rules.get("readonly", False))
+        self.nested = nested
+        self.has_default = "default" in rules
+        self.default = rules.get("default")
+
+        self._mapping: Optional[_Mapping] = None
+        self._items: Optional[_Field] = None
+        if "schema" in rules:
+            if rules.get("type") == "dict":
+                self._mapping = _Mapping(
+                    rules["schema"], rules.get("allow_unknown", allow_unknown), True
+                )
+            elif rules.get("type") == "list":
+                self._items = _Field(rules["schema"], allow_unknown, True)
+            else:
+                raise _Unsupported("schema rule without a dict or list type")
+        elif "allow_unknown" in rules:
+            raise _Unsupported("allow_unknown rule without a schema")
+
+        self.check = self._compile_check(rules)
+        self.normalize = self._compile_normalize(rules)
+
+    def _compile_check(self, rules: dict) -> Callable[[Any, Any, _Errors], None]:
+        nullable = self.nullable
+        # cerberus skips the other rules of read-only fields, at the top level only
+        readonly = self.readonly and not self.nested
+        match = _compile_type(rules.get("type"))
+        type_error = f"must be of {rules.get('type')} type"
+        empty = rules.get("empty")
+        sized, checks = _compile_checks(rules)
+        nested = self._compile_nested()
+
+        def check(field: Any, value: Any, errors: _Errors) -> None:
+            if value is None:
+                if not nullable:
+                    errors.add(field, "nullable", "null value not allowed")
+                return
+            elif readonly:
+                # Reported by the normalization
+                return
+            elif match is not None and not match(value):
+                errors.add(field, "type", type_error)
+                return
+
+            if empty is not None and isinstance(value, Sized) and not len(value):
+                if not empty:
+                    errors.add(field, "empty", "empty values not allowed")
+            else:
+                _apply(sized, field, value, errors)
+
+            _apply(checks, field, value, errors)
+            if nested is not None:
+                nested(field, value, errors)
+
+        return check
+
+    def _compile_nested(self) -> Optional[Callable[[Any, Any, _Errors], None]]:
+        mapping = self._mapping
+        items = self._items
+        if mapping is not None:
+
+            def nested(field: Any, value: Any, errors: _Errors) -> None:
+                if isinstance(value, Mapping):
+                    mapping.validate(value, errors.child(field))  # type: ignore
+
+            return nested
+
+        elif items is not None:
+
+            def nested(field: Any, value: Any, errors: _Errors) -> None:
+                if isinstance(value, Sequence) and not isinstance(value, str):
+                    child = errors.child(field)
+                    for index, item in enumerate(value):
+                        items.check(index, item, child)  # type: ignore
+
+            return nested
+
+        return None
+
+    def _compile_normalize(
+        self, rules: dict
+    ) -> Optional[Callable[[Any, Any, _Errors], Any]]:
+        coerce = _compile_coerce(rules.get("coerce"), self.nullable)
+        nested = self._compile_nested_normalize()
+        if coerce is None:
+            return nested
+        elif nested is None:
+            return coerce
+
+        def normalize(field: Any, value: Any, errors: _Errors) -> Any:
+            return nested(field, coerce(field, value, errors), errors)  # type: ignore
+
+        return normalize
+
+    def _compile_nested_normalize(self) -> Optional[Callable[[Any, Any, _Errors], Any]]:
+        mapping = self._mapping
+        items = self._items
+        if mapping is not None and mapping.normalizing:
+
+            def normalize(field: Any, value: Any, errors: _Errors) -> Any:
+                if isinstance(value, Mapping):
+                    normalized = mapping.normalize(  # type: ignore
+                        value, errors.child(field)
+                    )
+                    return type(value)(normalized)  # type: ignore
+                return value
+
+            return normalize
+
+        elif items is not None and items._normalizing:
+
+            def normalize(field: Any, value: Any, errors: _Errors) -> Any:
+                if isinstance(value, Sequence) and not isinstance(value, str):
+                    child = errors.child(field)
+                    return type(value)(  # type: ignore
+                        items._normalize_item(index, item, child)  # type: ignore
+                        for index, item in enumerate(value)
+                    )
+                return value
+
+            return normalize
+
+        return None
+
+    @property
+    def _normalizing(self) -> bool:
+        return self.readonly or self.has_default or self.normalize is not None
+
+    def _normalize_item(self, index: int, value: Any, errors: _Errors) -> Any:
+        if self.readonly:
+            errors.add(index, "readonly", "field is read-only", True)
+        if self.has_default and value is None and not self.nullable:
+            value = self.default
+        if self.normalize is not None:
+            value = self.normalize(index, value, errors)
+        return value
+
+
+def _compile_checks(rules: dict) -> Tuple[List[Tuple[str, Check]], ...]:
+    """Split the value checks, between the ones skipped for empty values and the others"""
+    empty = "empty" in rules
+    sized: List[Tuple[str, Check]] = list()
+    checks: List[Tuple[str, Check]] = list()
+    for rule, constraint in rules.items():
+        compiler = _CHECKS.get(rule)
+        if compiler is None:
+            continue
+        elif empty and rule in _SIZED_RULES:
+            sized.append((rule, compiler(constraint)))
+        else:
+            checks.append((rule, compiler(constraint)))
+    return sized, checks
+
+
+def _apply(checks: List[Tuple[str, Check]], field: Any, value: Any, errors: _Errors):
+    for rule, check in checks:
+        message = check(value)
+        if message is not None:
+            errors.add(field, rule, message)
+
+
+def _compile_coerce(
+    coercers: Any, nullable: bool
+) -> Optional[Callable[[Any, Any, _Errors], Any]]:
+    if coercers is None:
+        return None
+    elif callable(coercers):
+        coercers = (coercers,)
+    elif not all(callable(coercer) for coercer in coercers):
+        raise _Unsupported("coerce rule by name")
+
+    def coerce(field: Any, value: Any, errors: _Errors) -> Any:
+        for coercer in coercers:
+            try:
+                value = coercer(value)
+            except Exception as e:
+                if not (nullable and value is None):
+                    message = f"field '{field}' cannot be coerced: {e}"
+                    errors.add(field, "coerce", message, True)
+                    break
+        return value
+
+    return coerce
+
+
+def _compile_type(types: Any) -> Optional[Callable[[Any], bool]]:
+    if not types:
+        return None
+    elif isinstance(types, str):
+        types = (types,)
+
+    try:
+        definitions = tuple(TYPES[name] for name in types)
+    except KeyError as e:
+        raise _Unsupported(f"type {e}")
+
+    if len(definitions) == 1:
+        included, excluded = definitions[0]
+        if not excluded:
+            return lambda value: isinstance(value, included)
+        return lambda value: isinstance(value, included) and not isinstance(
+            value, excluded
+        )
+
+    return lambda value: any(
+        isinstance(value, included) and not isinstance(value, excluded)
+        for included, excluded in definitions
+    )
+
+
+def _allowed(allowed: Any) -> Check:
+    def check(value: Any) -> Optional[str]:
+        if isinstance(value, Iterable) and not isinstance(value, str):
+            unallowed = tuple(item for item in value if item not in allowed)
+            if unallowed:
+                return f"unallowed values {unallowed}"
+        elif value not in allowed:
+            return f"unallowed value {value}"
+        return None
+
+    return check
+
+
+def _min(minimum: Any) -> Check:
+    message = f"min value is {minimum}"
+
+    def check(value: Any) -> Optional[str]:
+        try:
+            return message if value < minimum else None
+        except TypeError:
+            return None
+
+    return check
+
+
+def _max(maximum: Any) -> Check:
+    message = f"max value is {maximum}"
+
+    def check(value: Any) -> Optional[str]:
+        try:
+            return message if value > maximum else None
+        except TypeError:
+            return None
+
+    return check
+
+
+def _minlength(length: int) -> Check:
+    message = f"min length is {length}"
+
+    def check(value: Any) -> Optional[str]:
+        if isinstance(value, Iterable) and len(value) < length:  # type: ignore
+            return message
+        return None
+
+    return check
+
+
+def _maxlength(length: int) -> Check:
+    message = f"max length is {length}"
+
+    def check(value: Any) -> Optional[str]:
+        if isinstance(value, Iterable) and len(value) > length:  # type: ignore
+            return message
+        return None
+
+    return check
+
+
+def _regex(pattern: str) -> Check:
+    message = f"value does not match regex '{pattern}'"
+    match = re.compile(pattern if pattern.endswith("$") else pattern + "$").match
+
+    def check(value: Any) -> Optional[str]:
+        if isinstance(value, str) and not match(value):
+            return message
+        return None
+
+    return check
+
+
+_CHECKS: Dict[str, Callable[[Any], Check]] = {
+    "allowed": _allowed,
+    "max": _max,
+    "maxlength": _maxlength,
+    "min": _min,
+    "minlength": _minlength,
+    "regex": _regex,
+}
@@ -1,10 +1,15 @@
 import mock
 import uuid
+import collections
+import contextlib
 import pytest
 import pillars
 import asyncio
 import aiohttp
 import asynctest
+import hashlib
+import aioredis
+import asyncpg
 
 
 @pytest.fixture
@@ -79,6 +84,47 @@ class TestAri:
         )
         assert response == {}
 
+    @pytest.mark.asyncio
+    async def test_coalesce(self, app):
+        auth = aiohttp.BasicAuth(login='rabbit', password='hunter2')
+        client = pillars.engines.ari.AriClient(app=app, auth=auth, url='http://localhost:80/', coalesce=True)
+
+        async def send(method, url, data, params, timeout):
+            await asyncio.sleep(0.01)
+            return '{"url": "%s"}' % url
+
+        client._send = asynctest.CoroutineMock(side_effect=send)
+        responses = await asyncio.gather(
+            client.request('GET', 'channels', params={'a': 1}),
+            client.request('GET', 'channels', params={'a': 1}),
+            client.request('GET', 'channels', params={'a': 2}),
+            client.request('POST', 'channels'),
+            client.request('POST', 'channels'),
+        )
+        assert responses[0] == responses[1] == {'url': 'http://localhost:80/channels'}
+        assert responses[0] is not responses[1]
+        assert client._send.call_count == 4
+        assert client._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_coalesce_timeout(self, app):
+        auth = aiohttp.BasicAuth(login='rabbit', password='hunter2')
+        client = pillars.engines.ari.AriClient(app=app, auth=auth, url='http://localhost:80/', coalesce=True)
+
+        async def send(method, url, data, params, timeout):
+            await asyncio.sleep(0.1)
+            return '{}'
+
+        client._send = asynctest.CoroutineMock(side_effect=send)
+        short, long = await asyncio.gather(
+            client.request('GET', 'channels', timeout=0.05),
+            client.request('GET', 'channels', timeout=None),
+            return_exceptions=True,
+        )
+        assert isinstance(short, asyncio.TimeoutError)
+        assert long == {}
+        assert client._send.call_count == 1
+
     @pytest.mark.asyncio
     async def test_status(self, ari_client):
         status = await ari_client.status()
@@ -120,3 +166,437 @@ class TestPG:
     def test_jsonb_decoder(self, input, output):
         result = pillars.engines.pg.jsonb_decoder(input)
         assert result == output
+
+    @pytest.mark.parametrize('backend', list(pillars.engines.pg.JSON_BACKENDS))
+    @pytest.mark.parametrize('value', ('hello world', {'foo': ['bar', 'baz'], 'é': 1.5}))
+    def test_jsonb_backend(self, backend, value):
+        backend = pillars.engines.pg.JSON_BACKENDS[backend]
+        encoded = pillars.engines.pg.make_jsonb_encoder(backend)(value)
+        assert encoded[0] == 1
+        assert pillars.engines.pg.make_jsonb_decoder(backend)(encoded) == value
+
+    @pytest.mark.asyncio
+    async def test_init_connection(self, app):
+        init = asynctest.CoroutineMock()
+        engine = pillars.engines.pg.PG(app=app, json_backend='json', init=init)
+        con = mock.Mock()
+        con.set_type_codec = asynctest.CoroutineMock()
+
+        await engine._init_connection(con)
+        assert [c[0][0] for c in con.set_type_codec.call_args_list] == ['json', 'jsonb']
+        init.assert_called_once_with(con)
+
+    def test_slow_query_connection_class(self, app, caplog):
+        class Custom(pillars.engines.pg.Connection):
+            pass
+
+        pillars.engines.pg.PG(app=app, slow_query_threshold=1, connection_class=Custom)
+        assert not caplog.records
+
+        pillars.engines.pg.PG(app=app, slow_query_threshold=1, connection_class=asyncpg.Connection)
+        assert 'Slow query log disabled' in caplog.records[0].getMessage()
+
+
+@pytest.fixture
+def pg(app):
+    rows = {i: {'id': i, 'name': f'user-{i}'} for i in range(10)}
+    connection = mock.Mock()
+    connection.fetch = asynctest.CoroutineMock(
+        side_effect=lambda query, keys: [rows[key] for key in keys if key in rows]
+    )
+
+    @contextlib.asynccontextmanager
+    async def connection_factory(timeout=5):
+        yield connection
+
+    engine = pillars.engines.pg.PG(app=app)
+    engine.connection = connection_factory
+    engine.add_loader('users', 'SELECT * FROM users WHERE id = ANY($1)')
+    return engine, connection
+
+
+class TestPGLoader:
+
+    @pytest.mark.asyncio
+    async def test_batch(self, pg):
+        engine, connection = pg
+        loader = engine.loader('users')
+
+        results = await asyncio.gather(
+            loader.load(1), loader.load(2), loader.load(1), loader.load(42)
+        )
+        assert [r and r['id'] for r in results] == [1, 2, 1, None]
+        connection.fetch.assert_called_once_with(
+            'SELECT * FROM users WHERE id = ANY($1)', [1, 2, 42]
+        )
+
+    @pytest.mark.asyncio
+    async def test_cache(self, pg):
+        engine, connection = pg
+        loader = engine.loader('users')
+
+        assert (await loader.load(1))['name'] == 'user-1'
+        assert [r['id'] for r in await loader.load_many([1, 3])] == [1, 3]
+        assert connection.fetch.call_count == 2
+        assert connection.fetch.call_args[0][1] == [3]
+
+        loader.clear(1)
+        await loader.load(1)
+        assert connection.fetch.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_error_not_cached(self, pg):
+        engine, connection = pg
+        loader = engine.loader('users')
+        connection.fetch.side_effect = ConnectionResetError()
+
+        with pytest.raises(ConnectionResetError):
+            await loader.load(1)
+
+        connection.fetch.side_effect = None
+        connection.fetch.return_value = [{'id': 1}]
+        assert await loader.load(1) == {'id': 1}
+
+    @pytest.mark.asyncio
+    async def test_request_scope(self, pg):
+        engine, _ = pg
+        request = pillars.request.BaseRequest(collections.ChainMap())
+
+        assert engine.loader('users') is engine.loader('users', request)
+        other = pillars.request.BaseRequest(collections.ChainMap())
+        assert engine.loader('users', other) is not engine.loader('users', request)
+
+
+class FakeRedisConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.writes = list()
+        self._buffer = None
+
+    @contextlib.contextmanager
+    def _buffered(self):
+        self._buffer = list()
+        yield self
+        self.writes.append(self._buffer)
+        self._buffer = None
+
+    def execute(self, command, *args, **kwargs):
+        if command == 'BAD':
+            raise TypeError()
+        self._buffer.append((command, args))
+        future = asyncio.get_event_loop().create_future()
+        if command == 'ERR':
+            future.set_exception(ValueError())
+        else:
+            future.set_result((command, args))
+        return future
+
+
+@pytest.fixture
+def redis(app):
+    connection = FakeRedisConnection()
+    pool = mock.Mock()
+    pool.acquire = asynctest.CoroutineMock(return_value=connection)
+    engine = pillars.engines.redis.Redis(app, pipeline_batch=3)
+    engine._supervisor._create = asynctest.CoroutineMock(return_value=pool)
+    engine._supervisor.start()
+    return engine, pool, connection
+
+
+class TestRedisPipeline:
+
+    @pytest.mark.asyncio
+    async def test_coalesce(self, redis):
+        engine, pool, connection = redis
+
+        results = await asyncio.gather(
+            engine.execute('GET', 'a'), engine.execute('GET', 'b'), engine.execute('INCR', 'c')
+        )
+        assert results == [('GET', ('a',)), ('GET', ('b',)), ('INCR', ('c',))]
+        assert len(connection.writes) == 1
+        pool.acquire.assert_called_once()
+
+        await engine.execute('GET', 'd')
+        assert len(connection.writes) == 2
+        assert engine.metrics()['pipeline']['commands'] == 4
+
+    @pytest.mark.asyncio
+    async def test_max_batch(self, redis):
+        engine, pool, connection = redis
+
+        await asyncio.gather(*(engine.execute('GET', i) for i in range(7)))
+        assert [len(write) for write in connection.writes] == [3, 3, 1]
+
+    @pytest.mark.asyncio
+    async def test_errors(self, redis):
+        engine, pool, connection = redis
+
+        results = await asyncio.gather(
+            engine.execute('GET', 'a'),
+            engine.execute('BAD'),
+            engine.execute('ERR'),
+            return_exceptions=True,
+        )
+        assert results[0] == ('GET', ('a',))
+        assert isinstance(results[1], TypeError)
+        assert isinstance(results[2], ValueError)
+
+    @pytest.mark.asyncio
+    async def test_reconnect(self, redis):
+        engine, pool, connection = redis
+
+        await engine.execute('GET', 'a')
+        connection.closed = True
+        new_connection = FakeRedisConnection()
+        pool.acquire.return_value = new_connection
+
+        await engine.execute('GET', 'a')
+        pool.release.assert_called_once_with(connection)
+        assert len(new_connection.writes) == 1
+
+    @pytest.mark.asyncio
+    async def test_pool_unavailable(self, redis):
+        engine, pool, connection = redis
+        pool.acquire.side_effect = ConnectionRefusedError()
+
+        with pytest.raises(pillars.exceptions.PoolUnavailable):
+            await engine.execute('GET', 'a')
+        assert engine.metrics()['reconnections'] == 1
+
+
+class TestRedisScripts:
+
+    @pytest.mark.asyncio
+    async def test_evalsha(self, app):
+        engine = pillars.engines.redis.Redis(app)
+        engine.execute = asynctest.CoroutineMock(side_effect=['OK', 1, 2])
+        script = engine.register_script('incr', 'return redis.call("INCR", KEYS[1])')
+        assert script.sha == hashlib.sha1(script.source.encode()).hexdigest()
+
+        assert await engine.eval('incr', keys=['a']) == 1
+        assert await engine.eval('incr', keys=['a'], args=[5]) == 2
+        assert engine.execute.call_args_list == [
+            mock.call('SCRIPT', 'LOAD', script.source),
+            mock.call('EVALSHA', script.sha, 1, 'a'),
+            mock.call('EVALSHA', script.sha, 1, 'a', 5),
+        ]
+        metrics = engine.metrics()['scripts']['incr']
+        assert metrics['loads'] == 1
+        assert metrics['latency']['count'] == 2
+
+    @pytest.mark.asyncio
+    async def test_noscript(self, app):
+        engine = pillars.engines.redis.Redis(app)
+        engine.execute = asynctest.CoroutineMock(side_effect=[
+            'OK', aioredis.ReplyError('NOSCRIPT No matching script'), 'OK', 1,
+        ])
+        script = engine.register_script('noop', 'return 1')
+
+        assert await script() == 1
+        assert engine.execute.call_count == 4
+        assert engine.metrics()['scripts']['noop']['loads'] == 2
+
+    @pytest.mark.asyncio
+    async def test_error(self, app):
+        engine = pillars.engines.redis.Redis(app)
+        engine.execute = asynctest.CoroutineMock(side_effect=['OK', aioredis.ReplyError('ERR')])
+        engine.register_script('noop', 'return 1')
+
+        with pytest.raises(aioredis.ReplyError):
+            await engine.eval('noop')
+        assert engine.metrics()['scripts']['noop']['errors'] == 1
+        assert engine.execute.call_count == 2
+
+
+class FakeRedisEngine:
+
+    def __init__(self):
+        self.store = dict()
+        self.commands = list()
+
+    async def execute(self, command, *args):
+        self.commands.append((command, ) + args)
+        if command == 'GET':
+            return self.store.get(args[0])
+        elif command == 'SET':
+            self.store[args[0]] = args[1].encode()
+        elif command == 'DEL':
+            self.store.pop(args[0], None)
+
+
+@pytest.fixture
+def cache(app):
+    redis = FakeRedisEngine()
+    return pillars.engines.cache.Cache(app, redis, maxsize=2, prefix=''), redis
+
+
+class TestCache:
+
+    @pytest.mark.asyncio
+    async def test_single_flight(self, cache):
+        cache, redis = cache
+        loader = asynctest.CoroutineMock(return_value={'foo': 'bar'})
+
+        results = await asyncio.gather(*(cache.get('key', loader) for _ in range(5)))
+        assert results == [{'foo': 'bar'}] * 5
+        loader.assert_called_once_with()
+        assert redis.store == {'key': b'{"foo":"bar"}'}
+
+        assert await cache.get('key', loader) == {'foo': 'bar'}
+        assert [c[0] for c in redis.commands] == ['GET', 'SET']
+        assert cache.metrics()['local_hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_redis_tier(self, cache):
+        cache, redis = cache
+        redis.store['key'] = b'[1,2]'
+
+        assert await cache.get('key') == [1, 2]
+        assert await cache.get('missing') is None
+        assert cache.metrics()['redis_hits'] == 1
+        assert cache.metrics()['misses'] == 1
+
+    @pytest.mark.asyncio
+    async def test_lru(self, cache):
+        cache, redis = cache
+        for key in ('a', 'b', 'a', 'c'):
+            await cache.get(key, asynctest.CoroutineMock(return_value=key))
+
+        assert list(cache._local) == ['a', 'c']
+
+    @pytest.mark.asyncio
+    async def test_local_ttl(self, cache):
+        cache, redis = cache
+        with mock.patch('time.monotonic', mock.MagicMock(return_value=0)):
+            await cache.get('key', asynctest.CoroutineMock(return_value=1))
+
+        redis.store['key'] = b'2'
+        with mock.patch('time.monotonic', mock.MagicMock(return_value=1000)):
+            assert await cache.get('key') == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate(self, cache):
+        cache, redis = cache
+        await cache.get('key', asynctest.CoroutineMock(return_value=1))
+
+        await cache.invalidate('key')
+        assert 'key' not in cache._local
+        assert 'key' not in redis.store
+        assert ('PUBLISH', 'pillars:cache:invalidate', 'key') in redis.commands
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable(self, cache):
+        cache, redis = cache
+        redis.execute = asynctest.CoroutineMock(
+            side_effect=pillars.exceptions.PoolUnavailable('Redis', 'degraded')
+        )
+
+        assert await cache.get('key', asynctest.CoroutineMock(return_value=1)) == 1
+
+    @pytest.mark.asyncio
+    async def test_decorator(self, cache):
+        cache, redis = cache
+        calls = list()
+
+        @cache.cached('customer:{0}:{lang}')
+        async def customer(customer_id, lang='en'):
+            calls.append(customer_id)
+            return {'id': customer_id}
+
+        assert await customer(1, lang='fr') == {'id': 1}
+        assert await customer(1, lang='fr') == {'id': 1}
+        assert calls == [1]
+        assert 'customer:1:fr' in redis.store
+
+
+class TestPoolMetrics:
+
+    @pytest.mark.asyncio
+    async def test_redis_connection(self, app):
+        engine = pillars.engines.redis.Redis(app, maxsize=2)
+        pool = mock.Mock()
+        pool.acquire = asynctest.CoroutineMock(return_value=mock.Mock())
+        engine._create_pool = asynctest.CoroutineMock(return_value=pool)
+        engine._supervisor._create = engine._create_pool
+        app['redis'] = engine
+        await app.start()
+
+        async with engine.connection():
+            assert engine.metrics()['utilisation'] == 0.5
+
+        metrics = (await app.status(metrics=True))['metrics']['redis']
+        assert metrics['state'] == 'healthy'
+        assert metrics['in_use'] == 0
+        assert metrics['acquire_wait']['-']['count'] == 1
+        assert metrics['hold_time']['-']['count'] == 1
+        pool.release.assert_called_once()
+
+
+class TestPoolSupervisor:
+
+    @pytest.mark.asyncio
+    async def test_connect(self):
+        pool = object()
+        supervisor = pillars.engines.supervisor.PoolSupervisor(
+            'pytest', asynctest.CoroutineMock(return_value=pool)
+        )
+        supervisor.start()
+        assert supervisor.state == pillars.engines.supervisor.PoolState.CONNECTING
+
+        assert await supervisor.pool() is pool
+        assert supervisor.state == pillars.engines.supervisor.PoolState.HEALTHY
+
+    @pytest.mark.asyncio
+    async def test_fail_fast(self):
+        create = asynctest.CoroutineMock(side_effect=ConnectionRefusedError())
+        supervisor = pillars.engines.supervisor.PoolSupervisor(
+            'pytest', create, backoff_base=10
+        )
+        supervisor.start()
+
+        with pytest.raises(pillars.exceptions.PoolUnavailable):
+            await supervisor.pool()
+
+        assert supervisor.state == pillars.engines.supervisor.PoolState.DEGRADED
+        assert create.call_count == 1
+        supervisor.stop()
+
+    @pytest.mark.asyncio
+    async def test_fatal_error(self):
+        supervisor = pillars.engines.supervisor.PoolSupervisor(
+            'pytest', asynctest.CoroutineMock(side_effect=ValueError())
+        )
+        supervisor.start()
+
+        with pytest.raises(ValueError):
+            await supervisor.pool()
+
+    @pytest.mark.asyncio
+    async def test_single_flight_reconnection(self):
+        pools = [object(), object()]
+        create = asynctest.CoroutineMock(side_effect=pools)
+        discard = asynctest.CoroutineMock()
+        supervisor = pillars.engines.supervisor.PoolSupervisor(
+            'pytest', create, discard=discard
+        )
+        supervisor.start()
+        pool = await supervisor.pool()
+
+        for _ in range(10):
+            supervisor.failed(pool, ConnectionResetError())
+
+        assert supervisor.state == pillars.engines.supervisor.PoolState.DEGRADED
+        with pytest.raises(pillars.exceptions.PoolUnavailable):
+            await supervisor.pool()
+
+        await asyncio.sleep(0)
+        assert create.call_count == 2
+        assert await supervisor.pool() is pools[1]
+        discard.assert_called_once_with(pools[0])
+        assert supervisor.stats()['reconnections'] == 1
+
+    @pytest.mark.parametrize('attempt', range(8))
+    def test_backoff_delay(self, attempt):
+        delay = pillars.utils.backoff_delay(attempt, base=0.5, maximum=10)
+        assert 0 <= delay <= min(10, 0.5 * 2 ** attempt)
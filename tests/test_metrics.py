@@ -0,0 +1,51 @@
+import mock
+import pytest
+import pillars
+
+
+class TestHistogram:
+
+    def test_observe(self):
+        histogram = pillars.metrics.Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 4
+        assert snapshot['sum'] == pytest.approx(2.65)
+        assert snapshot['max'] == 2
+        assert snapshot['buckets'] == {'0.1': 2, '1': 3, '+Inf': 4}
+
+
+class TestPoolMetrics:
+
+    def test_utilisation(self):
+        metrics = pillars.metrics.PoolMetrics(size=4)
+        metrics.acquired('/users', 0.01)
+        metrics.acquired('/users', 0.02)
+        assert metrics.utilisation == 0.5
+
+        metrics.released('/users', 0.1)
+        snapshot = metrics.snapshot()
+        assert snapshot['in_use'] == 1
+        assert snapshot['acquire_wait']['/users']['count'] == 2
+        assert snapshot['hold_time']['/users']['count'] == 1
+
+    def test_slow_queries(self):
+        metrics = pillars.metrics.PoolMetrics(size=4, slow_threshold=0.5)
+        metrics.query('/users', 'SELECT 1', 0.1)
+        metrics.query('/users', 'SELECT pg_sleep(1)', 1)
+        assert list(metrics.slow_queries) == [
+            {'route': '/users', 'statement': 'SELECT pg_sleep(1)', 'duration': 1}
+        ]
+
+    @mock.patch('random.random', mock.MagicMock(return_value=0.9))
+    def test_slow_queries_sampling(self):
+        metrics = pillars.metrics.PoolMetrics(size=4, slow_threshold=0.5, slow_sample=0.5)
+        metrics.query('/users', 'SELECT pg_sleep(1)', 1)
+        assert not metrics.slow_queries
+
+    def test_disabled(self):
+        metrics = pillars.metrics.PoolMetrics(size=4)
+        metrics.query('/users', 'SELECT pg_sleep(1)', 1)
+        assert not metrics.slow_queries
@@ -0,0 +1,60 @@
+import asyncio
+import collections
+import pytest
+import pillars
+
+
+@pytest.fixture
+def request_factory():
+    def factory(timeout=None):
+        return pillars.request.BaseRequest(collections.ChainMap(), timeout=timeout)
+    return factory
+
+
+class TestDeadline:
+
+    @pytest.mark.asyncio
+    async def test_no_request(self):
+        assert pillars.request.current() is None
+        assert pillars.request.remaining() is None
+        assert pillars.request.remaining(5) == 5
+
+    @pytest.mark.asyncio
+    async def test_no_deadline(self, request_factory):
+        request = request_factory()
+        assert pillars.request.current() is request
+        assert request.deadline is None
+        assert pillars.request.remaining(5) == 5
+
+    @pytest.mark.asyncio
+    async def test_deadline(self, request_factory):
+        request_factory(timeout=1)
+        assert 0 < pillars.request.remaining() <= 1
+        assert 0 < pillars.request.remaining(5) <= 1
+        assert pillars.request.remaining(0.5) == 0.5
+
+    @pytest.mark.asyncio
+    async def test_expired(self, request_factory):
+        request_factory(timeout=0)
+        await asyncio.sleep(0.01)
+        assert pillars.request.remaining(5) == 0
+
+    @pytest.mark.asyncio
+    async def test_set_timeout_only_shortens(self, request_factory):
+        request = request_factory(timeout=1)
+        deadline = request.deadline
+
+        request.set_timeout(10)
+        assert request.deadline == deadline
+
+        request.set_timeout(0.1)
+        assert request.deadline < deadline
+
+    @pytest.mark.asyncio
+    async def test_propagates_to_tasks(self, request_factory):
+        request = request_factory(timeout=1)
+
+        async def task():
+            return pillars.request.current()
+
+        assert await asyncio.create_task(task()) is request
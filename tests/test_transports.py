@@ -0,0 +1,1542 @@
+import asyncio
+import collections
+import contextlib
+import socket
+import sys
+import time
+import mock
+import pytest
+import asynctest
+import pillars
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+
+
+@pytest.fixture
+async def http_client():
+    clients = list()
+
+    async def factory(app):
+        app.state = collections.ChainMap({}, {})
+        client = aiohttp.test_utils.TestClient(aiohttp.test_utils.TestServer(app))
+        await client.start_server()
+        clients.append(client)
+        return client
+
+    yield factory
+
+    for client in clients:
+        await client.close()
+
+
+class TestHttp:
+
+    @pytest.mark.asyncio
+    async def test_response(self, http_client):
+        async def handler(request):
+            return pillars.Response(status=200, data={'hello': 'world'})
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert response.status == 200
+        assert await response.json() == {'hello': 'world'}
+
+    @pytest.mark.asyncio
+    async def test_route_deadline(self, http_client):
+        async def handler(request):
+            assert 0 < request.remaining() <= 0.05
+            await asyncio.sleep(1)
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler, timeout=0.05)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert response.status == 504
+
+    @pytest.mark.asyncio
+    async def test_header_deadline(self, http_client):
+        async def handler(request):
+            return pillars.Response(status=200, data={'remaining': request.remaining()})
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler, timeout=10)
+        client = await http_client(app)
+
+        response = await client.get('/', headers={'X-Request-Timeout': '2'})
+        assert 0 < (await response.json())['remaining'] <= 2
+
+        response = await client.get('/', headers={'X-Request-Timeout': 'foo'})
+        assert 2 < (await response.json())['remaining'] <= 10
+
+        for header in ('nan', '-inf', '-1', '0'):
+            response = await client.get('/', headers={'X-Request-Timeout': header})
+            assert 2 < (await response.json())['remaining'] <= 10
+
+    @pytest.mark.asyncio
+    async def test_unmatched_route(self, http_client):
+        routes = list()
+
+        @aiohttp.web.middleware
+        async def middleware(request, handler):
+            routes.append(request.route)
+            return await handler(request)
+
+        async def handler(request):
+            return pillars.Response(status=200, data={})
+
+        app = pillars.transports.http.Application(middlewares=(middleware, ))
+        app.router.add_route('GET', '/users/{id}', handler)
+        client = await http_client(app)
+
+        await client.get('/users/1')
+        response = await client.get('/missing/1')
+        assert response.status == 404
+        assert routes == ['/users/{id}', 'unmatched']
+
+    @pytest.mark.asyncio
+    async def test_route_info(self, http_client):
+        async def handler(request):
+            return pillars.Response(status=200, data={
+                'config': sorted(request.config), 'data': await request.data(validate=True)
+            })
+
+        app = pillars.transports.http.Application(middlewares=(pillars.middlewares.http.exception_handler, ))
+        app.router.add_route(
+            'POST', '/items', handler, config=['json'], data_schema={'count': {'type': 'integer', 'coerce': int}}
+        )
+        client = await http_client(app)
+
+        response = await client.post('/items', json={'count': '2'})
+        assert await response.json() == {'config': ['json'], 'data': {'count': 2}}
+
+        response = await client.post('/items', json={'count': 'two'})
+        assert response.status == 400
+
+    @pytest.mark.asyncio
+    async def test_static_routes(self, http_client):
+        async def dynamic(request):
+            return pillars.Response(status=200, data='dynamic')
+
+        async def static(request):
+            return pillars.Response(status=200, data='static')
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/items/{id}', dynamic)
+        app.router.add_route('GET', '/items/new', static)
+        app.router.add_route('GET', '/users/new', static)
+        client = await http_client(app)
+
+        assert list(app.router._static) == ['/users/new']
+        assert await (await client.get('/items/new')).json() == 'dynamic'
+        assert await (await client.get('/users/new')).json() == 'static'
+        assert (await client.get('/users/old')).status == 404
+        assert (await client.post('/users/new')).status == 405
+
+    @pytest.mark.asyncio
+    async def test_route_middlewares(self, http_client):
+        calls = list()
+
+        async def route_middleware(request, handler):
+            calls.append(request.path)
+            return await handler(request)
+
+        async def handler(request):
+            return pillars.Response(status=200, data=None)
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler, middlewares=(route_middleware, ))
+        app.router.add_route('GET', '/other', handler)
+        client = await http_client(app)
+
+        await client.get('/')
+        await client.get('/other')
+        assert calls == ['/']
+
+    @pytest.mark.asyncio
+    async def test_stream_ndjson(self, http_client):
+        async def handler(request):
+            records = [record async for record in request.stream(validate=True)]
+            return pillars.Response(status=200, data=records)
+
+        app = pillars.transports.http.Application(middlewares=(pillars.middlewares.http.exception_handler, ))
+        app.router.add_route('POST', '/items', handler, data_schema={'count': {'type': 'integer', 'coerce': int}})
+        client = await http_client(app)
+
+        body = b'{"count": "1"}\n\n{"count": 2}\n'
+        response = await client.post('/items', data=body, headers={'Content-Type': 'application/x-ndjson'})
+        assert await response.json() == [{'count': 1}, {'count': 2}]
+
+        body = b'{"count": 1}\n{"count": "two"}\n'
+        response = await client.post('/items', data=body, headers={'Content-Type': 'application/x-ndjson'})
+        assert response.status == 400
+        assert (await response.json())['errors'] == {'1': [{'count': ["field 'count' cannot be coerced: invalid literal for int() with base 10: 'two'", 'must be of integer type']}]}
+
+    @pytest.mark.asyncio
+    async def test_stream_json_array(self, http_client):
+        async def handler(request):
+            return pillars.Response(status=200, data=[record async for record in request.stream()])
+
+        app = pillars.transports.http.Application(middlewares=(pillars.middlewares.http.exception_handler, ))
+        app.router.add_route('POST', '/items', handler)
+        client = await http_client(app)
+
+        response = await client.post('/items', json=[{'a': 1}, {'b': [1, 2]}, {'c': 'é'}])
+        assert await response.json() == [{'a': 1}, {'b': [1, 2]}, {'c': 'é'}]
+
+        response = await client.post('/items', data=b'[{"a": 1}, {"b"', headers={'Content-Type': 'application/json'})
+        assert response.status == 400
+
+    @pytest.mark.asyncio
+    async def test_json_array_chunks(self):
+        async def chunks():
+            body = ' [ {"a": 1} , 12, "\u00e9" ,[ ], 3.5, {"b": "]\\"}"}, "\\u00e9", true ] '.encode()
+            for i in range(len(body)):
+                yield body[i:i + 1]
+
+        records = [record async for record in pillars.transports.http._json_array_records(chunks())]
+        assert records == [{'a': 1}, 12, 'é', [], 3.5, {'b': ']"}'}, 'é', True]
+
+    @pytest.mark.asyncio
+    async def test_json_array_invalid_element(self):
+        received = list()
+
+        async def chunks():
+            for chunk in (b'[1, {"a": 2}, nope', b', 3', b', 4]'):
+                received.append(chunk)
+                yield chunk
+
+        records = pillars.transports.http._json_array_records(chunks())
+        assert await records.__anext__() == 1
+        assert await records.__anext__() == {'a': 2}
+        with pytest.raises(pillars.exceptions.DataValidationError):
+            await records.__anext__()
+        assert len(received) == 2
+
+    @pytest.mark.asyncio
+    async def test_ndjson_chunks(self):
+        async def chunks():
+            body = b'{"a": 1}\n\n{"b": [1, 2]}\n{"c": 3}'
+            for i in range(len(body)):
+                yield body[i:i + 1]
+
+        records = [record async for record in pillars.transports.http._ndjson_records(chunks())]
+        assert records == [{'a': 1}, {'b': [1, 2]}, {'c': 3}]
+
+    def test_json_array_large_element(self):
+        parser = pillars.transports.http._JSONArrayParser()
+        assert parser.feed('[{"a": "') == []
+        for _ in range(100):
+            assert parser.feed('x' * 100) == []
+        assert len(parser._pieces) == 101
+        assert parser.feed('"}, 1') == [{'a': 'x' * 10000}]
+        assert parser.feed(']', eof=True) == [1]
+
+    @pytest.mark.asyncio
+    async def test_max_body_size(self, http_client):
+        async def data(request):
+            return pillars.Response(status=200, data=await request.data())
+
+        async def stream(request):
+            return pillars.Response(status=200, data=[record async for record in request.stream()])
+
+        app = pillars.transports.http.Application(middlewares=(pillars.middlewares.http.exception_handler, ))
+        app.router.add_route('POST', '/data', data, config=['json'], max_body_size=16)
+        app.router.add_route('POST', '/stream', stream, max_body_size=16)
+        client = await http_client(app)
+
+        response = await client.post('/data', json={'a': 1})
+        assert await response.json() == {'a': 1}
+
+        for path in ('/data', '/stream'):
+            response = await client.post(path, json=[{'a': 'x' * 32}])
+            assert response.status == 413
+            assert await response.json() == {'errors': ['Payload larger than 16 bytes']}
+
+    @pytest.mark.asyncio
+    async def test_stream_client_max_size(self, http_client):
+        async def stream(request):
+            return pillars.Response(status=200, data=[record async for record in request.stream()])
+
+        app = pillars.transports.http.Application(
+            client_max_size=16, middlewares=(pillars.middlewares.http.exception_handler, )
+        )
+        app.router.add_route('POST', '/stream', stream)
+        client = await http_client(app)
+
+        response = await client.post('/stream', json=[{'a': 'x' * 32}])
+        assert response.status == 413
+
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('format, columns, body', (
+        ('ndjson', None, '{"id": 1, "name": "a"}\n{"id": 2, "name": "b"}\n'),
+        ('json', None, '[{"id": 1, "name": "a"},{"id": 2, "name": "b"}]'),
+        ('csv', None, 'id,name\r\n1,a\r\n2,b\r\n'),
+        ('csv', ['name'], 'name\r\na\r\nb\r\n'),
+        ('sse', None, 'data: {"id": 1, "name": "a"}\n\ndata: {"id": 2, "name": "b"}\n\n'),
+    ))
+    async def test_stream_response(self, http_client, format, columns, body):
+        async def records():
+            for i, name in ((1, 'a'), (2, 'b')):
+                yield {'id': i, 'name': name}
+
+        async def handler(request):
+            return pillars.StreamResponse(status=200, records=records(), format=format, columns=columns)
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert response.content_type == pillars.transports.http.STREAM_CONTENT_TYPES[format]
+        assert await response.text() == body
+
+    @pytest.mark.asyncio
+    async def test_stream_events(self, http_client):
+        async def records():
+            yield pillars.ServerSentEvent(data='one\ntwo', event='lines', id='1')
+            yield []
+
+        async def handler(request):
+            return pillars.StreamResponse(status=200, records=records(), format='sse')
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert response.headers['Cache-Control'] == 'no-cache'
+        assert await response.text() == 'event: lines\nid: 1\ndata: one\ndata: two\n\ndata: []\n\n'
+
+    @pytest.mark.asyncio
+    async def test_stream_empty(self, http_client):
+        async def records():
+            return
+            yield
+
+        async def handler(request):
+            return pillars.StreamResponse(status=200, records=records(), format='json')
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert await response.json() == []
+
+    @pytest.mark.asyncio
+    async def test_stream_error(self, http_client):
+        async def records():
+            yield {'id': 1}
+            raise RuntimeError()
+
+        async def handler(request):
+            return pillars.StreamResponse(status=200, records=records(), format='json')
+
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        response = await client.get('/')
+        assert response.status == 200
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await response.read()
+
+    @pytest.mark.asyncio
+    async def test_stream_pg(self, http_client):
+        events = list()
+        connection = mock.Mock()
+        connection.execute = asynctest.CoroutineMock()
+        connection.is_in_transaction.return_value = False
+
+        @contextlib.asynccontextmanager
+        async def transaction():
+            events.append('begin')
+            yield
+            events.append('commit')
+
+        async def cursor(query, *args, prefetch):
+            events.append(('cursor', query, args, prefetch))
+            for i in range(3):
+                await asyncio.sleep(0.1)
+                yield (i, )
+
+        pool = mock.Mock()
+        pool.acquire = asynctest.CoroutineMock(return_value=connection)
+        pool.release = asynctest.CoroutineMock(side_effect=lambda connection: events.append('release'))
+        connection.transaction = transaction
+        connection.cursor = cursor
+
+        async def handler(request):
+            rows = pillars.engines.pg.stream_rows(request['pg_connection'], 'SELECT $1', 1, prefetch=2)
+            return pillars.StreamResponse(status=200, records=rows, format='csv')
+
+        # The stream outlasts the timeout of the route, bounding the acquisition
+        app = pillars.transports.http.Application()
+        app.router.add_route('GET', '/', handler, config=['pg'], timeout=0.1, middlewares=(pillars.middlewares.pg, ))
+        client = await http_client(app)
+        engine = pillars.engines.pg.PG(pillars.Application(name=''))
+        engine._supervisor.pool = asynctest.CoroutineMock(return_value=pool)
+        app.state['pg'] = engine
+
+        response = await client.get('/')
+        assert await response.text() == '0\r\n1\r\n2\r\n'
+        assert events == ['begin', ('cursor', 'SELECT $1', (1, ), 2), 'commit', 'release']
+        assert connection.execute.call_args[0][0].startswith('SET statement_timeout')
+
+    @pytest.mark.asyncio
+    async def test_response_cache(self, http_client):
+        calls = list()
+
+        async def handler(request):
+            calls.append(request.initial.query_string)
+            return pillars.Response(status=200, data={'calls': len(calls)})
+
+        cache = pillars.middlewares.http.ResponseCache(ttl=60)
+        app = pillars.transports.http.Application(middlewares=(cache.middleware, ))
+        app.router.add_route('GET', '/cached', handler, config=['cache'])
+        app.router.add_route('GET', '/other', handler)
+        client = await http_client(app)
+
+        response = await client.get('/cached')
+        etag = response.headers['ETag']
+        assert await response.json() == {'calls': 1}
+
+        response = await client.get('/cached')
+        assert response.headers['ETag'] == etag
+        assert await response.json() == {'calls': 1}
+
+        response = await client.get('/cached', headers={'If-None-Match': f'"other", W/{etag}'})
+        assert response.status == 304
+        assert await response.read() == b''
+
+        response = await client.get('/cached?page=2')
+        assert await response.json() == {'calls': 2}
+
+        await client.get('/other')
+        await client.get('/other')
+        assert calls == ['', 'page=2', '', '']
+        assert cache.metrics() == {'size': 2, 'bytes': 24, 'hits': 2, 'misses': 2}
+
+        cache.invalidate('/cached')
+        response = await client.get('/cached')
+        assert await response.json() == {'calls': 5}
+
+    @pytest.mark.asyncio
+    async def test_response_cache_bounds(self, http_client):
+        async def handler(request):
+            if request.initial.query.get('cookie'):
+                response = aiohttp.web.json_response({'path': request.path})
+                response.set_cookie('session', 'secret')
+                return response
+            if request.initial.query.get('cache_control'):
+                headers = {'Cache-Control': request.initial.query['cache_control']}
+                return aiohttp.web.json_response({'path': request.path}, headers=headers)
+            return pillars.Response(status=int(request.initial.query.get('status', 200)), data={'path': request.path})
+
+        cache = pillars.middlewares.http.ResponseCache(maxsize=40)
+        app = pillars.transports.http.Application(middlewares=(cache.middleware, ))
+        app.router.add_route('GET', '/{name}', handler, config=['cache'])
+        client = await http_client(app)
+
+        await client.get('/a')
+        await client.get('/b')
+        assert cache.metrics()['size'] == 2
+
+        await client.get('/c')
+        assert cache.metrics()['size'] == 2
+        assert [key[0] for key in cache._entries] == ['/b', '/c']
+
+        await client.get('/d?status=201')
+        await client.get('/e?cookie=1')
+        await client.get('/f?cache_control=private,%20max-age=60')
+        await client.get('/g?cache_control=no-store')
+        assert [key[0] for key in cache._entries] == ['/b', '/c']
+
+    @pytest.mark.asyncio
+    async def test_response_cache_headers(self, http_client):
+        async def handler(request):
+            headers = {'Cache-Control': 'max-age=60', 'Vary': 'Authorization'}
+            data = {'user': request.initial.headers.get('Authorization')}
+            return aiohttp.web.json_response(data, headers=headers)
+
+        cache = pillars.middlewares.http.ResponseCache()
+        app = pillars.transports.http.Application(middlewares=(cache.middleware, ))
+        app.router.add_route('GET', '/', handler, config=['cache'])
+        client = await http_client(app)
+
+        response = await client.get('/', headers={'Authorization': 'alice'})
+        assert await response.json() == {'user': 'alice'}
+        response = await client.get('/', headers={'Authorization': 'bob'})
+        assert await response.json() == {'user': 'bob'}
+
+        etag = response.headers['ETag']
+        response = await client.get('/', headers={'Authorization': 'bob', 'If-None-Match': etag})
+        assert response.status == 304
+        assert response.headers['ETag'] == etag
+        assert response.headers['Cache-Control'] == 'max-age=60'
+        assert response.headers['Vary'] == 'Authorization'
+
+    @pytest.mark.asyncio
+    async def test_coalesce(self, http_client):
+        calls = list()
+        release = asyncio.Event()
+
+        async def handler(request):
+            calls.append(request.path)
+            await release.wait()
+            if request.path == '/error':
+                raise RuntimeError()
+            return pillars.Response(status=200, data={'calls': len(calls)})
+
+        coalescer = pillars.middlewares.http.Coalescer()
+        app = pillars.transports.http.Application(
+            middlewares=(pillars.middlewares.http.exception_handler, coalescer.middleware)
+        )
+        app.router.add_route('GET', '/{name}', handler, config=['coalesce'])
+        client = await http_client(app)
+
+        requests = [asyncio.ensure_future(client.get(path)) for path in ('/a', '/a', '/a', '/error', '/error')]
+        await asyncio.sleep(0.1)
+        assert coalescer.metrics() == {'inflight': 2, 'handled': 2, 'coalesced': 3}
+        release.set()
+
+        responses = await asyncio.gather(*requests)
+        assert [response.status for response in responses] == [200, 200, 200, 500, 500]
+        assert [await response.json() for response in responses[:3]] == [{'calls': 2}] * 3
+        assert calls == ['/a', '/error']
+        assert coalescer.metrics()['inflight'] == 0
+
+        await client.get('/a')
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_compression(self, http_client):
+        async def handler(request):
+            return pillars.Response(status=200, data={'items': list(range(int(request.initial.query['size'])))})
+
+        compression = pillars.middlewares.http.Compression(threshold=100, executor_threshold=2000, encodings=('gzip', 'deflate'))
+        app = pillars.transports.http.Application(middlewares=(compression.middleware, ))
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        for size, accept, encoding in (
+            (10, 'gzip', None), (100, 'gzip', 'gzip'), (1000, 'deflate, gzip;q=0.5', 'deflate'),
+            (100, 'compress', None), (100, 'gzip;q=0, *', 'deflate'), (100, 'identity', None),
+        ):
+            response = await client.get('/', params={'size': size}, headers={'Accept-Encoding': accept})
+            assert response.headers.get('Content-Encoding') == encoding
+            assert await response.json() == {'items': list(range(size))}
+            if size >= 100:
+                assert response.headers['Vary'] == 'Accept-Encoding'
+
+        assert compression.metrics() == {'size': 0, 'bytes': 0, 'gzip': 1, 'deflate': 2}
+
+    @pytest.mark.asyncio
+    async def test_compression_cache(self, http_client):
+        calls = list()
+
+        async def handler(request):
+            calls.append(request.path)
+            return pillars.Response(status=200, data={'items': list(range(1000))})
+
+        compression = pillars.middlewares.http.Compression()
+        cache = pillars.middlewares.http.ResponseCache(vary=('Accept', ))
+        app = pillars.transports.http.Application(middlewares=(compression.middleware, cache.middleware))
+        app.router.add_route('GET', '/', handler, config=['cache'])
+        client = await http_client(app)
+
+        response = await client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        etag = response.headers['ETag']
+        assert etag.startswith('W/"')
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+        response = await client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['ETag'] == etag
+        assert await response.json() == {'items': list(range(1000))}
+
+        response = await client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert response.status == 304
+
+        response = await client.get('/', headers={'Accept-Encoding': 'identity'})
+        assert response.headers['ETag'] == etag[2:]
+        assert 'Content-Encoding' not in response.headers
+
+        assert calls == ['/']
+        assert compression.metrics()['gzip'] == 1
+        assert compression.metrics()['hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_compression_etag_per_resource(self, http_client):
+        async def handler(request):
+            response = aiohttp.web.json_response({'path': request.path, 'items': list(range(500))})
+            response.headers['ETag'] = '"v1"'
+            response.set_cookie('session', 'secret')
+            return response
+
+        compression = pillars.middlewares.http.Compression()
+        app = pillars.transports.http.Application(middlewares=(compression.middleware, ))
+        app.router.add_route('GET', '/{name}', handler)
+        client = await http_client(app)
+
+        for path in ('/users', '/orders', '/users'):
+            response = await client.get(path, headers={'Accept-Encoding': 'gzip'})
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert (await response.json())['path'] == path
+        assert compression.metrics()['hits'] == 1
+
+    def test_negotiate_encoding(self):
+        negotiate = pillars.middlewares.http.negotiate_encoding
+        assert negotiate('', ('gzip', 'deflate')) is None
+        assert negotiate('deflate, gzip', ('gzip', 'deflate')) == 'gzip'
+        assert negotiate('deflate;q=1.0, gzip;q=0.8', ('gzip', 'deflate')) == 'deflate'
+        assert negotiate('gzip;q=foo, deflate', ('gzip', 'deflate')) == 'deflate'
+        assert negotiate('*;q=0', ('gzip', 'deflate')) is None
+
+    def test_etag_matches(self):
+        assert pillars.middlewares.http.etag_matches('*', '"a"')
+        assert pillars.middlewares.http.etag_matches('"b", "a"', '"a"')
+        assert pillars.middlewares.http.etag_matches('W/"a"', '"a"')
+        assert not pillars.middlewares.http.etag_matches('"b"', '"a"')
+
+
+class FakeStreamConnection:
+    def __init__(self, replies):
+        self.replies = collections.deque(replies)
+        self.commands = list()
+        self.closed = False
+
+    async def execute(self, *args):
+        self.commands.append(args)
+        if args[0] == 'XREADGROUP':
+            if self.replies:
+                return self.replies.popleft()
+            await asyncio.sleep(3600)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeStreamRedis:
+    def __init__(self, connection, pending=()):
+        self.connection = connection
+        self.pending = list(pending)
+        self.commands = list()
+
+    async def create_connection(self):
+        return self.connection
+
+    async def execute(self, *args):
+        self.commands.append(args)
+        if args[0] == 'XPENDING':
+            return self.pending
+        elif args[0] == 'XCLAIM':
+            return [[id, [b'claimed', b'1']] for id in args[5:]]
+        return 1
+
+
+def stream_consumer(app, redis, **kwargs):
+    app.state = collections.ChainMap({}, {})
+    options = dict(
+        group='workers', consumer='c1', count=10, block=100, concurrency=10, ack_batch=100,
+        ack_interval=0.01, claim_interval=0, claim_idle=1000, max_deliveries=None,
+        reconnection_timeoff=1, reconnection_backoff=0.01, shutdown_timeout=1,
+    )
+    options.update(kwargs)
+    server = pillars.transports.redis_streams.StreamServer(app._handler, app.router)
+    return pillars.transports.redis_streams.StreamConsumer(server, redis, **options)
+
+
+class TestRedisStreams:
+
+    @pytest.mark.asyncio
+    async def test_consume(self):
+        received = list()
+
+        async def handler(request):
+            received.append((request.path, await request.data()))
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        connection = FakeStreamConnection([
+            [[b'jobs', []]],
+            [[b'jobs', [[b'1-0', [b'a', b'1']], [b'2-0', [b'a', b'2']]]]],
+        ])
+        redis = FakeStreamRedis(connection)
+        consumer = stream_consumer(app, redis)
+        consumer.start()
+        await asyncio.sleep(0.05)
+
+        assert received == [('jobs', {'a': '1'}), ('jobs', {'a': '2'})]
+        assert connection.commands[0] == ('XGROUP', 'CREATE', 'jobs', 'workers', '$', 'MKSTREAM')
+        assert connection.commands[1][-1] == '0'
+        assert connection.commands[2][-1] == '>'
+        assert redis.commands == [('XACK', 'jobs', 'workers', '1-0', '2-0')]
+
+        consumer.close()
+        await consumer.wait_closed()
+        assert connection.closed
+
+    @pytest.mark.asyncio
+    async def test_failed_entry_not_acked(self):
+        async def handler(request):
+            raise RuntimeError()
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        connection = FakeStreamConnection([[[b'jobs', [[b'1-0', [b'a', b'1']]]]]])
+        redis = FakeStreamRedis(connection)
+        consumer = stream_consumer(app, redis)
+        consumer.start()
+        await asyncio.sleep(0.05)
+        consumer.close()
+        await consumer.wait_closed()
+
+        assert redis.commands == []
+        assert consumer.metrics()['failed'] == 1
+
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self):
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        entries = [[f'{i}-0'.encode(), [b'a', b'1']] for i in range(2)]
+        connection = FakeStreamConnection([[[b'jobs', entries]], [[b'jobs', []]]])
+        consumer = stream_consumer(app, FakeStreamRedis(connection), concurrency=2)
+        consumer.start()
+        await asyncio.sleep(0.01)
+
+        assert consumer.metrics()['in_flight'] == 2
+        assert len([c for c in connection.commands if c[0] == 'XREADGROUP']) == 1
+
+        release.set()
+        await asyncio.sleep(0.01)
+        reads = [c for c in connection.commands if c[0] == 'XREADGROUP']
+        assert len(reads) == 3
+        assert reads[1][reads[1].index('COUNT') + 1] == 2
+
+        consumer.close()
+        await consumer.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_claim(self):
+        received = list()
+
+        async def handler(request):
+            received.append(request.initial.id)
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        redis = FakeStreamRedis(FakeStreamConnection([]), pending=[
+            [b'1-0', b'dead', 5000, 1],
+            [b'2-0', b'dead', 5000, 3],
+            [b'3-0', b'dead', 10, 1],
+            [b'4-0', b'c1', 5000, 1],
+        ])
+        consumer = stream_consumer(app, redis, max_deliveries=3)
+        await consumer._claim_stream('jobs')
+        await asyncio.sleep(0.05)
+
+        assert received == ['1-0', '4-0']
+        assert ('XCLAIM', 'jobs', 'workers', 'c1', 1000, b'1-0', b'4-0') in redis.commands
+        assert ('XACK', 'jobs', 'workers', '2-0', '1-0', '4-0') in redis.commands
+        assert consumer.metrics()['dropped'] == 1
+
+    @pytest.mark.asyncio
+    async def test_claim_skips_handling(self):
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        connection = FakeStreamConnection([[[b'jobs', [[b'1-0', [b'a', b'1']]]]]])
+        redis = FakeStreamRedis(connection, pending=[[b'1-0', b'c1', 5000, 1]])
+        consumer = stream_consumer(app, redis)
+        consumer.start()
+        await asyncio.sleep(0.01)
+        await consumer._claim_stream('jobs')
+
+        assert not [c for c in redis.commands if c[0] == 'XCLAIM']
+
+        release.set()
+        consumer.close()
+        await consumer.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_no_double_dispatch(self):
+        received = list()
+        release = asyncio.Event()
+
+        async def handler(request):
+            received.append(request.initial.id)
+            if request.initial.id == '1-0':
+                await release.wait()
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        entries = [[b'1-0', [b'a', b'1']], [b'2-0', [b'a', b'2']]]
+        connection = FakeStreamConnection([[[b'jobs', entries]], [[b'jobs', []]]])
+        redis = FakeStreamRedis(connection, pending=[[b'1-0', b'c1', 5000, 1], [b'2-0', b'c1', 5000, 1]])
+        consumer = stream_consumer(app, redis, ack_interval=10)
+        consumer.start()
+        await asyncio.sleep(0.01)
+        assert received == ['1-0', '2-0']
+
+        # Read again after a reconnection, one is handled and the other one not acknowledged yet
+        reader = asyncio.ensure_future(consumer._read_entries(FakeStreamConnection([[[b'jobs', entries]]])))
+        await consumer._claim_stream('jobs')
+        await asyncio.sleep(0.01)
+        reader.cancel()
+        assert received == ['1-0', '2-0']
+        assert not [c for c in redis.commands if c[0] == 'XCLAIM']
+
+        release.set()
+        consumer.close()
+        await consumer.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_claim_concurrency(self):
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        redis = FakeStreamRedis(FakeStreamConnection([]), pending=[
+            [b'1-0', b'dead', 5000, 1],
+            [b'2-0', b'dead', 5000, 1],
+        ])
+        consumer = stream_consumer(app, redis, concurrency=1)
+        claim = asyncio.ensure_future(consumer._claim_stream('jobs'))
+        await asyncio.sleep(0.01)
+        assert consumer.metrics()['in_flight'] == 1
+        assert not claim.done()
+
+        release.set()
+        await claim
+        await asyncio.sleep(0.01)
+        assert consumer.metrics()['claimed'] == 2
+        assert consumer.metrics()['handled'] == 2
+
+    @pytest.mark.asyncio
+    async def test_deleted_entry_acked(self):
+        received = list()
+
+        async def handler(request):
+            received.append(request.initial.id)
+
+        app = pillars.transports.redis_streams.Application()
+        app.router.add('jobs', handler)
+        connection = FakeStreamConnection([
+            [[b'jobs', [[b'1-0', None], [b'2-0', [b'a', b'1']]]]],
+            [[b'jobs', []]],
+        ])
+        redis = FakeStreamRedis(connection)
+        consumer = stream_consumer(app, redis)
+        consumer.start()
+        await asyncio.sleep(0.05)
+        consumer.close()
+        await consumer.wait_closed()
+
+        assert received == ['2-0']
+        assert redis.commands == [('XACK', 'jobs', 'workers', '1-0', '2-0')]
+        assert consumer.metrics()['deleted'] == 1
+
+    @pytest.mark.asyncio
+    async def test_deadline(self):
+        async def handler(request):
+            await asyncio.sleep(1)
+
+        app = pillars.transports.redis_streams.Application(timeout=0.01)
+        app.router.add('jobs', handler)
+        connection = FakeStreamConnection([[[b'jobs', [[b'1-0', [b'a', b'1']]]]]])
+        redis = FakeStreamRedis(connection)
+        consumer = stream_consumer(app, redis)
+        consumer.start()
+        await asyncio.sleep(0.05)
+        consumer.close()
+        await consumer.wait_closed()
+
+        assert redis.commands == []
+        assert consumer.metrics()['failed'] == 1
+
+
+class FakePubSubConnection:
+    def __init__(self):
+        self.senders = list()
+        self.closed = False
+
+    async def execute_pubsub(self, command, *channels):
+        self.senders.extend(channels)
+
+    def close(self):
+        self.closed = True
+        for sender in self.senders:
+            sender.close()
+
+
+class FakePubSubRedis:
+    def __init__(self):
+        self.connections = list()
+
+    async def create_connection(self):
+        self.connections.append(FakePubSubConnection())
+        return self.connections[-1]
+
+
+def subscriber(app, redis, **kwargs):
+    app.state = collections.ChainMap({}, {})
+    options = dict(
+        concurrency=10, reconnection_timeoff=1, reconnection_backoff=0.01, shutdown_timeout=1
+    )
+    options.update(kwargs)
+    server = pillars.transports.redis_pubsub.PubSubServer(app._handler, app.router)
+    return pillars.transports.redis_pubsub.Subscriber(server, redis, **options)
+
+
+class TestRedisPubSub:
+
+    @pytest.mark.asyncio
+    async def test_routing(self):
+        received = list()
+
+        async def handler(request):
+            received.append((request.path, request.initial.pattern, await request.data()))
+
+        app = pillars.transports.redis_pubsub.Application()
+        app.router.add('events', handler)
+        app.router.add('calls.*', handler, pattern=True)
+        redis = FakePubSubRedis()
+        consumer = subscriber(app, redis)
+        consumer.start()
+        await asyncio.sleep(0)
+
+        channel, pattern = redis.connections[0].senders
+        channel.put_nowait(b'{"a": 1}')
+        pattern.put_nowait((b'calls.1', b'{"b": 2}'))
+        await asyncio.sleep(0.01)
+
+        assert received == [('events', None, {'a': 1}), ('calls.1', 'calls.*', {'b': 2})]
+        assert consumer.metrics()['subscribed']
+
+        consumer.close()
+        await consumer.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_resubscribe(self):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.data())
+
+        app = pillars.transports.redis_pubsub.Application()
+        app.router.add('events', handler)
+        redis = FakePubSubRedis()
+        consumer = subscriber(app, redis)
+        consumer.start()
+        await asyncio.sleep(0)
+
+        redis.connections[0].close()
+        await asyncio.sleep(0.01)
+        assert len(redis.connections) == 2
+        assert consumer.metrics()['reconnections'] == 1
+
+        redis.connections[1].senders[0].put_nowait(b'1')
+        await asyncio.sleep(0.01)
+        assert received == [1]
+
+        consumer.close()
+        await consumer.wait_closed()
+
+
+class TestDatagram:
+
+    @pytest.mark.asyncio
+    async def test_batch_transport(self):
+        received = list()
+
+        class Protocol(asyncio.DatagramProtocol):
+            def datagrams_received(self, batch):
+                received.append([data for data, addr in batch])
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        transport = pillars.sites.datagram.BatchDatagramTransport(server, Protocol(), batch_size=3)
+        await asyncio.sleep(0)
+
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i in range(5):
+            client.sendto(str(i).encode(), server.getsockname())
+        await asyncio.sleep(0.05)
+
+        assert received == [[b'0', b'1', b'2'], [b'3', b'4']]
+        transport.close()
+        client.close()
+
+    @pytest.mark.asyncio
+    async def test_syslog_max_batches(self):
+        release = asyncio.Event()
+        received = list()
+
+        class Application(pillars.transports.syslog.Application):
+            async def _handler(self, data, addr):
+                await release.wait()
+                received.append(data)
+
+        runner = pillars.transports.syslog.AppRunner(Application(), max_batches=2)
+        await runner.setup()
+        site = pillars.sites.UDPSite(runner, '127.0.0.1', 0, batch_size=2)
+        await site.start()
+        transport = site._server.transport
+        await asyncio.sleep(0)
+
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i in range(6):
+            client.sendto(str(i).encode(), transport.get_extra_info('sockname'))
+            await asyncio.sleep(0.01)
+
+        assert not transport.is_reading()
+        release.set()
+        await asyncio.sleep(0.05)
+        assert transport.is_reading()
+        assert sorted(received) == [str(i).encode() for i in range(6)]
+
+        client.close()
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_socket_options(self):
+        runner = pillars.transports.syslog.AppRunner(pillars.transports.syslog.Application())
+        await runner.setup()
+        site = pillars.sites.UDPSite(runner, '127.0.0.1', 0, rcvbuf=65536, sockets=2)
+        await site.start()
+
+        metrics = site.metrics()
+        assert len(metrics['sockets']) == 2
+        assert metrics['sockets'][0]['rcvbuf'] >= 65536
+        ports = {t.get_extra_info('sockname')[1] for t in site._server.transports}
+        assert len(ports) == 1
+        assert await site.status()
+
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(not sys.platform.startswith('linux'), reason='Linux only')
+    async def test_drops(self):
+        received = list()
+
+        class Protocol(asyncio.DatagramProtocol):
+            def datagrams_received(self, batch):
+                received.extend(batch)
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        transport = pillars.sites.datagram.BatchDatagramTransport(
+            server, Protocol(), batch_size=1000, track_drops=True
+        )
+        await asyncio.sleep(0)
+
+        # Overflow the receive buffer before the loop reads it
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i in range(200):
+            client.sendto(b'x' * 512, server.getsockname())
+        await asyncio.sleep(0.05)
+        client.sendto(b'x', server.getsockname())
+        await asyncio.sleep(0.05)
+
+        metrics = transport.metrics()
+        assert metrics['drops'] > 0
+        assert metrics['received'] + metrics['drops'] == 201
+
+        transport.close()
+        client.close()
+
+
+class CountingRunner(pillars.base.BaseRunner):
+
+    def __init__(self):
+        super().__init__()
+        self.connections = list()
+
+    async def shutdown(self):
+        pass
+
+    async def _make_server(self):
+        runner = self
+
+        class Protocol(asyncio.Protocol):
+            def connection_made(self, transport):
+                runner.connections.append(transport)
+
+        server = mock.Mock(side_effect=Protocol)
+        server.shutdown = asynctest.CoroutineMock()
+        return server
+
+    async def _cleanup_server(self):
+        pass
+
+
+class TestConnectionLimits:
+
+    @pytest.mark.asyncio
+    async def test_pause_accept(self):
+        runner = CountingRunner()
+        await runner.setup()
+        site = pillars.base.TCPSite(runner, '127.0.0.1', 0, max_connections=2, low_water=1)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        clients = [await asyncio.open_connection('127.0.0.1', port) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert len(runner.connections) == 2
+        assert site.metrics()['paused']
+        assert runner.addresses == [('127.0.0.1', port)]
+
+        runner.connections[0].close()
+        await asyncio.sleep(0.05)
+        assert len(runner.connections) == 3
+        assert site.metrics()['connections'] == 2
+        assert site.metrics()['pauses'] == 2
+
+        for reader, writer in clients:
+            writer.close()
+        await runner.cleanup()
+        with pytest.raises(OSError):
+            await asyncio.open_connection('127.0.0.1', port)
+
+    @pytest.mark.asyncio
+    async def test_pause_accept_unix(self, tmp_path):
+        runner = CountingRunner()
+        await runner.setup()
+        path = str(tmp_path / 'site.sock')
+        site = pillars.base.UnixSite(runner, path, max_connections=1, low_water=0)
+        await site.start()
+
+        clients = [await asyncio.open_unix_connection(path) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert len(runner.connections) == 1
+
+        runner.connections[0].close()
+        await asyncio.sleep(0.05)
+        assert len(runner.connections) == 2
+        assert site.metrics()['pauses'] == 2
+
+        for reader, writer in clients:
+            writer.close()
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_per_peer(self):
+        runner = CountingRunner()
+        await runner.setup()
+        site = pillars.base.TCPSite(runner, '127.0.0.1', 0, max_per_peer=1)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        clients = [await asyncio.open_connection('127.0.0.1', port) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert len(runner.connections) == 1
+        assert site.metrics()['rejected_per_peer'] == 1
+        assert await clients[1][0].read() == b''
+
+        for reader, writer in clients:
+            writer.close()
+        await runner.cleanup()
+
+
+class TestLoopback:
+
+    @pytest.mark.asyncio
+    async def test_fast_agi(self):
+        results = list()
+
+        async def handler(request):
+            results.append(await request.initial.send_command('ANSWER'))
+
+        app = pillars.transports.fast_agi.Application(middlewares=(pillars.transports.fast_agi.middleware, ))
+        app.state = collections.ChainMap({}, {})
+        app.routes['test'] = handler
+        runner = pillars.transports.fast_agi.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.LoopbackSite(runner)
+        await site.start()
+
+        reader, writer = await site.open_connection()
+        writer.write(b'agi_network_script: test\nagi_channel: SIP/1\n\n')
+        assert await reader.readline() == b'ANSWER\n'
+        writer.write(b'200 result=0\n')
+        assert await reader.read() == b''
+        assert results[0]['result'] == ('0', '')
+
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_syslog(self):
+        received = list()
+
+        class Application(pillars.transports.syslog.Application):
+            async def _handler(self, data, addr):
+                received.append(data)
+
+        runner = pillars.transports.syslog.AppRunner(Application())
+        await runner.setup()
+        site = pillars.sites.DatagramLoopbackSite(runner, batch_size=2)
+        await site.start()
+
+        transport = site.connect()
+        for i in range(3):
+            transport.sendto(str(i).encode())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert received == [b'0', b'1', b'2']
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_ari(self):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.data())
+
+        app = pillars.transports.ari.Application({})
+        app.state = collections.ChainMap({}, {})
+        app.router.add('stasisstart', handler)
+        runner = pillars.transports.ari.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.WSLoopbackSite(runner)
+        await site.start()
+
+        site.send_json({'type': 'StasisStart', 'channel': {'id': '1'}})
+        await asyncio.sleep(0.01)
+
+        assert received == [{'type': 'StasisStart', 'channel': {'id': '1'}}]
+        assert await site.status()
+        await runner.cleanup()
+        assert not await site.status()
+
+    @pytest.mark.asyncio
+    async def test_ari_flow_control(self):
+        received = list()
+        release = asyncio.Event()
+
+        async def handler(request):
+            received.append(await request.data())
+            await release.wait()
+
+        app = pillars.transports.ari.Application({})
+        app.state = collections.ChainMap({}, {})
+        app.router.add('stasisstart', handler)
+        runner = pillars.transports.ari.AppRunner(app, high_water=2, low_water=0)
+        await runner.setup()
+        site = pillars.sites.WSLoopbackSite(runner)
+        await site.start()
+
+        for i in range(4):
+            site.send_json({'type': 'StasisStart', 'channel': {'id': str(i)}})
+        site.send_bytes(b'{"type": "StasisStart", "channel": {"id": "4"}}')
+        await asyncio.sleep(0.01)
+
+        assert len(received) == 2
+        assert not site._transport.is_reading()
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert [event['channel']['id'] for event in received] == ['0', '1', '2', '3', '4']
+        assert site._transport.is_reading()
+        await runner.cleanup()
+
+
+class TestAdmission:
+
+    def test_token_bucket(self):
+        bucket = pillars.middlewares.admission.TokenBucket(rate=2, burst=2, now=0)
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 0.5
+        assert bucket.take(0.25) == 0.25
+        assert bucket.take(0.5) == 0
+
+    @pytest.mark.asyncio
+    async def test_http(self, http_client):
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return pillars.Response(status=200, data={})
+
+        controller = pillars.middlewares.admission.AdmissionController(
+            pillars.Application(name=''), rate=1, concurrency=1
+        )
+        app = pillars.transports.http.Application(
+            middlewares=(pillars.middlewares.http.exception_handler, controller.middleware)
+        )
+        app.router.add_route('GET', '/', handler)
+        client = await http_client(app)
+
+        first = asyncio.ensure_future(client.get('/'))
+        await asyncio.sleep(0.05)
+        response = await client.get('/')
+        assert response.status == 503
+        assert await response.json() == {'errors': ['too many concurrent requests']}
+
+        release.set()
+        assert (await first).status == 200
+        response = await client.get('/')
+        assert response.status == 503
+        assert response.headers['Retry-After'] == '1'
+        assert await response.json() == {'errors': ['rate limit exceeded']}
+        assert controller.metrics() == {
+            'pending': 0, 'lag': 0.0, 'admitted': 1, 'too many concurrent requests': 1, 'rate limit exceeded': 1
+        }
+
+    @pytest.mark.asyncio
+    async def test_shedding(self):
+        app = pillars.Application(name='')
+        controller = pillars.middlewares.admission.AdmissionController(app, max_lag=0.05, max_pending=1)
+        handler = asynctest.CoroutineMock(return_value='ok')
+        request = mock.Mock(route='/', config=[])
+        critical = mock.Mock(route='/', config=['critical'])
+
+        await controller._startup(app)
+        time.sleep(0.2)
+        await asyncio.sleep(0.01)
+        assert controller.lag >= 0.05
+        with pytest.raises(pillars.exceptions.Overloaded):
+            await controller.middleware(request, handler)
+        assert await controller.middleware(critical, handler) == 'ok'
+
+        await asyncio.sleep(0.15)
+        assert controller.lag < 0.05
+        assert await controller.middleware(request, handler) == 'ok'
+
+        controller._pending = 1
+        with pytest.raises(pillars.exceptions.Overloaded) as e:
+            await controller.middleware(request, handler)
+        assert e.value.reason == 'too many pending requests'
+        await controller._shutdown(app)
+
+    @pytest.mark.asyncio
+    async def test_fast_agi(self):
+        handler = asynctest.CoroutineMock()
+        controller = pillars.middlewares.admission.AdmissionController(pillars.Application(name=''), concurrency=0)
+        app = pillars.transports.fast_agi.Application(
+            middlewares=(pillars.transports.fast_agi.middleware, controller.middleware)
+        )
+        app.state = collections.ChainMap({}, {})
+        app.routes['test'] = handler
+        runner = pillars.transports.fast_agi.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.LoopbackSite(runner)
+        await site.start()
+
+        reader, writer = await site.open_connection()
+        writer.write(b'agi_network_script: test\nagi_channel: SIP/1\n\n')
+        assert await reader.readline() == b'HANGUP\n'
+        writer.write(b'200 result=1\n')
+        assert await reader.read() == b''
+        assert not handler.called
+
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_ari(self):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.data())
+
+        controller = pillars.middlewares.admission.AdmissionController(
+            pillars.Application(name=''), rate=1, key=lambda request: request.initial.data['channel']['id']
+        )
+        app = pillars.transports.ari.Application({}, middlewares=(controller.middleware, ))
+        app.state = collections.ChainMap({}, {})
+        app.router.add('stasisstart', handler)
+        runner = pillars.transports.ari.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.WSLoopbackSite(runner)
+        await site.start()
+
+        for channel in ('1', '1', '2'):
+            site.send_json({'type': 'StasisStart', 'channel': {'id': channel}})
+        await asyncio.sleep(0.01)
+
+        assert [event['channel']['id'] for event in received] == ['1', '2']
+        await runner.cleanup()
+
+@pytest.fixture
+async def ws_server():
+    runners = list()
+
+    async def factory(app, **kwargs):
+        app.state = collections.ChainMap({}, {})
+        runner = pillars.transports.websocket.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.WSServerSite(runner, '127.0.0.1', 0, path='/ws', **kwargs)
+        await site.start()
+        runners.append(runner)
+        port = site._server.sockets[0].getsockname()[1]
+        return site, f'http://127.0.0.1:{port}/ws'
+
+    yield factory
+
+    for runner in runners:
+        await runner.cleanup()
+
+
+class TestWebsocketServer:
+
+    def test_encode_frame(self):
+        assert pillars.sites.websocket.encode_frame('hi') == b'\x81\x02hi'
+        assert pillars.sites.websocket.encode_frame(b'x' * 200)[:4] == b'\x82\x7e\x00\xc8'
+        assert pillars.sites.websocket.encode_frame(b'x' * 70000)[:10] == b'\x82\x7f' + (70000).to_bytes(8, 'big')
+
+    @pytest.mark.asyncio
+    async def test_publish(self, ws_server):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.data())
+            request.send({'ack': True})
+
+        app = pillars.transports.websocket.Application()
+        app.router.add('Hello', handler)
+        site, url = await ws_server(app)
+
+        async with aiohttp.ClientSession() as session:
+            clients = [await session.ws_connect(url) for _ in range(3)]
+            for client in clients[:2]:
+                await client.send_json({'type': 'subscribe', 'topic': 'calls'})
+            await clients[2].send_json({'type': 'hello'})
+            assert await clients[2].receive_json() == {'ack': True}
+            assert received == [{'type': 'hello'}]
+
+            assert app.subscribers('calls') == 2
+            assert app.publish('calls', {'id': 1}) == 2
+            for client in clients[:2]:
+                assert await client.receive_json() == {'id': 1}
+
+            assert site.metrics()['connections'] == 3
+            await clients[0].close()
+            await asyncio.sleep(0.01)
+            assert app.subscribers('calls') == 1
+            for client in clients[1:]:
+                await client.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer(self, ws_server):
+        app = pillars.transports.websocket.Application()
+        site, url = await ws_server(app, max_queue=0, slow_policy='disconnect')
+
+        async with aiohttp.ClientSession() as session:
+            client = await session.ws_connect(url)
+            await client.send_json({'type': 'subscribe', 'topic': 'calls'})
+            await asyncio.sleep(0.01)
+
+            connection = next(iter(site._transports))
+            connection._transport = mock.Mock(wraps=connection._transport)
+            connection._transport.get_write_buffer_size.return_value = 10
+            assert app.publish('calls', 'x') == 0
+            assert site.metrics()['disconnected'] == 1
+            await client.close()
+
+    @pytest.mark.asyncio
+    async def test_pause_reading(self, ws_server):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.data())
+
+        app = pillars.transports.websocket.Application()
+        app.router.add('hello', handler)
+        site, url = await ws_server(app)
+
+        async with aiohttp.ClientSession() as session:
+            client = await session.ws_connect(url)
+            await asyncio.sleep(0.01)
+            connection = next(iter(site._transports))
+            connection.pause_reading()
+
+            await client.send_bytes(b'{"type": "hello"}')
+            await asyncio.sleep(0.01)
+            assert received == []
+
+            connection.resume_reading()
+            await asyncio.sleep(0.01)
+            assert received == [{'type': 'hello'}]
+            await client.close()
+
+    def test_invalid_policy(self):
+        runner = mock.Mock()
+        with pytest.raises(ValueError):
+            pillars.sites.WSServerSite(runner, slow_policy='block')
+
+
+@pytest.fixture
+async def ws_client():
+    runners = list()
+
+    async def factory(url, **kwargs):
+        app = pillars.transports.ari.Application({})
+        app.state = collections.ChainMap({}, {})
+        runner = pillars.transports.ari.AppRunner(app)
+        await runner.setup()
+        site = pillars.sites.WSClientSite(runner, url, backoff_base=0.01, **kwargs)
+        await site.start()
+        runners.append(runner)
+        return site
+
+    yield factory
+
+    for runner in runners:
+        await runner.cleanup()
+
+
+class TestWSClientSite:
+
+    @pytest.mark.asyncio
+    async def test_reconnect(self, ws_server, ws_client):
+        server, url = await ws_server(pillars.transports.websocket.Application())
+        on_connection = asynctest.CoroutineMock()
+        client = await ws_client(url, on_connection=on_connection)
+        await asyncio.sleep(0.05)
+
+        assert client.state is pillars.sites.websocket.WSClientState.CONNECTED
+        assert on_connection.call_count == 1
+
+        for connection in list(server._transports):
+            connection.close()
+        await asyncio.sleep(0.1)
+
+        assert client.state is pillars.sites.websocket.WSClientState.CONNECTED
+        assert on_connection.call_count == 2
+        metrics = client.metrics()
+        assert metrics['connections'] == 2
+        assert metrics['disconnections'] == 1
+
+    @pytest.mark.asyncio
+    async def test_max_retries(self, ws_client):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        client = await ws_client(f'http://127.0.0.1:{port}/', max_retries=2)
+        await asyncio.sleep(0.2)
+
+        assert client.state is pillars.sites.websocket.WSClientState.FAILED
+        assert client.metrics()['failures'] == 3
+        assert not await client.status()
@@ -0,0 +1,102 @@
+import collections
+import cerberus
+import pytest
+import pillars
+
+
+SCHEMA = {
+    'name': {'type': 'string', 'required': True, 'empty': False, 'maxlength': 8},
+    'state': {'type': 'string', 'allowed': ['Up', 'Down'], 'nullable': True},
+    'priority': {'type': 'integer', 'min': 0, 'max': 10, 'coerce': int, 'default': 5},
+    'number': {'type': 'string', 'regex': r'\+?[0-9]+'},
+    'caller': {
+        'type': 'dict',
+        'schema': {
+            'name': {'type': 'string', 'readonly': True},
+            'age': {'type': 'integer', 'coerce': int},
+        },
+    },
+    'tags': {'type': 'list', 'schema': {'type': 'string', 'minlength': 2}},
+}
+
+DOCUMENTS = (
+    {'name': 'alice', 'priority': '3', 'tags': ['aa', 'bb']},
+    {'name': '', 'state': None, 'number': '+32abc'},
+    {'name': 'x' * 10, 'state': 'Ringing', 'priority': 'high', 'extra': 1},
+    {'name': 'bob', 'priority': 20, 'caller': {'name': 'bob', 'age': 'old'}},
+    {'state': 1, 'caller': [], 'tags': ['a', 1, None]},
+    {'name': 'carol', 'caller': {'age': '42', 'unknown': True}},
+)
+
+
+def expected(validator, document):
+    if validator.validate(document):
+        return validator.document
+    return validator.errors
+
+
+def result(validator, document):
+    try:
+        return validator.validate(document)
+    except pillars.exceptions.DataValidationError as e:
+        return e.errors
+
+
+class TestValidator:
+
+    @pytest.mark.parametrize('document', DOCUMENTS)
+    def test_cerberus_semantics(self, document):
+        validator = pillars.validation.Validator(SCHEMA)
+        assert validator.compiled
+        assert result(validator, document) == expected(cerberus.Validator(SCHEMA), document)
+
+    def test_normalized_copy(self):
+        document = {'name': 'alice', 'priority': '3'}
+        validator = pillars.validation.Validator(SCHEMA)
+        assert validator.validate(document) == {'name': 'alice', 'priority': 3}
+        assert document == {'name': 'alice', 'priority': '3'}
+
+    def test_allow_unknown(self):
+        validator = pillars.validation.Validator({'a': {'type': 'integer'}}, allow_unknown=True)
+        assert validator.validate({'a': 1, 'b': 2}) == {'a': 1, 'b': 2}
+
+    def test_fallback(self):
+        schema = {'a': {'type': 'integer', 'anyof': [{'min': 5}, {'max': 0}]}}
+        validator = pillars.validation.Validator(schema)
+        assert not validator.compiled
+        assert validator.validate({'a': 6}) == {'a': 6}
+        with pytest.raises(pillars.exceptions.DataValidationError) as e:
+            validator.validate({'a': 2})
+        assert e.value.errors == expected(cerberus.Validator(schema), {'a': 2})
+
+    def test_invalid_schema(self):
+        with pytest.raises(cerberus.SchemaError):
+            pillars.validation.Validator({'a': {'type': 'integer', 'min': 'zero', 'unknown': 1}})
+
+
+class TestTransports:
+
+    @pytest.mark.asyncio
+    async def test_ari(self):
+        app = pillars.transports.ari.Application({})
+        app.state = collections.ChainMap({}, {})
+        app.router.add('stasisstart', None, data_schema={'channel': {'type': 'dict', 'required': True}})
+        event = pillars.transports.ari.Event(app=app, config=None, data={'type': 'StasisStart'})
+        request = pillars.transports.ari.AriRequest(event)
+
+        assert await request.data() == {'type': 'StasisStart'}
+        with pytest.raises(pillars.exceptions.DataValidationError) as e:
+            await request.data(validate=True)
+        assert e.value.errors == {'channel': ['required field']}
+
+    @pytest.mark.asyncio
+    async def test_fast_agi(self):
+        app = pillars.transports.fast_agi.Application()
+        app.state = collections.ChainMap({}, {})
+        app.add_route('test', None, data_schema={'agi_priority': {'type': 'integer', 'coerce': int}})
+        request = pillars.transports.fast_agi.Request(transport=None)
+        request.app = app
+        request.update({'agi_network_script': 'test', 'agi_priority': '1'})
+
+        data = await pillars.transports.fast_agi.FastAGIRequest(request).data(validate=True)
+        assert data == {'agi_network_script': 'test', 'agi_priority': 1}